@@ -0,0 +1,186 @@
+"""
+The ``Battery_Funcs`` module contains a battery storage model that absorbs
+excess solar energy and discharges in to time-of-use peak periods. The
+dispatch steps through time once and is vectorised over any number of
+battery sizes and buildings, so sizing sweeps run as one batch.
+"""
+
+import numpy as np
+import Tariff_Funcs as tf
+
+def Dispatch(load, solar, tStamp, capacity, charge_kw, discharge_kw,
+             efficiency=0.9, soc_min=0.1, soc_start=0.5,
+             discharge_periods=(tf.PEAK,), grid_charge_periods=(),
+             grid_charge_target=1.0, rates=None, traces=False):
+    '''
+    Dispatch batteries against load and solar energy.
+
+    Rules, per slot:
+     - excess solar charges the battery (limited by charge_kw and capacity),
+     - in discharge_periods the battery supplies the load still left after
+       solar (limited by discharge_kw and soc_min),
+     - in grid_charge_periods the battery charges from the grid up to
+       grid_charge_target.
+
+    Battery parameters may be scalars or arrays; they are broadcast with the
+    leading (batch) axes of load and solar, e.g. capacity of shape (sizes, 1)
+    against load of shape (buildings, days, slots) gives results of shape
+    (sizes, buildings).
+
+    Args:
+        load (array[...,days,slots]):
+            Energy consumption per slot (kWh).
+        solar (array[...,days,slots]):
+            Solar energy per slot (kWh).
+        tStamp (array[days,slots]):
+            Timestamps, for the TOU periods and rates.
+        capacity (float or array):
+            Usable capacity (kWh).
+        charge_kw, discharge_kw (float or array):
+            Charge and discharge power limits (kW).
+        efficiency (float or array):
+            Round-trip efficiency (split equally between charge and
+            discharge).
+        soc_min (float or array):
+            Lowest state of charge as a fraction of capacity.
+        soc_start (float or array):
+            State of charge at the start, as a fraction of capacity.
+        discharge_periods (tuple):
+            TOU periods in which the battery may discharge.
+        grid_charge_periods (tuple):
+            TOU periods in which the battery may charge from the grid.
+        grid_charge_target (float or array):
+            State of charge (fraction) to charge to from the grid.
+        rates (dict):
+            TOU rates (see "Tariff_Funcs.SlotRates"); None leaves out 'cost'.
+        traces (bool):
+            Also return grid energy and state of charge per slot.
+
+    Returns:
+        results (dict):
+            'grid_by_period' (array[...,3]) grid energy per TOU period (kWh),
+            'cost' (array[...]) energy cost of grid imports (R, with rates),
+            'spilled' (array[...]) solar energy not used or stored (kWh),
+            'discharged' (array[...]) energy supplied by the battery (kWh),
+            'grid_charged' (array[...]) energy drawn from the grid to charge
+            (kWh), and if traces: 'grid' and 'soc' (array[...,days,slots]).
+    '''
+    load = np.asarray(load, dtype=float)
+    solar = np.asarray(solar, dtype=float)
+    shape = np.shape(tStamp)
+    T = shape[0]*shape[1]
+    slot_hours = 24/shape[1]
+
+    periods, high = tf.TOUPeriods(tStamp)
+    periods = periods.ravel()
+    slotRates = tf.SlotRates(tStamp, rates).ravel() if rates is not None else np.zeros(T)
+    canDischarge = np.isin(periods, discharge_periods)
+    canGridCharge = np.isin(periods, grid_charge_periods)
+
+    # Net load and excess solar with time as the last axis
+    deficit = np.maximum(load - solar, 0)
+    excess = np.maximum(solar - load, 0)
+    deficit = deficit.reshape(deficit.shape[:-2] + (T,))
+    excess = excess.reshape(excess.shape[:-2] + (T,))
+
+    capacity = np.asarray(capacity, dtype=float)
+    eta = np.sqrt(np.asarray(efficiency, dtype=float))
+    maxCharge = np.asarray(charge_kw, dtype=float)*slot_hours
+    maxDischarge = np.asarray(discharge_kw, dtype=float)*slot_hours
+    socFloor = np.asarray(soc_min, dtype=float)*capacity
+    gridTarget = np.asarray(grid_charge_target, dtype=float)*capacity
+
+    batch = np.broadcast_shapes(deficit.shape[:-1], capacity.shape, eta.shape,
+                                maxCharge.shape, maxDischarge.shape,
+                                socFloor.shape, gridTarget.shape,
+                                np.shape(soc_start))
+    socStart = np.broadcast_to(np.asarray(soc_start, dtype=float)*capacity, batch)
+    soc = socStart.copy()
+
+    # Start from the grid energy without a battery, then step only through
+    # slots where the battery can act (excess solar, discharge or grid charge)
+    gridByPeriod = np.zeros(batch + (3,))
+    for p in range(3):
+        gridByPeriod[..., p] = deficit[..., periods == p].sum(axis=-1)
+    cost = np.broadcast_to(deficit @ slotRates, batch).copy()
+    spilled = np.zeros(batch)
+    discharged = np.zeros(batch)
+    gridCharged = np.zeros(batch)
+
+    active = canDischarge | canGridCharge | (excess.reshape(-1, T) > 0).any(axis=0)
+    activeSteps = np.flatnonzero(active)
+    if(traces):
+        gridTrace = np.broadcast_to(deficit, batch + (T,)).copy()
+        socActive = np.empty(batch + (activeSteps.size,))
+
+    for k, t in enumerate(activeSteps):
+        # Excess solar in to the battery
+        charge = np.minimum(np.minimum(excess[..., t], maxCharge), (capacity - soc)/eta)
+        soc += charge*eta
+        spilled += excess[..., t] - charge
+        change = np.zeros(batch)
+
+        if(canGridCharge[t]):
+            fromGrid = np.minimum(np.maximum(maxCharge - charge, 0),
+                                  np.maximum(gridTarget - soc, 0)/eta)
+            soc += fromGrid*eta
+            change += fromGrid
+            gridCharged += fromGrid
+
+        if(canDischarge[t]):
+            supply = np.minimum(np.minimum(deficit[..., t], maxDischarge),
+                                np.maximum(soc - socFloor, 0)*eta)
+            soc -= supply/eta
+            change -= supply
+            discharged += supply
+
+        gridByPeriod[..., periods[t]] += change
+        cost += change*slotRates[t]
+        if(traces):
+            gridTrace[..., t] += change
+            socActive[..., k] = soc
+
+    results = {'grid_by_period': gridByPeriod, 'spilled': spilled,
+               'discharged': discharged, 'grid_charged': gridCharged}
+    if(rates is not None):
+        results['cost'] = cost
+    if(traces):
+        # State of charge only changes in active slots, so carry it forward
+        lastActive = np.maximum.accumulate(np.where(active, np.cumsum(active) - 1, -1))
+        socActive = np.concatenate((socStart[..., None], socActive), axis=-1)
+        socTrace = socActive[..., lastActive + 1]
+        results['grid'] = gridTrace.reshape(batch + shape)
+        results['soc'] = socTrace.reshape(batch + shape)
+    return results
+
+class SolarBattery:
+    '''
+    Solar supply with battery storage, as an intervention for
+    "Intervention_Funcs.ApplyInterventions" (in place of SolarOffset).
+
+    Args:
+        solar (array[days,slots]):
+            Solar energy per slot (kWh).
+        tStamp (array[days,slots]):
+            Timestamps of the energy.
+        **battery:
+            Battery parameters for "Dispatch" (capacity, charge_kw,
+            discharge_kw, ...). Must be scalars.
+    '''
+
+    def __init__(self, solar, tStamp, **battery):
+        self.solar = solar
+        self.tStamp = tStamp
+        self.battery = battery
+
+    def apply(self, energy):
+        '''
+        Replace energy by the grid energy with solar and battery, in place.
+
+        Returns:
+            results (dict):
+                Output of "Dispatch" (with traces).
+        '''
+        results = Dispatch(energy, self.solar, self.tStamp, traces=True, **self.battery)
+        energy[...] = results['grid']
+        return results
@@ -0,0 +1,224 @@
+"""
+The ``Calibrate_Funcs`` module contains a batched calibration of the
+single-node geyser model (``ewhModel_one`` equations) against measured
+outlet temperatures. Thermal resistance, effective volume and ambient
+temperature are fitted per tank by least squares, with all tanks and days
+simulated together, so thousands of geysers are calibrated in one run.
+"""
+
+import numpy as np
+import gModels as Geyser
+
+# Values used by "SetupGeyser": thermal resistance, volume (litres), ambient (C)
+DEFAULT_GUESS = (1/1.429756, 150, 26)
+PARAM_NAMES = ('R', 'volume', 't_amb')
+
+# Finite difference steps for log(R), log(volume) and ambient temperature
+FD_STEPS = np.array([1e-4, 1e-4, 1e-3])
+
+def _Steps(params, volume, t_start, power, t_inlet, step_sec, rating, set_temp):
+    '''
+    Step batched geysers through the minutes of every day, yielding the
+    temperature after each step (draw, heating, decay) and the element power
+    (kW) in the step, from the second step on.
+
+    params has shape (..., tanks, 3); volume and power (..., tanks, days,
+    steps) and t_start (tanks, days). Days are independent: each starts from
+    t_start.
+    '''
+    gModel = Geyser.ewhModel_batch(params[..., 0, None], params[..., 1, None], t_start)
+    gModel.setAmbTemp(params[..., 2, None])
+    gModel.setInletTemp(t_inlet)
+    decay = gModel.decayFactor(step_sec)
+    HIGH_RAIL = set_temp+2
+    LOW_RAIL = set_temp-2
+
+    for j in range(1, volume.shape[-1]):
+        gModel.stepVolume(volume[..., j])
+        if(power is None): # thermostat, as in "Simulator"
+            currTemp = gModel.getOutletTemp()
+            gModel.GeyserOn = np.where(currTemp >= HIGH_RAIL, False,
+                                       np.where(currTemp <= LOW_RAIL, True, gModel.GeyserOn))
+            element = rating*gModel.GeyserOn
+        else:
+            element = power[..., j]
+        gModel.stepTime(step_sec, element, decay)
+        yield j, gModel.getOutletTemp(), element
+
+def SimulateTemps(params, volume, t_start, power=None, t_inlet=18, step_sec=60,
+                  rating=2, set_temp=70):
+    '''
+    Simulate outlet temperatures for many tanks and days at once.
+
+    Args:
+        params (array[tanks,3]):
+            R, effective volume (litres) and ambient temperature per tank.
+        volume (array[tanks,days,steps]):
+            Water drawn per step (litres).
+        t_start (array[tanks,days]):
+            Temperature at the start of every day.
+        power (array[tanks,days,steps]):
+            Element power per step (kW). None for a thermostat controlled
+            element (rating kW, set_temp +-2 C), as in "Simulator".
+        t_inlet (float or array[tanks,1]):
+            Inlet water temperature.
+        step_sec (int):
+            Length of a step in seconds.
+
+    Returns:
+        temp (array[tanks,days,steps]):
+            Temperature at the end of every step (index 0 is t_start).
+    '''
+    params = np.asarray(params, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+    temp = np.empty(np.broadcast_shapes(params.shape[:-1] + (1, 1), volume.shape))
+    temp[..., 0] = t_start
+    for j, t, element in _Steps(params, volume, t_start, power, t_inlet, step_sec, rating, set_temp):
+        temp[..., j] = t
+    return temp
+
+def SimulateEnergy(params, volume, t_start, t_inlet=18, step_sec=60, rating=2,
+                   set_temp=70, bins=None, nbins=None):
+    '''
+    Element energy of many thermostat controlled tanks at once (as
+    "SimulateTemps" with power None).
+
+    Args:
+        params (array[tanks,3]):
+            R, effective volume (litres) and ambient temperature per tank.
+        volume (array[tanks,days,steps]):
+            Water drawn per step (litres); use a single day of all steps
+            (array[tanks,1,steps]) for a continuous run.
+        t_start (array[tanks,days]):
+            Temperature at the start of every day.
+        rating, set_temp (float or array[tanks,1]):
+            Element rating (kW) and thermostat set point (C) per tank.
+        bins (array[steps]):
+            Bin (e.g. month and TOU period) of every step. If given, energy is
+            totalled per bin instead of returned per step.
+        nbins (int):
+            Number of bins (default bins.max() + 1).
+
+    Returns:
+        energy (array[tanks,days,steps] or array[tanks,days,nbins]):
+            Element energy per step, or per bin (kWh).
+    '''
+    params = np.asarray(params, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+    shape = np.broadcast_shapes(params.shape[:-1] + (1, 1), volume.shape)
+    hours = step_sec/3600
+    if(bins is None):
+        energy = np.zeros(shape)
+    else:
+        bins = np.asarray(bins)
+        energy = np.zeros(shape[:-1] + (nbins or int(bins.max()) + 1,))
+    for j, t, element in _Steps(params, volume, t_start, None, t_inlet, step_sec, rating, set_temp):
+        energy[..., j if bins is None else bins[j]] += element*hours
+    return energy
+
+def _FromX(x):
+    return np.stack((np.exp(x[..., 0]), np.exp(x[..., 1]), x[..., 2]), axis=-1)
+
+def _Normal(x, volume, temp, valid, t_start, power, t_inlet, step_sec, rating,
+            set_temp, jacobian=True):
+    '''
+    Sum of squared errors per tank and, if jacobian, the normal equations
+    (J'J, J'r) from forward differences, accumulated step by step so no traces
+    are stored.
+    '''
+    if(jacobian):
+        xs = np.repeat(x[None], 4, axis=0)
+        xs[1:] += np.diag(FD_STEPS)[:, None, :]
+    else:
+        xs = x[None]
+    tanks = x.shape[0]
+    sse = np.zeros(tanks)
+    JTJ = np.zeros((tanks, 3, 3))
+    JTr = np.zeros((tanks, 3))
+
+    for j, t, element in _Steps(_FromX(xs), volume, t_start, power, t_inlet, step_sec, rating, set_temp):
+        w = valid[..., j]
+        r = np.where(w, t[0] - temp[..., j], 0)
+        sse += (r*r).sum(axis=-1)
+        if(jacobian):
+            J = np.where(w, (t[1:] - t[0])/FD_STEPS[:, None, None], 0)
+            JTJ += np.einsum('atd,btd->tab', J, J)
+            JTr += np.einsum('atd,td->ta', J, r)
+    return sse, JTJ, JTr
+
+def Calibrate(volume, temp, power=None, t_inlet=18, guess=DEFAULT_GUESS,
+              iterations=30, tol=1e-6, step_sec=60, rating=2, set_temp=70):
+    '''
+    Fit R, effective volume and ambient temperature of every tank to measured
+    outlet temperatures (Levenberg-Marquardt, batched over tanks).
+
+    All tanks and days are simulated together; each day starts from the
+    measured temperature of its first step, so days with a missing first
+    value are left out. Missing (NaN) measurements are ignored. Measured
+    element power gives a smooth fit; with power None the thermostat switching
+    makes the error surface stepped and the fit less reliable.
+
+    Args:
+        volume (array[tanks,days,steps]):
+            Water drawn per step (litres), e.g. "Runner" volumes stacked per
+            tank.
+        temp (array[tanks,days,steps]):
+            Measured outlet temperature per step.
+        power (array[tanks,days,steps]):
+            Measured element power per step (kW), or None (see
+            "SimulateTemps").
+        t_inlet (float or array[tanks,1]):
+            Inlet water temperature.
+        guess (tuple or array[tanks,3]):
+            Starting R, volume and ambient temperature.
+        iterations (int):
+            Most iterations.
+        tol (float):
+            Relative change in squared error (or step size) at which a tank
+            has converged.
+
+    Returns:
+        results (dict):
+            'params' (array[tanks,3]) fitted R, volume and ambient
+            temperature, also given as 'R', 'volume' and 't_amb', 'rmse'
+            (array[tanks]) root mean square error (C), 'converged'
+            (array[tanks]) and 'iterations' (int).
+    '''
+    volume = np.asarray(volume, dtype=float)
+    temp = np.asarray(temp, dtype=float)
+    if(power is not None):
+        power = np.asarray(power, dtype=float)
+    tanks = volume.shape[0]
+    t_start = temp[..., 0]
+    valid = np.isfinite(temp) & np.isfinite(t_start)[..., None]
+    t_start = np.where(np.isfinite(t_start), t_start, set_temp)
+    count = np.maximum(valid[..., 1:].sum(axis=(1, 2)), 1)
+    run = (t_start, power, t_inlet, step_sec, rating, set_temp)
+
+    guess = np.broadcast_to(np.asarray(guess, dtype=float), (tanks, 3))
+    x = np.stack((np.log(guess[:, 0]), np.log(guess[:, 1]), guess[:, 2]), axis=-1)
+    lam = np.full(tanks, 1e-3)
+    converged = np.zeros(tanks, dtype=bool)
+
+    for it in range(1, iterations + 1):
+        sse, JTJ, JTr = _Normal(x, volume, temp, valid, *run)
+        diag = np.einsum('tii->ti', JTJ)
+        A = JTJ + (lam[:, None]*np.maximum(diag, 1e-12))[:, :, None]*np.eye(3)
+        delta = -np.linalg.solve(A, JTr[..., None])[..., 0]
+        delta[converged] = 0
+
+        newSse = _Normal(x + delta, volume, temp, valid, *run, jacobian=False)[0]
+        better = newSse < sse
+        x = np.where(better[:, None], x + delta, x)
+        lam = np.where(better, lam/3, lam*4)
+
+        small = (np.abs(delta).max(axis=1) < tol) | (better & (sse - newSse <= tol*sse))
+        converged |= small
+        if(converged.all()):
+            break
+
+    sse = _Normal(x, volume, temp, valid, *run, jacobian=False)[0]
+    params = _FromX(x)
+    return {'params': params, 'R': params[:, 0], 'volume': params[:, 1],
+            't_amb': params[:, 2], 'rmse': np.sqrt(sse/count),
+            'converged': converged, 'iterations': it}
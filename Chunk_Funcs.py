@@ -0,0 +1,263 @@
+"""
+The ``Chunk_Funcs`` module contains a month-chunked (out-of-core) version of
+the load -> LED -> PV -> geyser -> billing pipeline. Data files are streamed
+one day at a time and processed one billing month at a time, so peak memory
+is bounded by one month of data regardless of how many years a file covers.
+Geyser state and the financial model are carried across month boundaries.
+"""
+
+import csv
+import math
+import itertools
+import datetime as dt
+import numpy as np
+import myModels as models
+import Geyser_Funcs as gf
+import Tariff_Funcs as tf
+import Intervention_Funcs as itv
+import Export_Funcs as ef
+import Cost_Funcs as cf
+
+def IterLLDays(Filename="LL loads.csv"):
+    '''
+    Stream a load profile file (as read by "get_LL_data") one day at a time,
+    aggregated to hour intervals.
+
+    The first (incomplete) day and any incomplete last day are skipped, as in
+    "get_LL_data".
+
+    Args:
+        Filename (string):
+            Load profile file of the form 'Filename.csv'.
+
+    Yields:
+        tcollect (list):
+            Timestamps of the 24 hours of the day.
+        pcollect (list):
+            Energy consumption per hour (kWh).
+        peak (float):
+            Peak 'stot' value for the day.
+    '''
+    with open(Filename, newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        tcollect = []
+        pcollect = []
+        peak = 0
+        pVal = 0
+        firstDay = True
+        for row in reader:
+            if(float(row['stot']) > peak):
+                peak = float(row['stot'])
+
+            currDay = dt.datetime.strptime(row['tstamp'], '%d/%m/%Y %H:%M')
+            currDay = models.datetime_from_utc_to_local(currDay)
+            # Every Day, hand out the day collected so far
+            if(currDay.time() == dt.time(hour=00,minute=00)):
+                if(not firstDay):
+                    yield tcollect, pcollect, peak
+                firstDay = False
+                tcollect = []
+                pcollect = []
+                peak = 0
+
+            # End of every Hour, add entry to list and reset accumulator for power
+            if(currDay.minute == 55):
+                pVal += float(row['ptot'])
+                tcollect.append(currDay-dt.timedelta(minutes=55))
+                pcollect.append(pVal/12) # get in kWhrs
+                pVal = 0
+            else:
+                pVal += float(row['ptot'])
+
+def _LastRow(Filename, size=4096):
+    '''
+    Last row of a CSV file as a dict, read from the end of the file so the
+    file is not scanned.
+    '''
+    with open(Filename, newline='') as csvfile:
+        header = next(csv.reader(csvfile))
+    with open(Filename, 'rb') as f:
+        f.seek(0, 2)
+        end = f.tell()
+        while(True):
+            f.seek(max(end - size, 0))
+            lines = f.read().decode().splitlines()
+            lines = [l for l in lines if l.strip()]
+            # Need a whole line (more than one, unless the start of the file was read)
+            if(len(lines) > 1 or size >= end):
+                break
+            size *= 2
+    return dict(zip(header, next(csv.reader([lines[-1]]))))
+
+def IterVolumeDays(Filename, skip_start=71, skip_end=60):
+    '''
+    Stream a water consumption file (as read by "Runner") one day at a time,
+    with volumes placed in minute slots.
+
+    Args:
+        Filename (string):
+            Input form 'Filename.csv'. Name of file containing water
+            consumption data.
+        skip_start (int):
+            Days to drop from the start, counting the first incomplete day
+            (71 matches "Runner").
+        skip_end (int):
+            Complete days to drop from the end (60 matches "Runner"). The
+            last timestamp is read from the end of the file first, so no
+            days are held back in memory.
+
+    Yields:
+        tcollect (array[minutes]):
+            Timestamps of the 1440 minutes of the day.
+        vcollect (array[minutes]):
+            Water consumption per minute (litres).
+    '''
+    tLast = int(_LastRow(Filename)['time'])
+    with open(Filename, newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        next(reader) # first sample is skipped, as in "Runner"
+        row = next(reader)
+        t0 = int(row['time'])
+        start = dt.datetime.utcfromtimestamp(t0)
+        start = models.datetime_from_utc_to_local(start.replace(second=0))
+        dayStart = dt.datetime.combine(start.date(), dt.time())
+        startMin = int((start - dayStart).total_seconds()//60)
+        # "Runner" counts the (possibly empty) part-day before the first midnight as day 0
+        runnerOffset = 1 if startMin == 0 else 0
+        # Days are complete once a later sample arrives (the last one is
+        # in the last, incomplete day), so days [first, last) are handed out
+        first = max(skip_start - runnerOffset, 0)
+        last = (startMin + math.ceil((tLast - t0)/60))//(24*60) - skip_end
+
+        vcollect = np.zeros(24*60)
+        vcollect[startMin] = float(row['Hm'])
+        currDay = 0
+        for row in reader:
+            minute = startMin + math.ceil((int(row['time']) - t0)/60)
+            day, slot = divmod(minute, 24*60)
+            while(day > currDay):
+                if(currDay >= last):
+                    return
+                if(currDay >= first):
+                    date = dayStart + dt.timedelta(days=currDay)
+                    yield np.array([date + dt.timedelta(minutes=m) for m in range(24*60)]), vcollect
+                currDay += 1
+                vcollect = np.zeros(24*60)
+            if(day == currDay):
+                vcollect[slot] = float(row['Hm'])
+
+def IterMonths(days):
+    '''
+    Group a stream of days (from "IterLLDays" or "IterVolumeDays") in to
+    calendar months.
+
+    Args:
+        days (iterable):
+            Tuples whose first item is the list of timestamps for the day.
+
+    Yields:
+        month (tuple of arrays):
+            Each item of the day tuples stacked over the days of the month,
+            e.g. (tStamp[days,slots], energy[days,slots], peaks[days]).
+    '''
+    for key, group in itertools.groupby(days, key=lambda d: (d[0][0].year, d[0][0].month)):
+        items = list(zip(*group))
+        for item in items:
+            lengths = set(np.shape(day)[:1] for day in item)
+            if(len(lengths) > 1):
+                raise ValueError("days of %d-%02d have different numbers of slots: %s"
+                                 %(key + (sorted(l[0] for l in lengths),)))
+        yield tuple(np.array(item) for item in items)
+
+def Hours_From_Mins(data):
+    '''
+    Sum (days, minutes) data to (days, hours).
+    '''
+    return data.reshape(data.shape[0], 24, -1).sum(axis=2)
+
+def RunMonthly(load_file="LL loads.csv", led=False, panels=None, site=None,
+               geyser_file=None, rates=None, fModel=None, out_file=None):
+    '''
+    Run the load -> LED -> PV -> geyser -> billing pipeline one billing month
+    at a time.
+
+    Geyser energy (from "Simulator") is added to the building load on the days
+    where both data sets overlap. The geyser and the financial model carry
+    their state from one month to the next.
+
+    Args:
+        load_file (string):
+            Load profile file of the form 'Filename.csv'.
+        led (bool):
+            Apply "Change_To_LEDs".
+        panels (int):
+            Number of PV panels ("CalcSolPow"). None for no PV.
+        site (pvlib Location):
+            Location used for PV (default LaunchLab).
+        geyser_file (string):
+            Water consumption file for the geyser. None for no geyser.
+        rates (dict):
+            TOU rates (see "Tariff_Funcs.SlotRates") for a per-slot cost next
+            to the financial model; None for no TOU cost.
+        fModel (class instance):
+            Financial model to add every month to. A new one is created if
+            None and is returned with every month.
+        out_file (string):
+            Parquet file the hourly results are appended to each month.
+
+    Yields:
+        month (dict):
+            'month' ('YYYY-MM'), 'tStamp', 'energy' (after interventions),
+            'solar', 'geyser' (hourly arrays for the month), 'cost' (TOU cost
+            total, None without rates), 'fModel' (financial model so far).
+    '''
+    if(fModel is None):
+        fModel = cf.finModel()
+    writer = ef.ResultsWriter(out_file) if out_file else None
+
+    gModel = None
+    gMonths = iter(())
+    if(geyser_file is not None):
+        gModel = gf.SetupGeyser()
+        gMonths = IterMonths(IterVolumeDays(geyser_file))
+    gNext = next(gMonths, None)
+
+    try:
+        for tStamp, energy, peaks in IterMonths(IterLLDays(load_file)):
+            month = ef.Month_Key(tStamp[0,0])
+            if(led):
+                tStamp, energy = models.Change_To_LEDs(tStamp, energy)
+
+            solar = None
+            if(panels):
+                solarPow, dates, maxi = models.CalcSolPow(tStamp[0,0], tStamp[-1,-1],
+                                                          number_panels=panels, site=site)
+                solar = models.fix_solar(solarPow)/1000 # in kWh
+                energy, extras = itv.ApplyInterventions(energy, [itv.SolarOffset(solar)])
+
+            # Simulate geyser months up to this one, keeping the tank state
+            geyser = None
+            while(gNext is not None and ef.Month_Key(gNext[0][0,0]) <= month):
+                gTime, gVol = gNext
+                gEnergy, gTemp = gf.Simulator(gVol, gModel)
+                if(ef.Month_Key(gTime[0,0]) == month):
+                    gHours = Hours_From_Mins(gEnergy)
+                    gDays = {gTime[d,0].date(): d for d in range(gTime.shape[0])}
+                    geyser = np.zeros_like(energy)
+                    for d in range(tStamp.shape[0]):
+                        if(tStamp[d,0].date() in gDays):
+                            geyser[d] = gHours[gDays[tStamp[d,0].date()]]
+                    energy = energy + geyser
+                gNext = next(gMonths, None)
+
+            cost = tf.PeriodCost(tStamp, energy, rates) if rates is not None else None
+            models.getFinModel(tStamp, energy, fModel)
+            if(writer is not None):
+                writer.write(tStamp, energy=energy, solar=solar, cost=cost)
+
+            yield {'month': month, 'tStamp': tStamp, 'energy': energy,
+                   'solar': solar, 'geyser': geyser, 'cost': None if cost is None else float(cost.sum()),
+                   'fModel': fModel}
+    finally:
+        if(writer is not None):
+            writer.close()
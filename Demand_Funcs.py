@@ -0,0 +1,176 @@
+"""
+The ``Demand_Funcs`` module contains vectorised maximum demand (kVA)
+functions: 30 minute integration window averages, maxima per billing month
+and per TOU period, and monthly demand charges. All functions take
+(..., days, slots) arrays, so demand after PV, LED and battery interventions
+can be evaluated for many scenarios at once.
+"""
+
+import datetime as dt
+import numpy as np
+import myModels as models
+import Validate_Funcs as vf
+import Tariff_Funcs as tf
+import Time_Funcs as tm
+
+def LoadLLDemand(Filename="LL loads.csv", fill='interpolate'):
+    '''
+    Load 5 minute active (ptot, kW) and apparent (stot, kVA) power from a
+    load profile file on to a regular grid of whole days.
+
+    Args:
+        Filename (string):
+            Load profile file of the form 'Filename.csv'.
+        fill (string):
+            Gap filling strategy (see "Validate_Funcs.FillGaps").
+
+    Returns:
+        tStamp (array[days,288]):
+            Local timestamps (datetime64[s]).
+        ptot (array[days,288]):
+            Active power (kW).
+        stot (array[days,288]):
+            Apparent power (kVA).
+        report (dict):
+            Data quality report from "Validate_Funcs.LoadCSVGrid".
+    '''
+    times, values, report = vf.LoadCSVGrid(Filename, 'tstamp', ['ptot', 'stot'], 5, fill=fill)
+    ref = dt.datetime(2000, 1, 1)
+    times = (times + np.timedelta64(models.datetime_from_utc_to_local(ref) - ref)).astype('datetime64[s]')
+
+    # Keep whole days only
+    slotsIntoDay = int((times[0] - times[0].astype('datetime64[D]')) // np.timedelta64(5, 'm'))
+    first = (288 - slotsIntoDay) % 288
+    days = (times.size - first) // 288
+    sel = slice(first, first + days*288)
+    return (times[sel].reshape(days, 288), values[sel, 0].reshape(days, 288),
+            values[sel, 1].reshape(days, 288), report)
+
+def Demand_From_Energy(energy, power_factor=1.0):
+    '''
+    Average apparent power (kVA) per slot from energy per slot (kWh).
+
+    Args:
+        energy (array[...,days,slots]):
+            Energy per slot (kWh), e.g. after interventions.
+        power_factor (float or array[...,days,slots]):
+            Power factor (kW/kVA), e.g. ptot/stot from measured data.
+
+    Returns:
+        kva (array[...,days,slots]):
+            Average apparent power per slot.
+    '''
+    energy = np.asarray(energy, dtype=float)
+    slot_hours = 24/energy.shape[-1]
+    return energy/slot_hours/power_factor
+
+def WindowDemand(demand, window_slots=6, how='rolling'):
+    '''
+    Average demand over integration windows (6 slots of 5 minutes = 30 min).
+
+    Args:
+        demand (array[...,days,slots]):
+            Demand per slot (kVA or kW).
+        window_slots (int):
+            Slots per integration window.
+        how (string):
+            'rolling' for a window ending at every slot (NaN for the first
+            window_slots-1 slots, which have no full window),
+            'block' for consecutive fixed windows from the start of the data
+            (each slot gets the average of its window).
+
+    Returns:
+        windowed (array[...,days,slots]):
+            Window average per slot.
+    '''
+    demand = np.asarray(demand, dtype=float)
+    shape = demand.shape
+    flat = demand.reshape(shape[:-2] + (-1,))
+    T = flat.shape[-1]
+    w = int(window_slots)
+
+    if(how == 'rolling'):
+        total = np.cumsum(flat, axis=-1)
+        windowed = np.full_like(flat, np.nan)
+        windowed[..., w-1:w] = total[..., w-1:w] / w
+        windowed[..., w:] = (total[..., w:] - total[..., :-w]) / w
+    elif(how == 'block'):
+        full = (T // w)*w
+        windowed = np.empty_like(flat)
+        blocks = flat[..., :full].reshape(flat.shape[:-1] + (-1, w)).mean(axis=-1)
+        windowed[..., :full] = np.repeat(blocks, w, axis=-1)
+        if(full < T): # last, partial window
+            windowed[..., full:] = flat[..., full:].mean(axis=-1, keepdims=True)
+    else:
+        raise ValueError("how must be 'rolling' or 'block', not '%s'"%how)
+    return windowed.reshape(shape)
+
+def MonthlyMaxDemand(tStamp, demand, by_period=False):
+    '''
+    Maximum demand per billing month, optionally per TOU period.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps of the demand (in time order).
+        demand (array[...,days,slots]):
+            Demand per slot, e.g. from "WindowDemand" (NaN is ignored).
+        by_period (bool):
+            Also split the maximum by TOU period.
+
+    Returns:
+        months (list):
+            Months as 'YYYY-MM'.
+        maxDemand (array[...,months] or array[...,months,3]):
+            Maximum per month (and per off-peak/standard/peak period; 0 where
+            a month has no slots, or only NaN, in a period).
+    '''
+    times = tm.To_Datetime64(tStamp)
+    demand = np.asarray(demand, dtype=float)
+    flat = demand.reshape(demand.shape[:-2] + (times.size,))
+    monthIdx = times.astype('datetime64[M]')
+    starts = np.concatenate(([0], np.flatnonzero(monthIdx[1:] != monthIdx[:-1]) + 1))
+    months = [str(monthIdx[s]) for s in starts]
+    if(not by_period):
+        return months, np.nan_to_num(np.fmax.reduceat(flat, starts, axis=-1))
+
+    periods, high = tf.TOUPeriods(times)
+    maxDemand = np.empty(flat.shape[:-1] + (len(months), 3))
+    for p in range(3):
+        masked = np.where(periods == p, flat, -np.inf)
+        maxDemand[..., p] = np.fmax.reduceat(masked, starts, axis=-1)
+    maxDemand[np.isneginf(maxDemand) | np.isnan(maxDemand)] = 0
+    return months, maxDemand
+
+def DemandCharge(tStamp, demand, rate, periods=None, window_slots=6, how='rolling'):
+    '''
+    Monthly demand charge from demand per slot.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps of the demand.
+        demand (array[...,days,slots]):
+            Apparent power per slot (kVA), e.g. from "Demand_From_Energy".
+        rate (float):
+            Demand charge of the tariff studied (R/kVA per month).
+        periods (tuple):
+            TOU periods the maximum is taken over (None for all slots).
+        window_slots (int):
+            Slots per integration window (see "WindowDemand").
+        how (string):
+            'rolling' or 'block' windows.
+
+    Returns:
+        months (list):
+            Months as 'YYYY-MM'.
+        charge (array[...,months]):
+            Demand charge per month (R).
+        maxDemand (array[...,months]):
+            Maximum demand the charge is based on (kVA).
+    '''
+    windowed = WindowDemand(demand, window_slots, how)
+    if(periods is None):
+        months, maxDemand = MonthlyMaxDemand(tStamp, windowed)
+    else:
+        months, byPeriod = MonthlyMaxDemand(tStamp, windowed, by_period=True)
+        maxDemand = byPeriod[..., list(periods)].max(axis=-1)
+    return months, maxDemand*rate, maxDemand
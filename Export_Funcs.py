@@ -0,0 +1,207 @@
+"""
+The ``Export_Funcs`` module contains functions for writing simulation and
+billing results to columnar (Parquet) files and reading them back, so that
+year-long results do not have to be pickled as arrays of datetime objects.
+"""
+
+import datetime as dt
+import numpy as np
+import Time_Funcs as tm
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # pyarrow is only needed for the results files
+    pa = None
+    pq = None
+
+STD_COLUMNS = ('energy', 'temp', 'solar', 'cost')
+
+def Month_Key(month):
+    '''
+    Normalise a month given as 'YYYY-MM', a date/datetime or a datetime64 to
+    the 'YYYY-MM' key used in the results files.
+    '''
+    if(isinstance(month, dt.datetime)):
+        month = month.replace(tzinfo=None)
+    return str(np.datetime64(month, 'M'))
+
+class ResultsWriter:
+    '''
+    Incremental results writer, used when results are produced a chunk (e.g.
+    a billing month) at a time. Every call to "write" adds one row group per
+    calendar month in the chunk, so only one chunk is held in memory.
+
+    Args:
+        Filename (string):
+            Output file of the form 'Filename.parquet'.
+    '''
+
+    def __init__(self, Filename):
+        if(pq is None):
+            raise ImportError("ResultsWriter requires pyarrow to be installed")
+        self.Filename = Filename
+        self.writer = None
+        self.schema = None
+        self.months = []
+
+    def write(self, tStamp, energy=None, temp=None, solar=None, cost=None,
+              **columns):
+        '''
+        Append results for a chunk of time.
+
+        Args:
+            tStamp (array[days,slots]):
+                Timestamps for the results (object or datetime64 array).
+            energy, temp, solar, cost (array[days,slots]):
+                Optional result columns, same shape as tStamp. Columns that are
+                None are not written. Must be the same for every chunk.
+            **columns (array[days,slots]):
+                Any further numeric columns (e.g. meter or geyser id).
+        '''
+        tStamp = np.asarray(tStamp)
+        times = tm.To_Datetime64(tStamp)
+        if(times.size == 0):
+            return
+
+        data = {}
+        for name, values in zip(STD_COLUMNS, (energy, temp, solar, cost)):
+            if(values is not None):
+                data[name] = values
+        data.update(columns)
+        for name in data:
+            data[name] = np.ascontiguousarray(data[name]).ravel()
+            if(data[name].size != times.size):
+                raise ValueError("Column '%s' has %d values, expected %d"
+                                 %(name, data[name].size, times.size))
+
+        if(self.writer is None):
+            slots = tStamp.shape[1] if tStamp.ndim == 2 else 0
+            fields = [pa.field('timestamp', pa.timestamp('s'))]
+            fields += [pa.field(name, pa.from_numpy_dtype(data[name].dtype)) for name in data]
+            self.schema = pa.schema(fields, metadata={b'slots_per_day': str(slots).encode()})
+            self.writer = pq.ParquetWriter(self.Filename, self.schema)
+
+        # Row group boundaries at every change of month
+        monthIdx = times.astype('datetime64[M]')
+        bounds = np.flatnonzero(monthIdx[1:] != monthIdx[:-1]) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [times.size]))
+
+        for s, e in zip(starts, ends):
+            arrays = [pa.array(times[s:e])]
+            arrays += [pa.array(data[name][s:e]) for name in data]
+            table = pa.Table.from_arrays(arrays, schema=self.schema)
+            self.writer.write_table(table, row_group_size=e-s)
+            self.months.append(str(monthIdx[s]))
+
+    def close(self):
+        if(self.writer is not None):
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def WriteResults(Filename, tStamp, energy=None, temp=None, solar=None,
+                 cost=None, **columns):
+    '''
+    Write simulation/billing results to a Parquet file with one row group per
+    calendar month.
+
+    Args:
+        Filename (string):
+            Output file of the form 'Filename.parquet'.
+        tStamp (array[days,slots]):
+            Timestamps for the results (object or datetime64 array).
+        energy, temp, solar, cost (array[days,slots]):
+            Optional result columns, same shape as tStamp. Columns that are
+            None are not written.
+        **columns (array[days,slots]):
+            Any further numeric columns (e.g. meter or geyser id).
+
+    Returns:
+        months (list):
+            Months ('YYYY-MM') written, in row group order.
+    '''
+    with ResultsWriter(Filename) as writer:
+        writer.write(tStamp, energy=energy, temp=temp, solar=solar, cost=cost,
+                     **columns)
+    return writer.months
+
+def ReadResults(Filename, columns=None, months=None, as_days=False):
+    '''
+    Read results written by "WriteResults", loading only the requested
+    columns and months. The file is memory mapped so unread row groups and
+    columns are never touched.
+
+    Args:
+        Filename (string):
+            File of the form 'Filename.parquet'.
+        columns (list of strings):
+            Columns to load (timestamp is always included). None loads all.
+        months (list):
+            Months to load as 'YYYY-MM' strings, dates or datetime64. None
+            loads all months.
+        as_days (bool):
+            Reshape the returned arrays to (days, slots) as they were written.
+            With months, the whole days starting in those months are read.
+
+    Returns:
+        results (dict of arrays):
+            Column name to numpy array; 'timestamp' is datetime64[s].
+    '''
+    if(pq is None):
+        raise ImportError("ReadResults requires pyarrow to be installed")
+
+    pFile = pq.ParquetFile(Filename, memory_map=True)
+    slots = int(pFile.schema_arrow.metadata[b'slots_per_day'])
+    counts = np.array([pFile.metadata.row_group(i).num_rows
+                       for i in range(pFile.num_row_groups)], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    if(months is None):
+        groups = list(range(pFile.num_row_groups))
+    else:
+        # Every row group holds one month, so its first timestamp gives the month
+        wanted = set(Month_Key(m) for m in months)
+        groups = [i for i in range(pFile.num_row_groups) if _GroupMonth(pFile, i) in wanted]
+
+    if(columns is not None):
+        columns = ['timestamp'] + [c for c in columns if c != 'timestamp']
+
+    rows = None
+    if(as_days and slots):
+        if(offsets[-1] % slots):
+            raise ValueError("%s has %d rows, not whole days of %d slots"%(Filename, offsets[-1], slots))
+        # Whole days starting in the selected months; a day may end in the next
+        # month (e.g. "GetCSVData" days end at midnight), so its group is read too
+        starts = [np.arange(-(-offsets[g]//slots), -(-offsets[g+1]//slots))*slots for g in groups]
+        starts = np.concatenate(starts) if starts else np.zeros(0, np.int64)
+        rows = (starts[:, None] + np.arange(slots)).ravel()
+        groups = np.unique(np.searchsorted(offsets, rows, 'right') - 1).tolist()
+
+    table = pFile.read_row_groups(groups, columns=columns)
+    if(rows is not None):
+        # Global row numbers to positions in the groups read
+        before = np.cumsum([0] + [counts[g] for g in groups])
+        group = np.searchsorted(offsets, rows, 'right') - 1
+        table = table.take(rows - offsets[group] + before[np.searchsorted(groups, group)])
+    results = {}
+    for name in table.column_names:
+        results[name] = table.column(name).to_numpy()
+        if(name == 'timestamp'):
+            results[name] = results[name].astype('datetime64[s]')
+        if(rows is not None):
+            results[name] = results[name].reshape(-1, slots)
+    return results
+
+def _GroupMonth(pFile, i):
+    '''Month of a row group, from its statistics or else its first timestamp.'''
+    stats = pFile.metadata.row_group(i).column(0).statistics
+    if(stats is not None and stats.has_min_max):
+        return Month_Key(stats.min)
+    first = pFile.read_row_group(i, columns=['timestamp']).column(0)[0].as_py()
+    return Month_Key(first)
@@ -0,0 +1,328 @@
+"""
+The ``Fleet_Funcs`` module contains a demand-response simulator for
+populations of geysers. Every tank follows the ``ewhModel_one`` equations
+(batched with ``ewhModel_batch``) with its own size, thermal resistance, set
+point and hot water use; utility signals curtail the elements or raise the
+set points (pre-heat) of the participating tanks during events. The fleet is
+stepped once with and once without the signals (same draws), and only
+aggregates are kept while stepping: total load per step, comfort counters
+per tank and per-event snapshots, so memory does not grow with the number of
+tanks times steps.
+
+Example:
+    fleet = MakeFleet(50000)
+    draws = DrawLibrary(vol) # "Runner" volumes, or SyntheticDraws()
+    events = [{'start': '2019-06-03T17:00', 'end': '2019-06-03T20:00',
+               'type': 'curtail', 'share': 0.8},
+              {'start': '2019-06-03T15:00', 'end': '2019-06-03T17:00',
+               'type': 'preheat', 'boost': 10, 'share': 0.8}]
+    result = FleetDR(fleet, draws, '2019-06-01', 7, events)
+"""
+
+import time
+import numpy as np
+import gModels as Geyser
+
+EVENT_TYPES = ('curtail', 'preheat')
+
+def MakeFleet(tanks, seed=0, volumes=(100, 150, 200), volume_p=(0.3, 0.5, 0.2),
+              set_temps=(60, 65, 70), set_p=(0.2, 0.3, 0.5), R=1/1.429756, R_spread=0.15,
+              t_amb=26, t_inlet=18, comfort=45, use_spread=0.3):
+    '''
+    Random population of geysers around the "SetupGeyser" values.
+
+    Args:
+        tanks (int):
+            Number of geysers.
+        volumes, volume_p:
+            Tank sizes (litres) and their shares.
+        set_temps, set_p:
+            Thermostat set points (C) and their shares.
+        R (float):
+            Median thermal resistance; spread log-normally by R_spread.
+        t_amb, t_inlet (float):
+            Ambient and inlet temperatures (C).
+        comfort (float):
+            Lowest acceptable outlet temperature while drawing water (C).
+        use_spread (float):
+            Log-normal spread of hot water use between households.
+
+    Returns:
+        fleet (dict):
+            Arrays per tank: 'R', 'volume', 'set_temp', 'rating' (kW, 3 kW
+            above 150 litres, else 2 kW), 't_amb', 't_inlet', 'comfort' and
+            'use' (draw multiplier).
+    '''
+    rng = np.random.default_rng(seed)
+    volume = rng.choice(np.asarray(volumes, dtype=float), size=tanks, p=volume_p)
+    return {'R': R*np.exp(R_spread*rng.standard_normal(tanks)),
+            'volume': volume,
+            'set_temp': rng.choice(np.asarray(set_temps, dtype=float), size=tanks, p=set_p),
+            'rating': np.where(volume > 150, 3.0, 2.0),
+            't_amb': np.full(tanks, float(t_amb)),
+            't_inlet': np.full(tanks, float(t_inlet)),
+            'comfort': np.full(tanks, float(comfort)),
+            'use': np.exp(use_spread*rng.standard_normal(tanks) - use_spread**2/2)}
+
+def DrawLibrary(vol, step_min=5):
+    '''
+    Daily draw profiles from measured volumes (e.g. "Runner"), summed to
+    the simulation step.
+
+    Args:
+        vol (array[days,minutes]):
+            Water drawn per minute (litres).
+        step_min (int):
+            Simulation step in minutes (divides 1440).
+
+    Returns:
+        draws (array[profiles,slots]):
+            Litres per step for every day profile.
+    '''
+    vol = np.asarray(vol, dtype=float)
+    return vol.reshape(vol.shape[0], -1, step_min).sum(axis=-1)
+
+def SyntheticDraws(profiles=200, step_min=5, litres=150, seed=0):
+    '''
+    Synthetic daily draw profiles with morning and evening peaks, for when
+    no measured volumes are at hand.
+
+    Returns:
+        draws (array[profiles,slots]):
+            Litres per step, about litres per day on average.
+    '''
+    rng = np.random.default_rng(seed)
+    slots = 1440//step_min
+    hour = (np.arange(slots) + 0.5)*step_min/60
+    shape = np.exp(-0.5*((hour - 7)/1.0)**2) + 0.8*np.exp(-0.5*((hour - 19.5)/1.5)**2) + 0.05
+    shape /= shape.sum()
+    # Draws happen in a few steps of the day: sample events from the shape
+    events = rng.poisson(6, size=profiles)
+    draws = np.zeros((profiles, slots))
+    for p in range(profiles):
+        at = rng.choice(slots, size=max(events[p], 1), p=shape)
+        np.add.at(draws[p], at, rng.gamma(2.0, 1.0, size=at.size))
+    return draws*litres/draws.sum(axis=1).mean()
+
+def _Events(events, start, steps, step_min, tanks, groups, rng):
+    '''Step indices, type, boost and participating tanks of every event.'''
+    parsed = []
+    for i, ev in enumerate(events):
+        kind = ev.get('type', 'curtail')
+        if(kind not in EVENT_TYPES):
+            raise ValueError("event type must be one of %s, not '%s'"%(EVENT_TYPES, kind))
+        first = int((np.datetime64(ev['start'], 'm') - start)/np.timedelta64(step_min, 'm'))
+        last = int((np.datetime64(ev['end'], 'm') - start)/np.timedelta64(step_min, 'm'))
+        if(last <= first):
+            raise ValueError("event %d ends before it starts"%i)
+        if(first < 0 or first >= steps):
+            raise ValueError("event %d starts outside the simulated days"%i)
+        if('tanks' in ev):
+            mask = np.zeros(tanks, dtype=bool)
+            mask[np.asarray(ev['tanks'])] = True
+        elif('group' in ev):
+            if(groups is None):
+                raise ValueError("event %d selects a group but no groups were given"%i)
+            mask = np.isin(groups, ev['group'])
+        else:
+            mask = rng.random(tanks) < ev.get('share', 1.0)
+        parsed.append({'name': ev.get('name', 'event %d'%i), 'type': kind,
+                       'first': first, 'last': min(last, steps),
+                       'boost': float(ev.get('boost', 10)), 'mask': mask})
+    return parsed
+
+def FleetDR(fleet, draws, start, days, events=(), step_min=5, t_amb=None, baseline=True,
+            rebound_hours=3, max_temp=85, groups=None, seed=0):
+    '''
+    Simulate a geyser fleet under demand-response events.
+
+    Every day each tank uses a random profile of the draw library, scaled by
+    its 'use'. Thermostats switch at set point +-2 C, as in "Simulator".
+    During a 'curtail' event the elements of participating tanks are off
+    (the thermostat still calls for heat, so they switch on at release);
+    during a 'preheat' event their set point is raised by 'boost' (C), up to
+    max_temp.
+
+    Args:
+        fleet (dict):
+            Tank arrays (see "MakeFleet").
+        draws (array[profiles,slots]):
+            Daily draw profiles in litres per step ("DrawLibrary").
+        start (datetime64 or string):
+            First day.
+        days (int):
+            Days to simulate.
+        events (list of dict):
+            'start', 'end' (datetimes or strings), 'type' ('curtail' or
+            'preheat'), 'boost' (C, preheat) and the participants: 'share'
+            (random fraction, default all), 'group' (group number(s), see
+            groups) or 'tanks' (indices).
+        step_min (int):
+            Step length in minutes (the draw library must match).
+        t_amb (array[steps]):
+            Ambient temperature per step for all tanks (e.g. from
+            "Geyser_Funcs.TemperatureProfile"); None uses fleet['t_amb'].
+        baseline (bool):
+            Also simulate the fleet without signals (for shed and rebound).
+        rebound_hours (float):
+            Time after each event in which the rebound is measured.
+        groups (array[tanks]):
+            Group (e.g. feeder) of every tank; load is then also totalled per
+            group.
+        seed (int):
+            Seed for profile choice and event participation.
+
+    Returns:
+        result (dict):
+            'time' (array[steps]) step start times, 'scenarios' names of the
+            first axis ('baseline', 'dr'), 'load' (array[scenarios,steps])
+            fleet load (kW), 'group_load' (array[scenarios,groups,steps]) if
+            groups, 'energy' (array[scenarios]) kWh, 'comfort' per tank
+            ('violations' steps with a draw below the comfort temperature,
+            'violation_litres' and 'min_temp', each array[scenarios,tanks]),
+            'events' (list of dict, see "EventMetrics") and 'seconds'.
+    '''
+    clock = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    draws = np.asarray(draws, dtype=float)
+    slots = 1440//step_min
+    if(draws.shape[1] != slots):
+        raise ValueError("draw profiles have %d slots, %d minute steps need %d"
+                         %(draws.shape[1], step_min, slots))
+    start = np.datetime64(start, 'D').astype('datetime64[m]')
+    steps = days*slots
+    step_sec = step_min*60
+    tanks = fleet['R'].size
+    scenarios = ('baseline', 'dr') if baseline else ('dr',)
+    S = len(scenarios)
+    dr = S - 1 # index of the controlled scenario
+    events = _Events(events, start, steps, step_min, tanks, groups, rng)
+
+    # Every scenario is a row of the batch; all rows share the tank parameters
+    gModel = Geyser.ewhModel_batch(fleet['R'][None, :], fleet['volume'][None, :],
+                                   np.repeat(fleet['set_temp'][None, :], S, axis=0))
+    gModel.setAmbTemp(fleet['t_amb'][None, :])
+    gModel.setInletTemp(fleet['t_inlet'][None, :])
+    gModel.GeyserOn = np.zeros((S, tanks), dtype=bool)
+    decay = gModel.decayFactor(step_sec)
+    rating = fleet['rating'][None, :]
+    comfort = fleet['comfort']
+
+    load = np.zeros((S, steps))
+    if(groups is not None):
+        groups = np.asarray(groups)
+        nGroups = int(groups.max()) + 1
+        groupLoad = np.zeros((S, nGroups, steps))
+    violations = np.zeros((S, tanks), dtype=np.int64)
+    violationLitres = np.zeros((S, tanks))
+    minTemp = np.full((S, tanks), np.inf)
+
+    # Changes of the event signals by step, so masks are rebuilt only then
+    changes = {}
+    snaps = {} # step -> events needing a snapshot of the comfort counters
+    for k, ev in enumerate(events):
+        changes.setdefault(ev['first'], []).append(k)
+        changes.setdefault(ev['last'], []).append(k)
+        ev['stop'] = min(ev['last'] + int(rebound_hours*60/step_min), steps)
+        ev['snap'] = {}
+        for at in (ev['first'], ev['stop']):
+            snaps.setdefault(at, []).append(k)
+    active = set()
+    offset = np.zeros((S, tanks)) # set point change
+    allowed = np.ones((S, tanks), dtype=bool) # element may run
+    high, low = fleet['set_temp'] + 2, fleet['set_temp'] - 2 # thermostat rails
+
+    for s in range(steps):
+        slot = s % slots
+        if(slot == 0): # new day: pick every tank's draw profile
+            profile = rng.integers(draws.shape[0], size=tanks)
+        if(s in changes):
+            for k in changes[s]:
+                active.symmetric_difference_update({k})
+            offset[dr] = 0
+            allowed[dr] = True
+            for k in active:
+                ev = events[k]
+                if(ev['type'] == 'curtail'):
+                    allowed[dr, ev['mask']] = False
+                else:
+                    offset[dr] = np.where(ev['mask'], np.maximum(offset[dr], ev['boost']), offset[dr])
+            setTemp = np.minimum(fleet['set_temp'] + offset, max_temp)
+            high, low = setTemp + 2, setTemp - 2
+        if(s in snaps):
+            for k in snaps[s]:
+                events[k]['snap'][s] = violations[dr].copy()
+        if(t_amb is not None):
+            gModel.setAmbTemp(t_amb[s])
+
+        draw = draws[profile, slot]*fleet['use']
+        gModel.stepVolume(draw)
+        currTemp = gModel.getOutletTemp()
+        short = (draw > 0) & (currTemp < comfort)
+        violations += short
+        np.add(violationLitres, draw, out=violationLitres, where=short)
+        np.minimum(minTemp, currTemp, out=minTemp)
+
+        gModel.GeyserOn = (gModel.GeyserOn | (currTemp <= low)) & (currTemp < high)
+        power = rating*(gModel.GeyserOn & allowed)
+        gModel.stepTime(step_sec, power, decay)
+        load[:, s] = power.sum(axis=1)
+        if(groups is not None):
+            for i in range(S):
+                groupLoad[i, :, s] = np.bincount(groups, power[i], nGroups)
+
+    for ev in events:
+        ev['snap'].setdefault(ev['stop'], violations[dr].copy()) # window ends with the run
+
+    times = start + np.arange(steps)*np.timedelta64(step_min, 'm')
+    result = {'time': times, 'scenarios': scenarios, 'load': load,
+              'energy': load.sum(axis=1)*step_min/60,
+              'comfort': {'violations': violations, 'violation_litres': violationLitres,
+                          'min_temp': minTemp}}
+    if(groups is not None):
+        result['group_load'] = groupLoad
+    result['events'] = EventMetrics(result, events, step_min, rebound_hours)
+    result['seconds'] = time.perf_counter() - clock
+    return result
+
+def EventMetrics(result, events, step_min, rebound_hours=3):
+    '''
+    Shed, rebound and comfort per event from the aggregate load.
+
+    Returns:
+        metrics (list of dict):
+            Per event: 'name', 'type', 'start', 'end', 'tanks' participating,
+            'shed_kwh' (baseline less controlled energy during the event) and
+            'mean_shed_kw', 'rebound_peak_kw' (highest controlled load in the
+            rebound window after the event) with its 'rebound_time',
+            'baseline_peak_kw' (highest baseline load in the same window),
+            'rebound_ratio' (rebound over baseline peak), 'payback_kwh'
+            (extra energy in the window) and 'violating_tanks' (participating
+            tanks with comfort violations from the start of the event to the
+            end of the window). Baseline values are NaN without a baseline run.
+    '''
+    load = result['load']
+    times = result['time']
+    hours = step_min/60
+    window = int(rebound_hours*60/step_min)
+    base = load[0] if load.shape[0] == 2 else np.full(load.shape[1], np.nan)
+    ctrl = load[-1]
+    metrics = []
+    for ev in events:
+        a, b = ev['first'], ev['last']
+        c = min(b + window, load.shape[1])
+        before, after = ev['snap'][a], ev['snap'][ev['stop']]
+        m = {'name': ev['name'], 'type': ev['type'], 'start': str(times[a]),
+             'end': str(times[b]) if b < times.size else str(times[-1]),
+             'tanks': int(ev['mask'].sum()),
+             'shed_kwh': float((base[a:b] - ctrl[a:b]).sum()*hours),
+             'mean_shed_kw': float((base[a:b] - ctrl[a:b]).mean()) if b > a else 0.0,
+             'violating_tanks': int((((after - before) > 0) & ev['mask']).sum())}
+        if(c > b):
+            peak = int(ctrl[b:c].argmax()) + b
+            m.update({'rebound_peak_kw': float(ctrl[peak]), 'rebound_time': str(times[peak]),
+                      'baseline_peak_kw': float(base[b:c].max()),
+                      'rebound_ratio': float(ctrl[peak]/base[b:c].max()) if base[b:c].max() > 0 else np.nan,
+                      'payback_kwh': float((ctrl[b:c] - base[b:c]).sum()*hours)})
+        metrics.append(m)
+    return metrics
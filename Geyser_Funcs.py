@@ -6,21 +6,105 @@ models in order to calculate energy.
 import csv
 import gModels as Geyser
 import myModels as models
+import Time_Funcs as tm
 import Cost_Funcs as cf
 import datetime as dt
 import numpy as np
 
 endOfDay = dt.time(hour=23,minute=59)
-def SetupGeyser(startTemp=50):
-    thermalRes = 1/1.429756
-    volume = 150
-
+def SetupGeyser(startTemp=50, thermalRes=1/1.429756, volume=150, ambTemp=26, inletTemp=18):
+    '''
+    Create a single-node geyser. The defaults are the typical values used
+    throughout; fitted values per tank come from "Calibrate_Funcs.Calibrate".
+    '''
     g = Geyser.ewhModel_one(thermal_resistance=thermalRes, tank_volume = volume,
     t_initial=startTemp)
-    g.setAmbTemp(26)
-    g.setInletTemp(18)
+    g.setAmbTemp(ambTemp)
+    g.setInletTemp(inletTemp)
     return g
 
+def Conditions(shape, t_amb=None, t_inlet=None):
+    '''
+    Ambient and inlet temperatures for every step of a simulation.
+
+    Args:
+        shape (tuple):
+            Shape of the simulation steps, e.g. (days, minutes).
+        t_amb, t_inlet (float, array or None):
+            Temperatures broadcastable to shape. None leaves the geyser's
+            own value unchanged.
+
+    Returns:
+        ambient, inlet (array[shape] or None):
+            Temperature per step, or None where the argument is None (so the
+            simulation can skip setting it).
+    '''
+    out = []
+    for temps in (t_amb, t_inlet):
+        if(temps is None):
+            out.append(None)
+        else:
+            out.append(np.broadcast_to(np.asarray(temps, dtype=float), shape))
+    return out[0], out[1]
+
+def TemperatureProfile(tStamp, mean=17, annual_amplitude=5.5, daily_amplitude=0,
+                       coldest_day=196, warmest_hour=15):
+    '''
+    Seasonal (and optionally daily) temperature profile, e.g. for the ambient
+    temperature around a geyser. Defaults are indicative values for
+    Stellenbosch (coldest mid July); measured air temperature can be used
+    instead (e.g. "Weather_Funcs.MapToDays" 'temp_air').
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps of the simulation steps.
+        mean (float):
+            Annual mean temperature (C).
+        annual_amplitude (float):
+            Half the difference between the warmest and coldest day (C).
+        daily_amplitude (float):
+            Half the difference between day and night (C).
+        coldest_day (int):
+            Day of the year with the lowest temperature.
+        warmest_hour (float):
+            Hour of the day with the highest temperature.
+
+    Returns:
+        temps (array[days,slots]):
+            Temperature per step (C).
+    '''
+    times = tm.To_Datetime64(tStamp)
+    dayOfYear = (times - times.astype('datetime64[Y]'))/np.timedelta64(1, 'D')
+    hour = (times - times.astype('datetime64[D]'))/np.timedelta64(1, 'h')
+    temps = (mean - annual_amplitude*np.cos(2*np.pi*(dayOfYear - coldest_day)/365.25)
+             + daily_amplitude*np.cos(2*np.pi*(hour - warmest_hour)/24))
+    return temps.reshape(np.shape(tStamp))
+
+def InletFromAmbient(t_amb, days=30):
+    '''
+    Mains water (inlet) temperature as the running mean of the ambient
+    temperature over the previous days, which damps and delays the seasonal
+    swing as buried pipes do.
+
+    Args:
+        t_amb (array[days,slots]):
+            Ambient temperature per step.
+        days (int):
+            Length of the running mean in days.
+
+    Returns:
+        t_inlet (array[days,slots]):
+            Inlet temperature per step.
+    '''
+    t_amb = np.asarray(t_amb, dtype=float)
+    flat = t_amb.ravel()
+    w = min(days*t_amb.shape[-1], flat.size)
+    total = np.cumsum(flat)
+    inlet = np.empty_like(flat)
+    inlet[:w] = total[:w]/np.arange(1, w + 1)
+    inlet[w:] = (total[w:] - total[:-w])/w
+    return inlet.reshape(t_amb.shape)
+
 def Runner(Filename):
     '''
     Function to run specified .csv file and return minute by minute date per day
@@ -62,14 +146,13 @@ def Runner(Filename):
 
     new_time = [start + dt.timedelta(minutes=x) for x in range(0, round((end-start).total_seconds()/60))]
     full_vol = np.zeros(len(new_time))
-    #Populate volumes in appropriate place
-    full_vol[0] = volume[0]
-    for i in range(len(volume)):
-        try:
-            if i > 0:
-                full_vol[int(math.ceil((time[i]-time[0])/60))] = volume[i] # index = time from start (mins)
-        except:
-            pass
+    #Populate volumes in appropriate place (index = time from start (mins)),
+    #ignoring samples that fall outside the minute slots
+    time = np.array(time)
+    volume = np.array(volume)
+    index = np.ceil((time - time[0])/60).astype(int)
+    inRange = (index >= 0) & (index < full_vol.size)
+    full_vol[index[inRange]] = volume[inRange]
 
     for i in range(full_vol.size):
         #get current timestamp
@@ -93,7 +176,7 @@ def Runner(Filename):
 
     return tstamp, vol
 
-def Simulator(geyser_vol):
+def Simulator(geyser_vol, Geyser=None, t_amb=None, t_inlet=None):
     '''
     Simulator used with "Runner" method. Returned volume from Runner is used
     to calculate energy usage with water consumption pattern in a geyser with
@@ -102,6 +185,15 @@ def Simulator(geyser_vol):
     Args:
         geyser_vol (array[days, minutes]):
             Array containing water consumption data per day, per minute.
+        Geyser (ewhModel_one):
+            Geyser to simulate, e.g. one carried over from a previous chunk
+            of data. A new geyser from "SetupGeyser" is used if None.
+        t_amb (float or array[days, minutes]):
+            Ambient temperature per minute (see "TemperatureProfile"). None
+            keeps the geyser's fixed ambient temperature.
+        t_inlet (float or array[days, minutes]):
+            Inlet water temperature per minute. None keeps the geyser's
+            fixed inlet temperature.
 
     Returns:
         energy (array[days, minutes]):
@@ -109,7 +201,8 @@ def Simulator(geyser_vol):
         temp (array[days, minutes]):
             Array containing temperature in geyser per day, per minute.
     '''
-    Geyser = SetupGeyser()
+    if(Geyser is None):
+        Geyser = SetupGeyser()
     energy = np.zeros_like(geyser_vol)
     temp = np.zeros_like(geyser_vol)
     Geyser_Rating = 2 # kW
@@ -118,26 +211,32 @@ def Simulator(geyser_vol):
     SET_TEMP = 70
     HIGH_RAIL = SET_TEMP+2
     LOW_RAIL = SET_TEMP-2
+    ambient, inlet = Conditions(geyser_vol.shape, t_amb, t_inlet)
+    decay = Geyser.decayFactor(Run_Time*60) # same for every step
 
     for i in range(geyser_vol.shape[0]): # Days
         for j in range(geyser_vol.shape[1]): # minutes
+            if(ambient is not None):
+                Geyser.setAmbTemp(ambient[i,j])
+            if(inlet is not None):
+                Geyser.setInletTemp(inlet[i,j])
             Geyser.stepVolume(geyser_vol[i,j])
             currTemp = Geyser.getOutletTemp()
 
             if(currTemp >= HIGH_RAIL):
                 Geyser.GeyserOn = False
-                Geyser.stepTimeDecay(Run_Time*60)
+                Geyser.stepTimeDecay(Run_Time*60, decay)
 
             elif(currTemp >= LOW_RAIL and currTemp < HIGH_RAIL):
                 if(Geyser.GeyserOn == True):
-                    Geyser.stepTime(Run_Time*60, Geyser_Rating)
+                    Geyser.stepTime(Run_Time*60, Geyser_Rating, decay)
                     total += Geyser_Rating
                 else:
-                    Geyser.stepTimeDecay(Run_Time*60)
+                    Geyser.stepTimeDecay(Run_Time*60, decay)
 
             elif(currTemp <= LOW_RAIL):
                 Geyser.GeyserOn = True
-                Geyser.stepTime(Run_Time*60, Geyser_Rating)
+                Geyser.stepTime(Run_Time*60, Geyser_Rating, decay)
                 total += Geyser_Rating
 
             energy[i,j] = total
@@ -148,7 +247,123 @@ def Simulator(geyser_vol):
 
     return energy, temp
 
-def BiGeyser(volume, tStamps, excess):
+def BiGeyserStep(gModel, date, volume, excess, GeyserOn, step_sec=300, decay=None):
+    '''
+    One step of the "BiGeyser" control: draw the volume, then decide whether
+    the element runs from the grid, from excess solar or not at all, and step
+    the geyser for that. Used by "BiGeyser" over historical arrays and by
+    "Live_Funcs" on live readings.
+
+    Args:
+        gModel (ewhModel_one):
+            Geyser to step (changed in place).
+        date (datetime):
+            Time of the step.
+        volume (float):
+            Water drawn in the step (litres).
+        excess (float):
+            Solar power available to the geyser (kW).
+        GeyserOn (bool):
+            Thermostat state before the step.
+        step_sec (int):
+            Step length in seconds.
+        decay (float):
+            gModel.decayFactor(step_sec), computed once by the caller for a
+            run of steps (None computes it for this step).
+
+    Returns:
+        currTemp (float):
+            Outlet temperature after the draw, before heating.
+        mains (float):
+            Element power from the grid (kW).
+        solar (float):
+            Element power from solar (kW).
+        GeyserOn (bool):
+            Thermostat state after the step.
+    '''
+    G_RATING=2 # kW
+    SET_TEMP = 60
+    LOW_RAIL = SET_TEMP-2
+    mains = 0.0
+    solar = 0.0
+
+    gModel.stepVolume(volume)
+    currTemp = gModel.getOutletTemp()
+    # remove seconds from timestamp
+    #date -= dt.timedelta(seconds=date.time().second)
+    stepAmount = 0
+    if(excess > 0):
+        if(excess > 2):
+            stepAmount=2
+        else:
+            stepAmount=excess
+
+    if(date.time() >= dt.time(hour=2, minute=0) and date.time() < dt.time(hour=6,minute=0)): # Pre Heat condition
+        if(currTemp < LOW_RAIL):
+            GeyserOn = True
+            gModel.stepTime(step_sec, G_RATING, decay) # Run Geyser for 5 mins
+            mains += G_RATING
+
+        elif(currTemp >= LOW_RAIL and currTemp < SET_TEMP):
+            if(GeyserOn == True):
+                gModel.stepTime(step_sec, G_RATING, decay) # Run Geyser for 5 mins
+                mains += G_RATING
+            if(GeyserOn == False):
+                gModel.stepTimeDecay(step_sec, decay) # Decay
+
+        elif(currTemp > SET_TEMP):
+            GeyserOn = False
+            gModel.stepTimeDecay(step_sec, decay) # Temp decay for 5 mins
+
+    elif(date.time() >= dt.time(hour=6,minute=0)): # If in scheduled time slot
+
+        if(currTemp < 48): # temp < 48
+            if(excess > 0):
+                gModel.stepTime(step_sec, stepAmount, decay)
+                solar += stepAmount
+            else:
+                GeyserOn = True
+                gModel.stepTime(step_sec, G_RATING, decay)
+                mains += G_RATING
+
+        elif(currTemp >= 87):
+            gModel.stepTimeDecay(step_sec, decay)
+            if(GeyserOn==True):
+                GeyserOn=False
+
+        elif(currTemp >= 83):
+            if(excess > 0): # if solar supply
+                gModel.stepTime(step_sec, stepAmount, decay)
+                solar += stepAmount
+            else: # no solar supply
+                gModel.stepTimeDecay(step_sec, decay)
+
+        elif(currTemp >= 52 and currTemp < 83):
+            if(excess > 0):
+                gModel.stepTime(step_sec, stepAmount, decay)
+                solar += stepAmount
+            else:
+                gModel.stepTimeDecay(step_sec, decay)
+                GeyserOn = False
+
+        elif(currTemp >= 48 and currTemp < 52):
+            if(excess > 0):
+                gModel.stepTime(step_sec, stepAmount, decay)
+                solar += stepAmount
+            else:
+                if(GeyserOn):
+                    gModel.stepTime(step_sec, G_RATING, decay)
+                    mains += G_RATING
+                else:
+                    gModel.stepTimeDecay(step_sec, decay)
+
+
+    else:
+        gModel.stepTimeDecay(step_sec, decay) # Temp decay for 5 mins
+
+    return currTemp, mains, solar, GeyserOn
+
+def BiGeyser(volume, tStamps, excess, gModel=None, t_amb=None, t_inlet=None):
     '''
     Simulates operation of duel thermostat geyser set to 50 degrees (C) with max
     limit of 85 degrees (C) with solar supply.
@@ -165,6 +380,15 @@ def BiGeyser(volume, tStamps, excess):
         excess (array[days,5min_intervals]):
             Array containing solar energy available to geyser per day, per 5 min
             interval.
+        gModel (ewhModel_one):
+            Geyser to simulate, e.g. one carried over from a previous chunk
+            of data. A new geyser from "SetupGeyser" is used if None.
+        t_amb (float or array[days,5min_intervals]):
+            Ambient temperature per interval. None keeps the geyser's fixed
+            ambient temperature.
+        t_inlet (float or array[days,5min_intervals]):
+            Inlet water temperature per interval. None keeps the geyser's
+            fixed inlet temperature.
 
     Returns:
         mains (array[days,5min_intervals]):
@@ -174,18 +398,10 @@ def BiGeyser(volume, tStamps, excess):
         gTemp:
             Geyser temperature data per day, per 5 min interval.
     '''
-    gModel = SetupGeyser()
-    GeyserOn = False
+    if(gModel is None):
+        gModel = SetupGeyser()
+    GeyserOn = gModel.GeyserOn
     NUM_MINS=5
-    G_RATING=2 # kW
-
-    SET_TEMP = 60
-    LOW_RAIL = SET_TEMP-2
-    HIGH_RAIL = SET_TEMP+2
-
-    SET_TEMP_2 = 50
-    HIGH_RAIL_2 = SET_TEMP_2 + 2
-    LOW_RAIL_2 = SET_TEMP_2 - 2
 
     mains = []
     solar = []
@@ -195,91 +411,23 @@ def BiGeyser(volume, tStamps, excess):
     solar_collector = []
     tcollect = []
 
-    mains_total = 0.0
-    solar_total = 0.0
+    ambient, inlet = Conditions(volume.shape, t_amb, t_inlet)
+    decay = gModel.decayFactor(NUM_MINS*60) # same for every step
 
     for i in range(volume.shape[0]): # Days
         for j in range(volume.shape[1]): # 5 min interval
             date = tStamps[i,j]
-            gModel.stepVolume(volume[i,j])
-            currTemp = gModel.getOutletTemp()
+            if(ambient is not None):
+                gModel.setAmbTemp(ambient[i,j])
+            if(inlet is not None):
+                gModel.setInletTemp(inlet[i,j])
+            currTemp, mains_total, solar_total, GeyserOn = BiGeyserStep(gModel, date, volume[i,j],
+                                                                        excess[i,j], GeyserOn, NUM_MINS*60,
+                                                                        decay)
             tcollect.append(currTemp)
-            # remove seconds from timestamp
-            #date -= dt.timedelta(seconds=date.time().second)
-            stepAmount = 0
-            if(excess[i,j] > 0):
-                if(excess[i,j] > 2):
-                    stepAmount=2
-                else:
-                    stepAmount=excess[i,j]
-
-            if(date.time() >= dt.time(hour=2, minute=0) and date.time() < dt.time(hour=6,minute=0)): # Pre Heat condition
-                if(currTemp < LOW_RAIL):
-                    GeyserOn = True
-                    gModel.stepTime(NUM_MINS*60, G_RATING) # Run Geyser for 5 mins
-                    mains_total += G_RATING
-
-                elif(currTemp >= LOW_RAIL and currTemp < SET_TEMP):
-                    if(GeyserOn == True):
-                        gModel.stepTime(NUM_MINS*60, G_RATING) # Run Geyser for 5 mins
-                        mains_total += G_RATING
-                    if(GeyserOn == False):
-                        gModel.stepTimeDecay(NUM_MINS*60) # Decay
-
-                elif(currTemp > SET_TEMP):
-                    GeyserOn = False
-                    gModel.stepTimeDecay(5*60) # Temp decay for 5 mins
-
-            elif(date.time() >= dt.time(hour=6,minute=0)): # If in scheduled time slot
-
-                if(currTemp < 48): # temp < 48
-                    if(excess[i,j] > 0):
-                        gModel.stepTime(NUM_MINS*60, stepAmount)
-                        solar_total += stepAmount
-                    else:
-                        GeyserOn = True
-                        gModel.stepTime(NUM_MINS*60, G_RATING)
-                        mains_total += G_RATING
-
-                elif(currTemp >= 87):
-                    gModel.stepTimeDecay(NUM_MINS*60)
-                    if(GeyserOn==True):
-                        GeyserOn=False
-
-                elif(currTemp >= 83):
-                    if(excess[i,j] > 0): # if solar supply
-                        gModel.stepTime(NUM_MINS*60, stepAmount)
-                        solar_total += stepAmount
-                    else: # no solar supply
-                        gModel.stepTimeDecay(NUM_MINS*60)
-
-                elif(currTemp >= 52 and currTemp < 83):
-                    if(excess[i,j] > 0):
-                        gModel.stepTime(NUM_MINS*60, stepAmount)
-                        solar_total += stepAmount
-                    else:
-                        gModel.stepTimeDecay(NUM_MINS*60)
-                        GeyserOn = False
-
-                elif(currTemp >= 48 and currTemp < 52):
-                    if(excess[i,j] > 0):
-                        gModel.stepTime(NUM_MINS*60, stepAmount)
-                        solar_total += stepAmount
-                    else:
-                        if(GeyserOn):
-                            gModel.stepTime(NUM_MINS*60, G_RATING)
-                            mains_total += G_RATING
-                        else:
-                            gModel.stepTimeDecay(NUM_MINS*60)
-
-
-            else:
-                gModel.stepTimeDecay(NUM_MINS*60) # Temp decay for 5 mins
 
             mains_collector.append(mains_total)
             solar_collector.append(solar_total)
-            mains_total = 0
-            solar_total = 0
 
         mains.append(mains_collector)
         solar.append(solar_collector)
@@ -288,6 +436,8 @@ def BiGeyser(volume, tStamps, excess):
         solar_collector = []
         tcollect = []
 
+    gModel.GeyserOn = GeyserOn # keep thermostat state for the next chunk
+
     mains = np.array(mains)
     solar = np.array(solar)
     gTemp = np.array(gTemp)
@@ -299,10 +449,15 @@ def BiGeyser(volume, tStamps, excess):
 def PrintSched(Filename):
     '''
     Basic method for printing out .csv geyser water consumption schedule
+    (see "DrawEvents" for extracting events from "Runner" data)
 
     args:
         Filename (string):
             Of the form 'Filename.csv'.
+
+    Returns:
+        volumeTotals (list):
+            Volume consumed in each operation slot.
     '''
     volumeTotals = []
 
@@ -332,15 +487,102 @@ def PrintSched(Filename):
                 indexFlag=False
                 volumeTotals.append(totalVolume)
 
+    return volumeTotals
+
+EVENT_DTYPE = [('start', 'datetime64[m]'), ('end', 'datetime64[m]'),
+               ('duration', np.int64), ('volume', float), ('day', np.int64),
+               ('hour', np.int64)]
+
+def DrawEvents(tstamp, vol, max_gap=0):
+    '''
+    Extract hot water draw events from minute volume data (from "Runner").
+
+    An event is a run of minutes with volume > 0; runs separated by at most
+    max_gap empty minutes are merged in to one event.
+
+    Args:
+        tstamp (array[days,minutes]):
+            Timestamps for volume data.
+        vol (array[days,minutes]):
+            Water consumption per minute.
+        max_gap (int):
+            Longest run of empty minutes inside one event.
+
+    Returns:
+        events (structured array[events]):
+            'start', 'end' (first minute after the event), 'duration'
+            (minutes), 'volume' (litres), 'day' (row of tstamp/vol) and
+            'hour' (hour of day the event starts), in time order.
+    '''
+    times = tm.To_Datetime64(tstamp).astype('datetime64[m]')
+    flat = np.asarray(vol, dtype=float).ravel()
+    minutes = np.shape(vol)[1]
+
+    drawing = np.concatenate(([False], flat > 0, [False]))
+    edges = np.flatnonzero(drawing[1:] != drawing[:-1])
+    starts = edges[0::2]
+    ends = edges[1::2] # exclusive
+
+    if(max_gap > 0 and starts.size > 1):
+        keep = np.concatenate(([True], starts[1:] - ends[:-1] > max_gap))
+        starts = starts[keep]
+        ends = ends[np.concatenate((keep[1:], [True]))]
+
+    events = np.empty(starts.size, dtype=EVENT_DTYPE)
+    events['start'] = times[starts]
+    events['end'] = times[ends - 1] + np.timedelta64(1, 'm')
+    events['duration'] = ends - starts
+    total = np.concatenate(([0], np.cumsum(flat)))
+    events['volume'] = total[ends] - total[starts]
+    events['day'] = starts // minutes
+    events['hour'] = (times[starts] - times[starts].astype('datetime64[D]')).astype('timedelta64[h]').astype(np.int64)
+    return events
+
+def EventIndex(events, days):
+    '''
+    Index draw events by day and by hour of day.
+
+    Args:
+        events (structured array[events]):
+            Output of "DrawEvents".
+        days (int):
+            Number of days in the data (rows of tstamp/vol).
+
+    Returns:
+        index (dict):
+            'day_start' (array[days+1]): events of day d are
+            events[day_start[d]:day_start[d+1]],
+            'hour_order', 'hour_start' (array[25]): events starting in hour h
+            are events[hour_order[hour_start[h]:hour_start[h+1]]],
+            'count' (array[days,24]): events starting per day and hour,
+            'volume' (array[days,24]): volume of those events (litres).
+    '''
+    dayStart = np.searchsorted(events['day'], np.arange(days + 1))
+    hourOrder = np.argsort(events['hour'], kind='stable')
+    hourStart = np.searchsorted(events['hour'][hourOrder], np.arange(25))
+    cell = events['day']*24 + events['hour']
+    count = np.bincount(cell, minlength=days*24).reshape(days, 24)
+    volume = np.bincount(cell, weights=events['volume'], minlength=days*24).reshape(days, 24)
+    return {'day_start': dayStart, 'hour_order': hourOrder, 'hour_start': hourStart,
+            'count': count, 'volume': volume}
+
 def findFirstDate(dateArray, keyDate):
     '''
     Function to find start first date in array - used in matching array starts
     and ends
+
+    Args:
+        dateArray (array[1,n]):
+            Unix timestamps (seconds, UTC).
+        keyDate (datetime):
+            Date to look for.
+
+    Returns:
+        index (int):
+            Index of the first timestamp on keyDate (None if not found).
     '''
-    for i in range(dateArray.shape[1]):
-        print("Current: %s"%dt.datetime.utcfromtimestamp(dateArray[0,i]).date())
-        print("Looking for: %s"%keyDate.date())
-        if  dt.datetime.utcfromtimestamp(dateArray[0,i]).date() == keyDate.date():
-            return i
-        else: pass
+    days = np.asarray(dateArray[0], dtype=np.int64) // (24*60*60) # days since 1970
+    found = np.flatnonzero(days == (keyDate.date() - dt.date(1970, 1, 1)).days)
+    if(found.size):
+        return int(found[0])
     print("Error: Did not find date")
@@ -0,0 +1,179 @@
+"""
+The ``Intervention_Funcs`` module contains composable load interventions
+(solar offset, LED retrofit, time shift, added loads) that change energy
+arrays of shape (days, slots) in place with numpy operations, at any
+resolution (24 hourly slots, 288 five-minute slots, ...).
+
+Example:
+    energy, extras = ApplyInterventions(load, [LEDRetrofit(2.9),
+                                               AddLoad(geyser),
+                                               SolarOffset(solar)])
+    excess = extras['SolarOffset']
+"""
+
+import numpy as np
+
+def Resample(data, slots, how='sum'):
+    '''
+    Change the number of slots per day of a (..., days, slots) array.
+
+    Args:
+        data (array[...,days,slots]):
+            Data to resample.
+        slots (int):
+            Slots per day wanted. Must divide, or be a multiple of, the
+            current slots per day.
+        how (string):
+            'sum' (energy), 'mean' (power, temperature) when reducing;
+            'split' (energy, divided equally) or 'repeat' (power,
+            temperature) when increasing the slots.
+
+    Returns:
+        resampled (array[...,days,slots]):
+            Resampled data.
+    '''
+    data = np.asarray(data)
+    current = data.shape[-1]
+    if(slots == current):
+        return data
+    if(slots < current):
+        if(current % slots):
+            raise ValueError("Cannot reduce %d slots to %d"%(current, slots))
+        grouped = data.reshape(data.shape[:-1] + (slots, current//slots))
+        if(how == 'sum'):
+            return grouped.sum(axis=-1)
+        if(how == 'mean'):
+            return grouped.mean(axis=-1)
+    else:
+        if(slots % current):
+            raise ValueError("Cannot increase %d slots to %d"%(current, slots))
+        repeated = np.repeat(data, slots//current, axis=-1)
+        if(how == 'repeat'):
+            return repeated
+        if(how == 'split'):
+            return repeated / (slots//current)
+    raise ValueError("Unknown resample method '%s'"%how)
+
+class SolarOffset:
+    '''
+    Supply load from solar energy: energy = max(energy - solar, 0).
+
+    Args:
+        solar (array[days,slots]):
+            Solar energy per slot, in the same units and resolution as the
+            energy it is applied to.
+    '''
+
+    def __init__(self, solar):
+        self.solar = np.asarray(solar)
+
+    def apply(self, energy):
+        '''
+        Subtract solar from energy in place.
+
+        Returns:
+            excess (array[days,slots]):
+                Solar energy left over after supplying the load.
+        '''
+        np.subtract(energy, self.solar, out=energy)
+        excess = np.negative(energy)
+        np.maximum(excess, 0, out=excess)
+        np.maximum(energy, 0, out=energy)
+        return excess
+
+class LEDRetrofit:
+    '''
+    Replace lights by LEDs: a constant reduction in power while lights are on.
+
+    Args:
+        delta_kw (float or array[slots]):
+            Reduction in power (kW), either constant or per slot of the day
+            (e.g. 0 where lights are off).
+        floor (float):
+            Lowest energy allowed after the change (None for no limit).
+    '''
+
+    def __init__(self, delta_kw, floor=None):
+        self.delta_kw = np.asarray(delta_kw, dtype=float)
+        self.floor = floor
+
+    def apply(self, energy):
+        '''
+        Subtract the LED saving from energy (kWh per slot) in place. The slot
+        length is taken from the number of slots per day.
+        '''
+        slot_hours = 24/energy.shape[-1]
+        np.subtract(energy, self.delta_kw*slot_hours, out=energy)
+        if(self.floor is not None):
+            np.maximum(energy, self.floor, out=energy)
+
+class TimeShift:
+    '''
+    Shift values later (positive slots) or earlier (negative slots) within
+    each day, filling the vacated slots with fill.
+
+    Args:
+        slots (int):
+            Slots to shift by.
+        fill (float):
+            Value for slots shifted in from outside the day.
+    '''
+
+    def __init__(self, slots, fill=0):
+        self.slots = int(slots)
+        self.fill = fill
+
+    def apply(self, energy):
+        '''Shift energy in place.'''
+        k = self.slots
+        if(k > 0):
+            energy[..., k:] = energy[..., :-k]
+            energy[..., :k] = self.fill
+        elif(k < 0):
+            energy[..., :k] = energy[..., -k:]
+            energy[..., k:] = self.fill
+
+class AddLoad:
+    '''
+    Add a load (e.g. geyser energy) to the energy.
+
+    Args:
+        load (array[days,slots]):
+            Energy to add, same units and resolution as the energy.
+    '''
+
+    def __init__(self, load):
+        self.load = np.asarray(load)
+
+    def apply(self, energy):
+        '''Add the load to energy in place.'''
+        np.add(energy, self.load, out=energy)
+
+def ApplyInterventions(energy, interventions, inplace=False):
+    '''
+    Apply interventions one after the other.
+
+    Args:
+        energy (array[...,days,slots]):
+            Energy per slot. Leading axes (e.g. scenarios) are broadcast
+            against the intervention data.
+        interventions (list):
+            Intervention objects, applied in order.
+        inplace (bool):
+            Change energy itself instead of a float copy.
+
+    Returns:
+        energy (array[...,days,slots]):
+            Energy after all interventions.
+        extras (dict):
+            Values returned by interventions (e.g. excess solar from
+            SolarOffset), keyed by class name.
+    '''
+    if(not inplace):
+        energy = np.array(energy, dtype=float)
+    extras = {}
+    for step in interventions:
+        result = step.apply(energy)
+        if(result is not None):
+            extras[type(step).__name__] = result
+    return energy, extras
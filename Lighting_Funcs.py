@@ -0,0 +1,193 @@
+"""
+The ``Lighting_Funcs`` module contains a lighting model driven by a fixture
+inventory and occupancy schedules (per zone, weekday/weekend and hour). Any
+number of retrofit options (replacement fixture power, occupancy controls)
+are evaluated at once by broadcasting over an options axis, giving adjusted
+(options, days, slots) load arrays in one pass.
+
+Example:
+    options = [{'name': 'LED', 'watts': {'double': 14, 'single': 14}},
+               {'name': 'LED + sensors', 'watts': {'double': 14, 'single': 14},
+                'factor': 0.7}]
+    names, energy, saving = ApplyRetrofits(tStamp, load, options)
+"""
+
+import numpy as np
+import Time_Funcs as tm
+
+FIXTURE_DTYPE = [('zone', 'U32'), ('type', 'U32'), ('count', np.int64), ('watts', float)]
+
+# LaunchLab fixtures (as used by "Change_To_LEDs")
+LAUNCHLAB_INVENTORY = np.array([('main', 'double', 60, 43.0),
+                                ('main', 'single', 68, 60.0)], dtype=FIXTURE_DTYPE)
+
+WEEKDAY = 0
+WEEKEND = 1
+
+# Fraction of fixtures on per day type (weekday, weekend) and hour, per zone
+ALWAYS_ON = {'main': np.ones((2, 24))}
+# Indicative office occupancy: lights on 07:00-18:00 on weekdays, a few left
+# on otherwise. Replace with logged or surveyed schedules per zone.
+OFFICE_SCHEDULES = {'main': np.array([[0.05]*7 + [1.0]*11 + [0.05]*6,
+                                      [0.05]*24])}
+
+def Inventory(rows):
+    '''
+    Fixture inventory from (zone, type, count, watts) rows.
+
+    Returns:
+        inventory (structured array[fixtures]):
+            Fields 'zone', 'type', 'count' and 'watts' (per fixture).
+    '''
+    return np.array([tuple(r) for r in rows], dtype=FIXTURE_DTYPE)
+
+def DayTypes(tStamp):
+    '''
+    Day type (WEEKDAY or WEEKEND) and hour of day of every timestamp.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps (datetime64 or datetimes).
+
+    Returns:
+        dayType (array[days,slots]):
+            WEEKDAY or WEEKEND.
+        hour (array[days,slots]):
+            Hour of the day (0-23).
+    '''
+    times = tm.To_Datetime64(tStamp).reshape(np.shape(tStamp))
+    days = times.astype('datetime64[D]')
+    weekday = (days.astype(np.int64) + 3) % 7 # Monday = 0
+    hour = ((times - days) // np.timedelta64(1, 'h')).astype(np.int64)
+    return (weekday >= 5).astype(np.int64), hour
+
+def OnFraction(tStamp, schedules, zones):
+    '''
+    Fraction of fixtures on per zone and slot.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps.
+        schedules (dict):
+            array[2,24] per zone (weekday/weekend, hour).
+        zones (list):
+            Zones to return, in order.
+
+    Returns:
+        onFrac (array[zones,days,slots]):
+            Fraction on.
+    '''
+    dayType, hour = DayTypes(tStamp)
+    table = np.stack([np.asarray(schedules[z], dtype=float) for z in zones]) # zones, 2, 24
+    return table[:, dayType, hour]
+
+def RetrofitOptions(inventory, options):
+    '''
+    Arrays of fixture power and on-time factor per option and fixture.
+
+    Args:
+        inventory (structured array[fixtures]):
+            Fixture inventory.
+        options (list of dict):
+            'name', 'watts' (new power per fixture type; types not listed
+            are unchanged) and optionally 'factor' (fraction of the scheduled
+            on-time left, e.g. with occupancy sensors; a number or per zone).
+
+    Returns:
+        names (list):
+            Option names.
+        watts (array[options,fixtures]):
+            Power per fixture (W).
+        factor (array[options,fixtures]):
+            On-time factor per fixture.
+    '''
+    names = []
+    watts = np.tile(inventory['watts'], (len(options), 1))
+    factor = np.ones_like(watts)
+    for i, opt in enumerate(options):
+        names.append(opt.get('name', 'option %d'%i))
+        for ftype, w in opt.get('watts', {}).items():
+            watts[i, inventory['type'] == ftype] = w
+        f = opt.get('factor', 1.0)
+        if(isinstance(f, dict)):
+            for zone, zf in f.items():
+                factor[i, inventory['zone'] == zone] = zf
+        else:
+            factor[i] = f
+    return names, watts, factor
+
+def LightingEnergy(tStamp, inventory, schedules, watts=None, factor=None):
+    '''
+    Lighting energy per slot, for the inventory as is or for options.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps.
+        inventory (structured array[fixtures]):
+            Fixture inventory.
+        schedules (dict):
+            Schedule per zone (see "OnFraction").
+        watts (array[...,fixtures]):
+            Power per fixture per option (default the inventory power).
+        factor (array[...,fixtures]):
+            On-time factor per fixture per option (default 1).
+
+    Returns:
+        energy (array[...,days,slots]):
+            Lighting energy per slot (kWh).
+    '''
+    slot_hours = 24/np.shape(tStamp)[1]
+    zones, zoneIdx = np.unique(inventory['zone'], return_inverse=True)
+    onFrac = OnFraction(tStamp, schedules, list(zones))
+    if(watts is None):
+        watts = inventory['watts']
+    if(factor is None):
+        factor = 1.0
+    perFixture = inventory['count']*np.asarray(watts, dtype=float)*factor # W when all on
+    perFixture = np.broadcast_to(perFixture, np.broadcast_shapes(perFixture.shape, zoneIdx.shape))
+    # Sum fixtures per zone, then one product over zones for every option
+    perZone = np.zeros(perFixture.shape[:-1] + (zones.size,))
+    np.add.at(np.moveaxis(perZone, -1, 0), zoneIdx, np.moveaxis(perFixture, -1, 0))
+    return np.tensordot(perZone, onFrac, axes=(-1, 0))*slot_hours/1000
+
+def ApplyRetrofits(tStamp, energy, options, inventory=LAUNCHLAB_INVENTORY,
+                   schedules=OFFICE_SCHEDULES, clip=True):
+    '''
+    Building load after each retrofit option.
+
+    The saving in every slot is the scheduled lighting energy before less
+    after the retrofit, so nothing is saved when the lights are off. Where
+    the saving is more than the measured load, the load is set to zero
+    (unless clip is False).
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps of the load.
+        energy (array[days,slots]):
+            Measured building load per slot (kWh).
+        options (list of dict):
+            Retrofit options (see "RetrofitOptions").
+        inventory (structured array[fixtures]):
+            Fixture inventory.
+        schedules (dict):
+            Schedule per zone (see "OnFraction").
+        clip (bool):
+            Set the load to zero where the saving is more than the load.
+            False subtracts the full saving everywhere.
+
+    Returns:
+        names (list):
+            Option names.
+        newEnergy (array[options,days,slots]):
+            Load after each option (kWh).
+        saving (array[options,days,slots]):
+            Energy saved per slot (kWh).
+    '''
+    energy = np.asarray(energy, dtype=float)
+    names, watts, factor = RetrofitOptions(inventory, options)
+    before = LightingEnergy(tStamp, inventory, schedules)
+    after = LightingEnergy(tStamp, inventory, schedules, watts, factor)
+    newEnergy = energy - (before - after)
+    if(clip):
+        newEnergy = np.maximum(newEnergy, 0)
+    return names, newEnergy, energy - newEnergy
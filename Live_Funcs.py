@@ -0,0 +1,394 @@
+"""
+The ``Live_Funcs`` module contains an asyncio live-control mode for the
+"BiGeyser" control logic. Meter readings (water volume, building load and
+solar power per geyser) arrive from an async source, such as a tailed file
+or a local socket standing in for the meters; every reading steps that
+geyser's "ewhModel_one" with "Geyser_Funcs.BiGeyserStep" and emits the
+element decision (grid, solar or off) with its latency. One event loop runs
+hundreds of geysers, since a tick takes microseconds and sources never
+block the loop.
+
+Readings are JSON lines or CSV lines 'id,time,volume,load,solar':
+    {"id": "g1", "time": "2019-05-01T06:05", "volume": 4.0, "load": 12.5, "solar": 14.0}
+with volume in litres and load and solar in kW. 'time' is local time, or
+unix seconds or a time with a UTC offset (converted to SITE_TZ); 'excess'
+(kW available to the geyser) may be given instead of load and solar, and
+'t_amb'/'t_inlet' set the geyser's ambient and inlet temperatures. A line
+that cannot be parsed gives an error decision and the source keeps reading.
+
+Usage:
+    python Live_Funcs.py --tail readings.jsonl
+    python Live_Funcs.py --port 8766 --out decisions.jsonl
+"""
+
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import datetime as dt
+from dateutil import tz
+import numpy as np
+import Geyser_Funcs as gf
+import Time_Funcs as tm
+
+READING_FIELDS = ('id', 'time', 'volume', 'load', 'solar')
+ELEMENT_STATES = ('off', 'grid', 'solar')
+SITE_TZ = tz.gettz('Africa/Johannesburg') # local time of the geysers
+
+def ParseTime(value, zone=SITE_TZ):
+    '''
+    Reading time (ISO string, unix seconds or datetime) as a naive datetime
+    in the site's local time, which the "BiGeyser" pre-heat window uses.
+    Unix seconds and times with a UTC offset are converted to zone; naive
+    times are taken as local already.
+    '''
+    if(isinstance(value, str) and value.strip().replace('.', '', 1).isdigit()):
+        value = float(value) # unix seconds in a CSV line
+    if(isinstance(value, (int, float))):
+        return dt.datetime.fromtimestamp(value, zone).replace(tzinfo=None)
+    if(not isinstance(value, dt.datetime)):
+        value = dt.datetime.fromisoformat(str(value))
+    if(value.tzinfo is not None):
+        value = value.astimezone(zone)
+    return value.replace(tzinfo=None)
+
+def ParseReading(line):
+    '''
+    Reading from a JSON or CSV line.
+
+    Returns:
+        reading (dict):
+            'id', 'time' (datetime), 'volume' and either 'excess' or 'load'
+            and 'solar', plus 'received' (time.perf_counter() on arrival).
+            None for blank lines and CSV headers.
+    '''
+    line = line.strip()
+    if(not line or line.startswith('id,')):
+        return None
+    if(line.startswith('{')):
+        reading = json.loads(line)
+    else:
+        reading = dict(zip(READING_FIELDS, line.split(',')))
+        for key in READING_FIELDS[2:]:
+            if(key in reading):
+                reading[key] = float(reading[key])
+    reading['id'] = str(reading['id'])
+    reading['time'] = ParseTime(reading['time'])
+    reading['received'] = time.perf_counter()
+    return reading
+
+def _ParseLine(line):
+    '''
+    "ParseReading" for a source: a line that cannot be parsed (bad JSON, a
+    non-numeric field, no 'time') gives {'id': None, 'error', 'line'}
+    instead of raising, so one bad line does not stop the source.
+    '''
+    try:
+        if(isinstance(line, bytes)):
+            line = line.decode()
+        return ParseReading(line)
+    except (ValueError, KeyError, TypeError, OverflowError, OSError) as e:
+        if(isinstance(line, bytes)):
+            line = line.decode(errors='replace')
+        return {'id': None, 'error': '%s: %s'%(type(e).__name__, e), 'line': line.strip()}
+
+#--------------------Sources------------------#
+async def FileSource(Filename, follow=True, poll=0.2, from_start=True):
+    '''
+    Readings from a file, optionally following it as lines are appended
+    (like 'tail -f').
+
+    Args:
+        Filename (string):
+            JSON or CSV lines file.
+        follow (bool):
+            Keep waiting for new lines at the end of the file.
+        poll (float):
+            Seconds between checks for new lines.
+        from_start (bool):
+            Read the lines already in the file first (else only new ones).
+    '''
+    with open(Filename) as f:
+        if(not from_start):
+            f.seek(0, 2)
+        partial = ''
+        while(True):
+            line = f.readline()
+            if(not line):
+                if(not follow):
+                    break
+                await asyncio.sleep(poll)
+                continue
+            if(not line.endswith('\n')): # line still being written
+                partial += line
+                continue
+            reading = _ParseLine(partial + line)
+            partial = ''
+            if(reading is not None):
+                yield reading
+        if(partial):
+            reading = _ParseLine(partial)
+            if(reading is not None):
+                yield reading
+
+async def SocketSource(host='127.0.0.1', port=8766, queue_size=10000, ready=None):
+    '''
+    Readings sent as lines by any number of clients to a local TCP socket.
+
+    Args:
+        host, port:
+            Address to listen on (port 0 picks a free port).
+        queue_size (int):
+            Readings buffered before clients are slowed down.
+        ready (asyncio.Future):
+            Set to the listening address once the server is up.
+    '''
+    queue = asyncio.Queue(queue_size)
+
+    async def client(reader, writer):
+        try:
+            while(True):
+                line = await reader.readline()
+                if(not line):
+                    break
+                reading = _ParseLine(line)
+                if(reading is not None):
+                    await queue.put(reading)
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(client, host, port)
+    if(ready is not None):
+        ready.set_result(server.sockets[0].getsockname()[:2])
+    try:
+        while(True):
+            yield await queue.get()
+    finally:
+        server.close()
+        await server.wait_closed()
+
+async def ArraySource(tStamps, volume, load=None, solar=None, excess=None, ids=None,
+                      interval=None):
+    '''
+    Replay arrays as readings, all geysers per time step (e.g. data from
+    "Runner" and "FiveMinSolarRunner").
+
+    Args:
+        tStamps (array[days,slots]):
+            Timestamps.
+        volume (array[geysers,days,slots]):
+            Water drawn per step (litres).
+        load, solar (array[geysers,days,slots]):
+            Building load and solar power (kW), broadcast over geysers.
+        excess (array[geysers,days,slots]):
+            Solar power available to the geysers (kW), instead of load and
+            solar.
+        ids (list):
+            Geyser ids (default '0', '1', ...).
+        interval (float):
+            Seconds to wait between time steps (None replays at once).
+    '''
+    volume = np.asarray(volume, dtype=float)
+    volume = volume.reshape((-1,) + np.shape(tStamps))
+    n = volume.shape[0]
+    if(excess is None):
+        excess = np.maximum(np.asarray(solar, dtype=float) - np.asarray(load, dtype=float), 0)
+    excess = np.broadcast_to(excess, volume.shape).reshape(n, -1)
+    volume = volume.reshape(n, -1)
+    times = tm.To_Datetime64(tStamps).astype(object)
+    if(ids is None):
+        ids = [str(g) for g in range(n)]
+    for k in range(times.size):
+        for g in range(n):
+            yield {'id': ids[g], 'time': times[k], 'volume': volume[g, k],
+                   'excess': excess[g, k], 'received': time.perf_counter()}
+        await asyncio.sleep(interval or 0) # let other tasks run between steps
+
+#--------------------Control------------------#
+class LatencyStats:
+    '''
+    Latency of the last size ticks (seconds) with percentiles.
+    '''
+
+    def __init__(self, size=100000):
+        self.values = np.zeros(size)
+        self.count = 0
+
+    def add(self, seconds):
+        self.values[self.count % self.values.size] = seconds
+        self.count += 1
+
+    def summary(self):
+        '''Ticks seen and latency 'mean', 'p50', 'p95', 'p99' and 'max' (ms).'''
+        data = self.values[:min(self.count, self.values.size)]*1000
+        if(data.size == 0):
+            return {'ticks': 0}
+        p50, p95, p99 = np.percentile(data, [50, 95, 99])
+        return {'ticks': self.count, 'mean': float(data.mean()), 'p50': float(p50),
+                'p95': float(p95), 'p99': float(p99), 'max': float(data.max())}
+
+def QuietGeyser():
+    '''"Geyser_Funcs.SetupGeyser" without the tank printout (one per geyser).'''
+    with contextlib.redirect_stdout(io.StringIO()):
+        return gf.SetupGeyser()
+
+class LiveController:
+    '''
+    Tank state and "BiGeyser" control for many geysers fed by live
+    readings. Geysers are created on their first reading.
+
+    Args:
+        step_sec (int):
+            Step length for a geyser's first reading (later steps use the
+            time since its previous reading).
+        setup (function):
+            Returns a new geyser model (default "QuietGeyser").
+        max_step_sec (int):
+            Longest step, so a gap in readings is not taken as one long step.
+    '''
+
+    def __init__(self, step_sec=300, setup=QuietGeyser, max_step_sec=3600):
+        self.step_sec = step_sec
+        self.setup = setup
+        self.max_step_sec = max_step_sec
+        self.geysers = {}
+        self.errors = 0
+        self.latency = LatencyStats()
+        self.tick_time = LatencyStats()
+
+    def tick(self, reading):
+        '''
+        Step one geyser with a reading.
+
+        Returns:
+            decision (dict):
+                'id', 'time', 'temp' (outlet temperature after the draw),
+                'element' ('grid', 'solar' or 'off'), 'mains' and 'solar'
+                (element power in kW), 'excess' (kW) and 'latency' (seconds
+                from arrival of the reading to the decision).
+        '''
+        start = time.perf_counter()
+        gid = reading['id']
+        state = self.geysers.get(gid)
+        if(state is None):
+            state = self.geysers[gid] = {'model': self.setup(), 'last': None}
+        model = state['model']
+        date = reading['time']
+        step = self.step_sec
+        if(state['last'] is not None):
+            seconds = (date - state['last']).total_seconds()
+            if(seconds <= 0):
+                raise ValueError("reading for '%s' at %s is not after %s"%(gid, date, state['last']))
+            step = min(seconds, self.max_step_sec)
+        state['last'] = date
+
+        excess = reading.get('excess')
+        if(excess is None):
+            excess = max(reading.get('solar', 0) - reading.get('load', 0), 0)
+        model.setConditions(reading.get('t_amb'), reading.get('t_inlet'))
+        currTemp, mains, solar, model.GeyserOn = gf.BiGeyserStep(model, date, reading.get('volume', 0),
+                                                                 excess, model.GeyserOn, step)
+
+        end = time.perf_counter()
+        latency = end - reading.get('received', start)
+        self.latency.add(latency)
+        self.tick_time.add(end - start)
+        return {'id': gid, 'time': date.isoformat(), 'temp': float(currTemp),
+                'element': ELEMENT_STATES[(mains > 0) + 2*(solar > 0)],
+                'mains': float(mains), 'solar': float(solar), 'excess': float(excess),
+                'latency': latency}
+
+    async def run(self, source, sink=None, yield_every=100):
+        '''
+        Consume a source until it ends (or the task is cancelled).
+
+        Args:
+            source (async iterator):
+                Readings, e.g. "FileSource", "SocketSource" or "ArraySource".
+            sink (function, coroutine function or asyncio.Queue):
+                Receives every decision (None to keep only the metrics).
+            yield_every (int):
+                Ticks between handing control back to the event loop, so a
+                fast source cannot starve other tasks.
+
+        Returns:
+            ticks (int):
+                Readings handled.
+        '''
+        ticks = 0
+        isAsync = asyncio.iscoroutinefunction(sink)
+        async for reading in source:
+            if('error' in reading): # line the source could not parse
+                self.errors += 1
+                decision = reading
+            else:
+                try:
+                    decision = self.tick(reading)
+                except (ValueError, KeyError, TypeError) as e:
+                    self.errors += 1
+                    decision = {'id': reading.get('id'), 'error': '%s: %s'%(type(e).__name__, e)}
+            if(isinstance(sink, asyncio.Queue)):
+                await sink.put(decision)
+            elif(isAsync):
+                await sink(decision)
+            elif(sink is not None):
+                sink(decision)
+            ticks += 1
+            if(ticks % yield_every == 0):
+                await asyncio.sleep(0)
+        return ticks
+
+    async def run_many(self, sources, sink=None):
+        '''Consume several sources at once; returns readings handled per source.'''
+        return await asyncio.gather(*[self.run(s, sink) for s in sources])
+
+    def metrics(self):
+        '''
+        Live metrics: 'geysers' seen, 'errors' (readings that could not be
+        parsed or used), 'latency' (arrival to decision) and 'tick' (control
+        step alone) summaries in ms (see "LatencyStats").
+        '''
+        return {'geysers': len(self.geysers), 'errors': self.errors,
+                'latency': self.latency.summary(),
+                'tick': self.tick_time.summary()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the BiGeyser control on '
+                                     'live meter readings.')
+    parser.add_argument('--tail', help='JSON/CSV lines file to follow')
+    parser.add_argument('--port', type=int, help='local TCP port to read lines from')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--out', help='file for decisions (JSON lines, default stdout)')
+    parser.add_argument('--no-follow', action='store_true',
+                        help='stop at the end of the --tail file')
+    args = parser.parse_args(argv)
+    if(args.tail is None and args.port is None):
+        parser.error('give --tail or --port')
+
+    controller = LiveController()
+    out = open(args.out, 'a') if args.out else sys.stdout
+
+    def sink(decision):
+        out.write(json.dumps(decision) + '\n')
+        out.flush()
+
+    sources = []
+    if(args.tail):
+        sources.append(FileSource(args.tail, follow=not args.no_follow))
+    if(args.port is not None):
+        sources.append(SocketSource(args.host, args.port))
+    try:
+        asyncio.run(controller.run_many(sources, sink))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(controller.metrics()), file=sys.stderr)
+        if(out is not sys.stdout):
+            out.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
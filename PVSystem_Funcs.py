@@ -0,0 +1,190 @@
+"""
+The ``PVSystem_Funcs`` module contains a PV system model with several
+sub-arrays (tilt, azimuth, panel count), cell temperature derating and
+inverter clipping. Solar position and irradiance are computed once and the
+plane of array irradiance for all distinct orientations in one numpy pass, so
+many roof layouts are evaluated together as (layouts, days, slots) arrays.
+
+The results are not scaled like "myModels.CalcSolPow", which multiplies the
+STC panel power by 1.3 and has no temperature or inverter losses. For the
+same panels and orientation LayoutPower gives less energy (0.71 times
+CalcSolPow over a clear-sky year at the LaunchLab with temp_air=20), so
+compare the two only after allowing for that factor.
+
+Example:
+    layouts = [{'name': 'north', 'inverter_kw': 40,
+                'arrays': [{'tilt': 30, 'azimuth': 0, 'panels': 150}]},
+               {'name': 'east-west', 'inverter_kw': 40,
+                'arrays': [{'tilt': 10, 'azimuth': 90, 'panels': 75},
+                           {'tilt': 10, 'azimuth': 270, 'panels': 75}]}]
+    names, solarPow, tStamp, info = LayoutPower(start, end, layouts)
+"""
+
+import numpy as np
+import pandas as pd
+import pvlib
+from pvlib.location import Location
+import Solar_Funcs as sf
+
+# Canadian Solar CS6U-330P (as in "CalcSolPow"): STC power (W), temperature
+# coefficient of power (per C) and nominal operating cell temperature (C)
+DEFAULT_PANEL = {'watts': 330, 'gamma': -0.0041, 'noct': 45}
+
+def CellTemperature(poa, temp_air, noct=45):
+    '''
+    Cell temperature with the NOCT model: temp_air + (noct - 20)/800*poa.
+    '''
+    return temp_air + (noct - 20)/800*poa
+
+def TiltedIrradiance(sky, tilts, azimuths, surface_type='urban'):
+    '''
+    Plane of array irradiance for many orientations at once with the
+    isotropic sky model (as "Solar_Funcs.PlaneOfArray"), broadcast over an
+    orientations axis in numpy.
+
+    Args:
+        sky (dict):
+            Output of "Solar_Funcs.ClearSky".
+        tilts, azimuths (array[orientations]):
+            Panel orientations in degrees.
+
+    Returns:
+        poa (array[orientations,times]):
+            Global plane of array irradiance (W/m^2).
+    '''
+    tilt = np.radians(np.asarray(tilts, dtype=float))[:, None]
+    azimuth = np.radians(np.asarray(azimuths, dtype=float))[:, None]
+    zenith = np.radians(sky['solpos']['apparent_zenith'].values)[None, :]
+    sunAz = np.radians(sky['solpos']['azimuth'].values)[None, :]
+    irrad = sky['irrad']
+    dni, dhi, ghi = (np.nan_to_num(np.asarray(irrad[c], dtype=float))[None, :] for c in ('dni', 'dhi', 'ghi'))
+
+    cosAoi = (np.cos(tilt)*np.cos(zenith)
+              + np.sin(tilt)*np.sin(zenith)*np.cos(sunAz - azimuth))
+    albedo = pvlib.albedo.SURFACE_ALBEDOS[surface_type]
+    return (np.maximum(dni*np.clip(cosAoi, -1, 1), 0) + dhi*(1 + np.cos(tilt))/2
+            + ghi*albedo*(1 - np.cos(tilt))/2)
+
+def OrientationPower(sky, orientations, temp_air=20, panel=DEFAULT_PANEL,
+                     surface_type='urban'):
+    '''
+    DC power of one panel for every orientation.
+
+    Args:
+        sky (dict):
+            Output of "Solar_Funcs.ClearSky" (clear-sky or weather
+            irradiance), computed once for all orientations.
+        orientations (list of (tilt, azimuth)):
+            Panel orientations in degrees.
+        temp_air (float or array[times]):
+            Air temperature (C).
+        panel (dict):
+            Panel 'watts', 'gamma' and 'noct' (see DEFAULT_PANEL).
+
+    Returns:
+        power (array[orientations,times]):
+            DC power per panel (W).
+        poa (array[orientations,times]):
+            Plane of array irradiance (W/m^2).
+    '''
+    tilts, azimuths = zip(*orientations)
+    poa = TiltedIrradiance(sky, tilts, azimuths, surface_type)
+    derate = 1 + panel['gamma']*(CellTemperature(poa, temp_air, panel['noct']) - 25)
+    return poa/1000*panel['watts']*derate, poa
+
+def SystemPower(power, panels, inverter_kw=None, inverter_eff=0.96):
+    '''
+    AC power of PV systems made of panels in several orientations.
+
+    Args:
+        power (array[orientations,times]):
+            DC power per panel ("OrientationPower").
+        panels (array[layouts,orientations]):
+            Number of panels per orientation in every layout.
+        inverter_kw (float or array[layouts]):
+            Inverter AC capacity (kW); None for no limit.
+        inverter_eff (float):
+            Inverter efficiency.
+
+    Returns:
+        ac (array[layouts,times]):
+            AC power (W).
+        clipped (array[layouts,times]):
+            Power lost to inverter clipping (W).
+    '''
+    dc = np.asarray(panels, dtype=float) @ power
+    ac = dc*inverter_eff
+    if(inverter_kw is None):
+        return ac, np.zeros_like(ac)
+    limit = np.asarray(inverter_kw, dtype=float)*1000
+    limit = np.broadcast_to(limit, ac.shape[:-1])[..., None]
+    clipped = np.maximum(ac - limit, 0)
+    return ac - clipped, clipped
+
+def LayoutPower(startDay, endDay, layouts, site=None, solpos='spa', temp_air=20,
+                irrad=None, panel=DEFAULT_PANEL, inverter_eff=0.96, tz=None):
+    '''
+    Hourly PV generation for several roof layouts.
+
+    Args:
+        startDay, endDay (datetime):
+            First and last day.
+        layouts (list of dict):
+            'name', 'arrays' (list of dicts with 'tilt', 'azimuth' and
+            'panels') and optionally 'inverter_kw'.
+        site (pvlib Location):
+            Location of the installation (default LaunchLab).
+        solpos (string):
+            Solar position backend (see "Solar_Funcs").
+        temp_air (float or array[days,24]):
+            Air temperature (C), e.g. from "Weather_Funcs.WeatherPV".
+        irrad (DataFrame):
+            Measured 'ghi', 'dni' and 'dhi' for the hours (default
+            clear-sky).
+        panel (dict):
+            Panel parameters (see DEFAULT_PANEL).
+        inverter_eff (float):
+            Inverter efficiency.
+        tz (string):
+            Time zone of the timestamps for the solar position (None takes
+            them as UTC, as "CalcSolPow" does).
+
+    Returns:
+        names (list):
+            Layout names.
+        solarPow (array[layouts,days,24]):
+            AC energy per hour (Wh).
+        tStamp (array[days,24]):
+            Timestamps (datetime64[s]).
+        info (dict):
+            'clipped' (array[layouts]) energy lost to clipping (Wh),
+            'derate' (array[layouts]) energy lost to cell temperature (Wh,
+            negative for gains below 25 C), 'dc_peak' (array[layouts]) peak DC
+            power (W).
+    '''
+    if(site is None):
+        site = Location(-33.925146, 18.865785, 'Africa/Johannesburg', 136, 'LaunchLab')
+    days = (endDay-startDay).days + 1
+    times = pd.date_range(start=startDay, periods=days*24, freq='60min')
+    solTimes = times if tz is None else times.tz_localize(tz)
+    sky = sf.ClearSky(solTimes, site, solpos, irrad=irrad)
+
+    orientations = sorted({(a['tilt'], a['azimuth']) for lay in layouts for a in lay['arrays']})
+    column = {o: i for i, o in enumerate(orientations)}
+    panels = np.zeros((len(layouts), len(orientations)))
+    for i, lay in enumerate(layouts):
+        for a in lay['arrays']:
+            panels[i, column[(a['tilt'], a['azimuth'])]] += a['panels']
+    inverter = np.array([lay.get('inverter_kw', np.inf) or np.inf for lay in layouts], dtype=float)
+
+    temp = np.ravel(np.broadcast_to(temp_air, (days, 24)))
+    power, poa = OrientationPower(sky, orientations, temp, panel)
+    ac, clipped = SystemPower(power, panels, inverter, inverter_eff)
+    stc = panels @ (poa/1000*panel['watts'])
+
+    names = [lay.get('name', 'layout %d'%i) for i, lay in enumerate(layouts)]
+    info = {'clipped': clipped.sum(axis=-1),
+            'derate': (stc - panels @ power).sum(axis=-1)*inverter_eff,
+            'dc_peak': (panels @ power).max(axis=-1)}
+    tStamp = times.values.astype('datetime64[s]').reshape(days, 24)
+    return names, ac.reshape(len(layouts), days, 24), tStamp, info
@@ -0,0 +1,282 @@
+"""
+The ``Plot_Funcs`` module contains a plotting data layer for long traces such
+as a year of minute geyser temperature or energy from "Simulator" and
+"BiGeyser". Series are reduced to about one point per screen pixel while
+keeping their shape, either as a min/max envelope per pixel bucket or with
+Largest-Triangle-Three-Buckets (LTTB). A "Pyramid" precomputes min, max and
+mean at several resolutions, so any time window is drawn from the coarsest
+level that still has a bucket per pixel and zooming and panning stay fast.
+
+Example:
+    energy, temp = gf.Simulator(vol)
+    pyr = Pyramids(tstamp, energy=energy, temp=temp)
+    view = pyr['temp'].window('2019-03-01', '2019-03-08', pixels=1200)
+    PlotWindow(ax, view)
+"""
+
+import numpy as np
+import Time_Funcs as tm
+
+def _Times(times):
+    '''Timestamps (any shape, datetimes or datetime64) as flat datetime64[s].'''
+    return tm.To_Datetime64(times)
+
+def _Edges(n, buckets):
+    '''Start index of every bucket (and n) for n points in equal buckets.'''
+    buckets = max(min(buckets, n), 1)
+    return np.unique(np.linspace(0, n, buckets + 1).astype(np.int64))
+
+def _Reduce(level, edges):
+    '''
+    Merge neighbouring buckets of a level.
+
+    Args:
+        level (dict):
+            'time', 'min', 'max', 'tmin', 'tmax', 'sum', 'count' per bucket.
+        edges (array):
+            Bucket boundaries (indices in to level, ending at its length).
+
+    Returns:
+        level (dict):
+            The merged buckets, with the same keys.
+    '''
+    starts = edges[:-1]
+    bucket = np.repeat(np.arange(starts.size), np.diff(edges))
+    out = {'time': level['time'][starts]}
+    for key, tkey, sign in (('min', 'tmin', 1), ('max', 'tmax', -1)):
+        vals = level[key]
+        # First element of every bucket after sorting by value gives the extreme
+        order = np.lexsort((np.where(np.isnan(vals), np.inf, sign*vals), bucket))
+        pick = order[starts]
+        out[key] = vals[pick]
+        out[tkey] = level[tkey][pick]
+    out['sum'] = np.add.reduceat(level['sum'], starts)
+    out['count'] = np.add.reduceat(level['count'], starts)
+    return out
+
+def _Level(times, values):
+    '''Finest pyramid level: every point is its own bucket.'''
+    values = np.asarray(values, dtype=float).ravel()
+    valid = ~np.isnan(values)
+    return {'time': times, 'min': values, 'max': values, 'tmin': times, 'tmax': times,
+            'sum': np.where(valid, values, 0), 'count': valid.astype(np.int64)}
+
+def _View(level):
+    '''Plot data (see "Pyramid.window") from reduced buckets.'''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = level['sum']/level['count']
+    # Min and max of every bucket in time order, for a shape-preserving line
+    first = level['tmin'] <= level['tmax']
+    lineT = np.stack((np.where(first, level['tmin'], level['tmax']),
+                      np.where(first, level['tmax'], level['tmin'])), axis=1).ravel()
+    lineV = np.stack((np.where(first, level['min'], level['max']),
+                      np.where(first, level['max'], level['min'])), axis=1).ravel()
+    return {'time': level['time'], 'min': level['min'], 'max': level['max'],
+            'mean': mean, 'line_time': lineT, 'line': lineV}
+
+def MinMax(times, values, buckets=1000):
+    '''
+    Min/max envelope of a series in equal buckets (e.g. one per pixel).
+
+    Args:
+        times (array[days,slots] or array[n]):
+            Timestamps.
+        values (array[days,slots] or array[n]):
+            Values (NaN is ignored).
+        buckets (int):
+            Number of buckets.
+
+    Returns:
+        view (dict):
+            Per bucket 'time' (first timestamp), 'min', 'max' and 'mean';
+            'line_time' and 'line' hold min and max in time order (two points
+            per bucket), which drawn as a line looks like the full series.
+    '''
+    times = _Times(times)
+    level = _Level(times, values)
+    return _View(_Reduce(level, _Edges(times.size, buckets)))
+
+def LTTB(times, values, threshold=1000):
+    '''
+    Largest-Triangle-Three-Buckets downsampling: keeps the first and last
+    point and, in every bucket between, the point forming the largest
+    triangle with the point kept before and the mean of the next bucket.
+
+    Args:
+        times (array[days,slots] or array[n]):
+            Timestamps.
+        values (array[days,slots] or array[n]):
+            Values (NaN points are dropped).
+        threshold (int):
+            Number of points to keep.
+
+    Returns:
+        times (array[threshold]):
+            Timestamps of the points kept.
+        values (array[threshold]):
+            Values of the points kept.
+    '''
+    times = _Times(times)
+    values = np.asarray(values, dtype=float).ravel()
+    valid = ~np.isnan(values)
+    times, values = times[valid], values[valid]
+    n = values.size
+    if(threshold >= n or threshold < 3):
+        return times, values
+
+    x = (times - times[0]).astype(np.int64).astype(float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64) # inner buckets
+    # Mean point of every inner bucket (the last "next bucket" is the last point)
+    sums = np.add.reduceat(np.stack((x, values))[:, 1:n-1], edges[:-1] - 1, axis=1)
+    counts = np.maximum(np.diff(edges), 1)
+    avgX = np.append(sums[0]/counts, x[-1])
+    avgY = np.append(sums[1]/counts, values[-1])
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], max(edges[i+1], edges[i] + 1)
+        # Twice the triangle area for every candidate in the bucket
+        area = np.abs((x[a] - avgX[i+1])*(values[lo:hi] - values[a])
+                      - (x[a] - x[lo:hi])*(avgY[i+1] - values[a]))
+        a = lo + int(area.argmax())
+        keep[i+1] = a
+    return times[keep], values[keep]
+
+class Pyramid:
+    '''
+    Min, max and mean of a series at several resolutions, each level
+    factor times coarser than the one below, down to about min_buckets
+    buckets.
+
+    Args:
+        times (array[days,slots] or array[n]):
+            Timestamps in time order (e.g. tstamp from "Runner").
+        values (array[days,slots] or array[n]):
+            Series, e.g. temp or energy from "Simulator".
+        factor (int):
+            Points per bucket from one level to the next.
+        min_buckets (int):
+            Smallest number of buckets in the coarsest level.
+    '''
+
+    def __init__(self, times, values, factor=4, min_buckets=256):
+        times = _Times(times)
+        self.factor = factor
+        self.levels = [_Level(times, values)]
+        while(self.levels[-1]['time'].size > min_buckets*factor):
+            n = self.levels[-1]['time'].size
+            edges = np.append(np.arange(0, n, factor), n)
+            self.levels.append(_Reduce(self.levels[-1], edges))
+
+    def __len__(self):
+        return self.levels[0]['time'].size
+
+    def __repr__(self):
+        return "Pyramid(%d points, levels of %s buckets)"%(len(self),
+               [lev['time'].size for lev in self.levels])
+
+    def _Span(self, level, start, end):
+        '''Bucket slice of a level covering [start, end].'''
+        t = level['time']
+        i0 = 0 if start is None else max(np.searchsorted(t, start, 'right') - 1, 0)
+        i1 = t.size if end is None else np.searchsorted(t, end, 'right')
+        return i0, i1
+
+    def window(self, start=None, end=None, pixels=1000, method='minmax'):
+        '''
+        Downsampled data for a time window.
+
+        Args:
+            start, end (datetime, datetime64 or string):
+                Window to show (default the whole series).
+            pixels (int):
+                Buckets (about the plot width in pixels).
+            method (string):
+                'minmax' for the envelope, or 'lttb' for LTTB over the bucket
+                means of a level with about 4 buckets per point kept.
+
+        Returns:
+            view (dict):
+                'minmax': as "MinMax", plus 'level' (level used). 'lttb':
+                'time' and 'value' of the points kept, plus 'level'.
+        '''
+        start = None if start is None else np.datetime64(start, 's')
+        end = None if end is None else np.datetime64(end, 's')
+        need = pixels if method == 'minmax' else 4*pixels
+        # Coarsest level that still has enough buckets in the window
+        index = 0
+        for k in range(len(self.levels) - 1, -1, -1):
+            i0, i1 = self._Span(self.levels[k], start, end)
+            if(i1 - i0 >= need):
+                index = k
+                break
+        level = self.levels[index]
+        i0, i1 = self._Span(level, start, end)
+        part = {key: arr[i0:i1] for key, arr in level.items()}
+
+        if(method == 'minmax'):
+            view = _View(_Reduce(part, _Edges(i1 - i0, pixels)))
+        elif(method == 'lttb'):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = part['sum']/part['count']
+            t, v = LTTB(part['time'], mean, pixels)
+            view = {'time': t, 'value': v}
+        else:
+            raise ValueError("method must be 'minmax' or 'lttb', not '%s'"%method)
+        view['level'] = index
+        return view
+
+    def save(self, Filename):
+        '''Save the pyramid to a .npz file.'''
+        arrays = {'factor': self.factor}
+        for k, lev in enumerate(self.levels):
+            for key, arr in lev.items():
+                arrays['%d_%s'%(k, key)] = arr
+        np.savez(Filename, **arrays)
+
+    @classmethod
+    def load(cls, Filename):
+        '''Load a pyramid saved with "save".'''
+        data = np.load(Filename)
+        pyr = cls.__new__(cls)
+        pyr.factor = int(data['factor'])
+        pyr.levels = []
+        k = 0
+        while('%d_time'%k in data):
+            pyr.levels.append({key: data['%d_%s'%(k, key)] for key in
+                               ('time', 'min', 'max', 'tmin', 'tmax', 'sum', 'count')})
+            k += 1
+        return pyr
+
+def Pyramids(tStamp, factor=4, min_buckets=256, **series):
+    '''
+    Pyramids for several series on the same timestamps.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps of the series.
+        series (array[days,slots]):
+            Named series, e.g. energy=energy, temp=temp.
+
+    Returns:
+        pyramids (dict):
+            "Pyramid" per series name.
+    '''
+    times = _Times(tStamp)
+    return {name: Pyramid(times, values, factor, min_buckets) for name, values in series.items()}
+
+def PlotWindow(ax, view, label=None, color=None, envelope=True):
+    '''
+    Draw a view from "Pyramid.window" or "MinMax" on matplotlib axes: the
+    min/max band shaded and the min/max line on top (or the LTTB points).
+    '''
+    if('value' in view): # LTTB
+        return ax.plot(view['time'], view['value'], label=label, color=color)
+    lines = ax.plot(view['line_time'], view['line'], label=label, color=color, linewidth=0.8)
+    if(envelope):
+        ax.fill_between(view['time'], view['min'], view['max'],
+                        color=lines[0].get_color(), alpha=0.25, step='post', linewidth=0)
+    return lines
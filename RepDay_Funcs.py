@@ -0,0 +1,273 @@
+"""
+The ``RepDay_Funcs`` module contains a representative-day builder: days of
+(days, slots) load, solar and volume arrays are clustered by shape with
+vectorised k-means or k-medoids, and each cluster is represented by one real
+day with a weight (number of days it stands for) and a mapping back to the
+calendar. Annual results can then be evaluated on 12-24 days.
+
+Example:
+    rep = RepresentativeDays(tStamp, [energy, solar], k=16)
+    cost = DailyCost(tStamp[rep['days']], energy[rep['days']], rates)
+    annual = (cost*rep['weights']).sum()
+"""
+
+import numpy as np
+import Tariff_Funcs as tf
+import Time_Funcs as tm
+
+def DayGroups(tStamp):
+    '''
+    Group days by tariff day type and season, so that representative days
+    are not shared between weekdays, Saturdays and Sundays or between the high
+    and low season.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps.
+
+    Returns:
+        groups (array[days]):
+            0-2 weekday/Saturday/Sunday in the low season, 3-5 in the high
+            season.
+    '''
+    first = tm.To_Datetime64(tStamp).reshape(np.shape(tStamp))[:, 0]
+    weekday = (first.astype('datetime64[D]').astype(np.int64) + 3) % 7 # Monday = 0
+    dayType = np.minimum(np.maximum(weekday - 4, 0), 2)
+    month = first.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    return dayType + 3*np.isin(month, tf.HIGH_SEASON)
+
+def DayFeatures(arrays, scale=None):
+    '''
+    Features per day from several (days, slots) arrays, each scaled by its
+    standard deviation so arrays in different units count equally.
+
+    Args:
+        arrays (list of array[days,slots]):
+            E.g. hourly load, solar and geyser volume (any slots per day).
+        scale (list of float):
+            Extra weight per array (default 1 each).
+
+    Returns:
+        features (array[days,features]):
+            Concatenated, scaled day profiles.
+    '''
+    if(scale is None):
+        scale = [1]*len(arrays)
+    parts = []
+    for data, w in zip(arrays, scale):
+        data = np.asarray(data, dtype=float)
+        data = data.reshape(data.shape[0], -1)
+        std = data.std()
+        parts.append(data*(w/std if std > 0 else 0))
+    return np.concatenate(parts, axis=1)
+
+def _Distances(x, centres):
+    '''Squared euclidean distances, array[points,centres].'''
+    d = (x*x).sum(axis=1)[:, None] - 2*x @ centres.T + (centres*centres).sum(axis=1)[None, :]
+    return np.maximum(d, 0)
+
+def _PlusPlus(x, k, rng):
+    '''k-means++ starting points (indices in to x).'''
+    chosen = [rng.integers(x.shape[0])]
+    closest = _Distances(x, x[chosen])[:, 0]
+    for i in range(1, k):
+        total = closest.sum()
+        if(total == 0):
+            pick = rng.integers(x.shape[0])
+        else:
+            pick = rng.choice(x.shape[0], p=closest/total)
+        chosen.append(pick)
+        np.minimum(closest, _Distances(x, x[[pick]])[:, 0], out=closest)
+    return np.array(chosen)
+
+def KMeans(x, k, iterations=100, seed=0):
+    '''
+    Lloyd's k-means with k-means++ starting points.
+
+    Returns:
+        labels (array[points]):
+            Cluster of every point.
+        centres (array[k,features]):
+            Cluster means.
+    '''
+    rng = np.random.default_rng(seed)
+    centres = x[_PlusPlus(x, k, rng)]
+    labels = None
+    for it in range(iterations):
+        newLabels = _Distances(x, centres).argmin(axis=1)
+        if(labels is not None and (newLabels == labels).all()):
+            break
+        labels = newLabels
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centres)
+        np.add.at(sums, labels, x)
+        empty = counts == 0
+        centres = np.where(empty[:, None], centres, sums/np.maximum(counts, 1)[:, None])
+    return labels, centres
+
+def KMedoids(x, k, iterations=100, seed=0):
+    '''
+    k-medoids (alternating assignment and medoid update) with k-means++
+    starting points, using the full day-to-day distance matrix.
+
+    Returns:
+        labels (array[points]):
+            Cluster of every point.
+        medoids (array[k]):
+            Index of the medoid of every cluster.
+    '''
+    rng = np.random.default_rng(seed)
+    D = np.sqrt(_Distances(x, x))
+    medoids = _PlusPlus(x, k, rng)
+    for it in range(iterations):
+        labels = D[:, medoids].argmin(axis=1)
+        labels[medoids] = np.arange(k)
+        # Total distance from every point to the members of every cluster
+        member = np.zeros((x.shape[0], k))
+        member[np.arange(x.shape[0]), labels] = 1
+        cost = D @ member
+        cost[member == 0] = np.inf # medoid must be a member
+        newMedoids = cost.argmin(axis=0)
+        if((newMedoids == medoids).all()):
+            break
+        medoids = newMedoids
+    labels = D[:, medoids].argmin(axis=1)
+    labels[medoids] = np.arange(k)
+    return labels, medoids
+
+def RepresentativeDays(tStamp, arrays, k=16, method='kmedoids', groups='auto',
+                       scale=None, iterations=100, seed=0):
+    '''
+    Choose k representative days.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps of the arrays.
+        arrays (list of array[days,slots]):
+            Arrays to cluster days by (e.g. load, solar, geyser volume).
+        k (int):
+            Number of representative days. Must be at least the number of
+            groups present.
+        method (string):
+            'kmedoids', or 'kmeans' (the day nearest each mean is used).
+        groups (array[days] or string):
+            Days in different groups are never clustered together. 'auto' uses
+            "DayGroups" (tariff day type and season), None for no groups.
+        scale (list of float):
+            Weight per array (see "DayFeatures").
+
+    Returns:
+        rep (dict):
+            'days' (array[k]) index of every representative day,
+            'weights' (array[k]) number of calendar days it stands for,
+            'labels' (array[days]) representative (0..k-1) of every calendar
+            day, 'inertia' (float) mean squared feature distance from the
+            days to their representatives.
+    '''
+    x = DayFeatures(arrays, scale)
+    if(isinstance(groups, str) and groups == 'auto'):
+        groups = DayGroups(tStamp)
+    if(groups is not None):
+        # Separate groups by more than the spread of all the features
+        groups = np.unique(np.asarray(groups), return_inverse=True)[1].ravel()
+        if(k < groups.max() + 1):
+            raise ValueError("k=%d is less than the %d day groups"%(k, groups.max() + 1))
+        gap = 10*(np.sqrt(((x - x.mean(axis=0))**2).sum(axis=1)).max() + 1)
+        x = np.concatenate((x, gap*np.eye(groups.max() + 1)[groups]), axis=1)
+
+    if(method == 'kmedoids'):
+        labels, days = KMedoids(x, k, iterations, seed)
+    elif(method == 'kmeans'):
+        labels, centres = KMeans(x, k, iterations, seed)
+        member = labels[:, None] == np.arange(k)[None, :]
+        days = np.where(member, _Distances(x, centres), np.inf).argmin(axis=0)
+        full = member.any(axis=0)
+        labels[days[full]] = np.flatnonzero(full)
+    else:
+        raise ValueError("method must be 'kmedoids' or 'kmeans', not '%s'"%method)
+
+    weights = np.bincount(labels, minlength=k)
+    used = weights > 0 # drop empty clusters
+    remap = np.cumsum(used) - 1
+    days, weights, labels = days[used], weights[used], remap[labels]
+    inertia = float(((x - x[days][labels])**2).sum(axis=1).mean())
+    return {'days': days, 'weights': weights, 'labels': labels, 'inertia': inertia}
+
+def Expand(data, rep):
+    '''
+    Map data for the representative days back on to the calendar.
+
+    Args:
+        data (array[...,k,slots]):
+            Values for each representative day.
+        rep (dict):
+            Output of "RepresentativeDays".
+
+    Returns:
+        expanded (array[...,days,slots]):
+            The representative values of every calendar day.
+    '''
+    return np.take(np.asarray(data), rep['labels'], axis=-2)
+
+def WeightedTotal(daily, rep):
+    '''
+    Total over the calendar of per-day values for the representative days.
+
+    Args:
+        daily (array[...,k]):
+            Value per representative day (e.g. daily cost).
+
+    Returns:
+        total (array[...]):
+            Weighted sum standing for the sum over all days.
+    '''
+    return np.asarray(daily) @ rep['weights']
+
+def DailyCost(tStamp, energy, rates):
+    '''
+    TOU energy cost per day, array[...,days] (see "Tariff_Funcs.PeriodCost").
+    '''
+    return tf.PeriodCost(tStamp, energy, rates).sum(axis=-1)
+
+def CompressionError(tStamp, arrays, rep, func=None):
+    '''
+    Error of the representative days against the full data.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps of the full data.
+        arrays (list of array[days,slots]):
+            Full data arrays.
+        rep (dict):
+            Output of "RepresentativeDays".
+        func (function):
+            func(tStamp, *arrays) -> per-day values (array[...,days]), e.g.
+            the daily cost after interventions. Run on the full and the
+            representative days; defaults to the daily total of the first
+            array (use "DailyCost" with the tariff rates for cost).
+
+    Returns:
+        error (dict):
+            'full' and 'reduced' totals of func and their 'relative' error,
+            'profile_rmse' (list) root mean square error of every array when
+            expanded back to the calendar, 'total_relative' (list) relative
+            error of every array's total.
+    '''
+    if(func is None):
+        func = lambda t, energy, *others: np.asarray(energy).sum(axis=-1)
+    tStamp = np.asarray(tStamp)
+    days = rep['days']
+    full = np.asarray(func(tStamp, *arrays)).sum(axis=-1)
+    reduced = WeightedTotal(func(tStamp[days], *[np.asarray(a)[days] for a in arrays]), rep)
+
+    rmse = []
+    totals = []
+    for data in arrays:
+        data = np.asarray(data, dtype=float)
+        rmse.append(float(np.sqrt(((Expand(data[days], rep) - data)**2).mean())))
+        total = data.sum()
+        totals.append(float((WeightedTotal(data[days].sum(axis=-1), rep) - total)/total) if total else 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = (reduced - full)/np.abs(full)
+    return {'full': full, 'reduced': reduced, 'relative': relative,
+            'profile_rmse': rmse, 'total_relative': totals}
@@ -0,0 +1,316 @@
+"""
+The ``Run_Scenarios`` module is a command line entry point that runs the
+load, LED, PV, geyser and billing steps for every scenario in a TOML or YAML
+scenario file, without needing a notebook kernel.
+
+Usage:
+    python Run_Scenarios.py scenarios.toml --out results --jobs 4
+
+Example scenario file (TOML)::
+
+    [defaults]
+    load_file = "LL loads.csv"
+
+    [defaults.site]
+    latitude = -33.925146
+    longitude = 18.865785
+    tz = "Africa/Johannesburg"
+    altitude = 136
+    name = "LaunchLab"
+
+    [scenarios.base]
+
+    [scenarios.pv_led]
+    pv = {panels = 150}
+    led = true
+    tariff = {high = [0.60, 1.10, 3.50], low = [0.55, 0.85, 1.20]}
+
+    [scenarios.office_led]
+    led = {watts = {double = 9, single = 9}, factor = 0.8, schedules = "office"}
+
+    [scenarios.geyser]
+    geyser = {file = "geyser.csv", R = 0.6, volume = 200, t_amb = 20}
+
+'led' is true (as "Change_To_LEDs") or a retrofit option (see
+"Lighting_Funcs.RetrofitOptions") with 'schedules' "always" or "office";
+'geyser' sets the data file and any of R, volume, t_amb, t_inlet and
+start_temp (see "Geyser_Funcs.SetupGeyser").
+
+Top level keys in [defaults] are used by every scenario unless the scenario
+sets the same key. Every scenario is billed with the financial model of the
+notebook pipeline ("myModels.getFinModel"), saved as '<name>_finmodel.pkl';
+a scenario that sets 'tariff' rates is also costed per slot with
+"Tariff_Funcs" at those rates. Each completed stage is cached (pickled) in
+the cache directory, keyed on its inputs and the modification time of its
+data files, so a re-run only recomputes stages whose inputs changed.
+"""
+
+import os
+import sys
+import json
+import pickle
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import myModels as models
+import Geyser_Funcs as gf
+import Tariff_Funcs as tf
+import Lighting_Funcs as lf
+import Intervention_Funcs as itv
+import Export_Funcs as ef
+from pvlib.location import Location
+
+CACHE_DIR = '.scenario_cache'
+LED_SCHEDULES = {'always': lf.ALWAYS_ON, 'office': lf.OFFICE_SCHEDULES}
+# Scenario geyser options and the "SetupGeyser" arguments they set
+GEYSER_PARAMS = {'R': 'thermalRes', 'volume': 'volume', 't_amb': 'ambTemp',
+                 't_inlet': 'inletTemp', 'start_temp': 'startTemp'}
+
+def LoadScenarios(Filename):
+    '''
+    Read a scenario file.
+
+    Args:
+        Filename (string):
+            Scenario file ending in '.toml', '.yaml' or '.yml'.
+
+    Returns:
+        scenarios (dict):
+            Scenario name to configuration, with [defaults] applied.
+    '''
+    if(Filename.endswith(('.yaml', '.yml'))):
+        import yaml
+        with open(Filename) as f:
+            config = yaml.safe_load(f)
+    else:
+        import tomllib
+        with open(Filename, 'rb') as f:
+            config = tomllib.load(f)
+
+    defaults = config.get('defaults', {})
+    scenarios = {}
+    for name, scen in config['scenarios'].items():
+        merged = dict(defaults)
+        merged.update(scen or {})
+        scenarios[name] = merged
+    return scenarios
+
+def FileKey(Filename):
+    '''
+    Cache key for a data file (path, modification time and size).
+    '''
+    info = os.stat(Filename)
+    return [os.path.abspath(Filename), info.st_mtime_ns, info.st_size]
+
+def Cached(cacheDir, stage, key, func, *args):
+    '''
+    Run func(*args) for a pipeline stage, or load its result from the cache.
+
+    Args:
+        cacheDir (string):
+            Directory for cached results. None disables caching.
+        stage (string):
+            Name of the stage (used in the cache file name).
+        key (list):
+            JSON-serialisable description of everything the result depends on.
+        func (function):
+            Function computing the stage result.
+
+    Returns:
+        result:
+            Return value of func.
+        digest (string):
+            Hash of stage and key, to be used in keys of dependent stages.
+    '''
+    digest = hashlib.sha1(json.dumps([stage, key], sort_keys=True,
+                                     default=str).encode()).hexdigest()
+    if(cacheDir is None):
+        return func(*args), digest
+
+    path = os.path.join(cacheDir, '%s_%s.pkl'%(stage, digest[:16]))
+    if(os.path.exists(path)):
+        with open(path, 'rb') as f:
+            return pickle.load(f), digest
+
+    result = func(*args)
+    os.makedirs(cacheDir, exist_ok=True)
+    tmp = '%s.%d.tmp'%(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path) # atomic, so parallel scenarios never read half a file
+    return result, digest
+
+#--------------------Pipeline stages------------------#
+def LoadStage(Filename):
+    tstamp, power, peaks = models.get_LL_data(Filename)
+    return np.array(tstamp), np.array(power)
+
+def LEDStage(tStamp, energy, led):
+    if(led is True):
+        tStamp, energy = models.Change_To_LEDs(tStamp, energy)
+        return energy
+    option = {'name': 'LED', 'watts': {'double': 14, 'single': 14}} # as "Change_To_LEDs"
+    option.update({k: v for k, v in led.items() if k != 'schedules'})
+    schedules = LED_SCHEDULES[led.get('schedules', 'always')]
+    names, newEnergy, saving = lf.ApplyRetrofits(tStamp, energy, [option],
+                                                 lf.LAUNCHLAB_INVENTORY, schedules)
+    return newEnergy[0]
+
+def PVStage(tStamp, panels, site):
+    if(site is not None):
+        site = Location(**site)
+    solarPow, dates, maxi = models.CalcSolPow(tStamp[0,0], tStamp[-1,-1],
+                                              number_panels=panels, site=site)
+    return models.fix_solar(solarPow)/1000 # in kWh
+
+def GeyserStage(Filename, params):
+    tstamp, vol = gf.Runner(Filename)
+    setup = {GEYSER_PARAMS[k]: v for k, v in params.items() if k in GEYSER_PARAMS}
+    energy, temp = gf.Simulator(vol, gf.SetupGeyser(**setup))
+    return tstamp, energy, temp
+
+def SaveFinModel(Filename, fModel):
+    '''
+    Pickle a financial model (from "myModels.getFinModel"); returns Filename.
+    '''
+    with open(Filename, 'wb') as f:
+        pickle.dump(fModel, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return Filename
+
+def RunScenario(name, scen, outDir, cacheDir=CACHE_DIR):
+    '''
+    Run one scenario and write its results.
+
+    Writes '<name>.parquet' (hourly building energy, solar and cost),
+    '<name>_geyser.parquet' (minute geyser energy, temperature and cost) if a
+    geyser is configured, the financial models ('<name>_finmodel.pkl' and
+    '<name>_geyser_finmodel.pkl') and a '<name>.json' summary of monthly
+    energy (and cost, if the scenario sets tariff rates).
+
+    Args:
+        name (string):
+            Scenario name.
+        scen (dict):
+            Scenario configuration (see module docstring).
+        outDir (string):
+            Directory for result files.
+        cacheDir (string):
+            Directory for cached stages. None disables caching.
+
+    Returns:
+        summary (dict):
+            Monthly and total energy, financial model files and, with tariff
+            rates, monthly and total TOU cost for the scenario.
+    '''
+    os.makedirs(outDir, exist_ok=True)
+    rates = scen.get('tariff')
+    summary = {'scenario': name}
+
+    if('load_file' in scen):
+        (tStamp, energy), loadKey = Cached(cacheDir, 'load', FileKey(scen['load_file']),
+                                           LoadStage, scen['load_file'])
+        summary['base_energy'] = float(energy.sum())
+
+        led = scen.get('led', False)
+        if(led):
+            energy, _ = Cached(cacheDir, 'led', [loadKey, led], LEDStage, tStamp, energy, led)
+
+        solar = None
+        pv = scen.get('pv')
+        if(pv):
+            panels = pv.get('panels', 150)
+            site = scen.get('site')
+            solar, _ = Cached(cacheDir, 'pv', [loadKey, panels, site],
+                              PVStage, tStamp, panels, site)
+            energy, extras = itv.ApplyInterventions(energy, [itv.SolarOffset(solar)])
+
+        summary['fin_model'] = SaveFinModel(os.path.join(outDir, name + '_finmodel.pkl'),
+                                            models.getFinModel(tStamp, energy))
+        months, monthEnergy = tf.MonthTotals(tStamp, energy)
+        summary['months'] = months
+        summary['month_energy'] = monthEnergy.tolist()
+        summary['total_energy'] = float(energy.sum())
+        cost = None
+        if(rates is not None):
+            cost = tf.PeriodCost(tStamp, energy, rates)
+            months, monthCost = tf.MonthTotals(tStamp, cost)
+            summary['month_cost'] = monthCost.tolist()
+            summary['total_cost'] = float(monthCost.sum())
+        ef.WriteResults(os.path.join(outDir, name + '.parquet'), tStamp,
+                        energy=energy, solar=solar, cost=cost)
+
+    geyser = scen.get('geyser')
+    if(geyser):
+        params = {k: v for k, v in geyser.items() if k != 'file'}
+        unknown = set(params) - set(GEYSER_PARAMS)
+        if(unknown):
+            raise ValueError("unknown geyser options %s, use %s"%(sorted(unknown), sorted(GEYSER_PARAMS)))
+        (gTime, gEnergy, gTemp), _ = Cached(cacheDir, 'geyser', [FileKey(geyser['file']), params],
+                                            GeyserStage, geyser['file'], params)
+        # The financial model takes hourly energy
+        hourly = gEnergy.reshape(gEnergy.shape[0], 24, -1)
+        summary['geyser_fin_model'] = SaveFinModel(
+            os.path.join(outDir, name + '_geyser_finmodel.pkl'),
+            models.getFinModel(gTime[:, ::hourly.shape[2]], hourly.sum(axis=2)))
+        months, monthEnergy = tf.MonthTotals(gTime, gEnergy)
+        summary['geyser_months'] = months
+        summary['geyser_month_energy'] = monthEnergy.tolist()
+        summary['geyser_total_energy'] = float(gEnergy.sum())
+        gCost = None
+        if(rates is not None):
+            gCost = tf.PeriodCost(gTime, gEnergy, rates)
+            months, monthCost = tf.MonthTotals(gTime, gCost)
+            summary['geyser_month_cost'] = monthCost.tolist()
+            summary['geyser_total_cost'] = float(monthCost.sum())
+        ef.WriteResults(os.path.join(outDir, name + '_geyser.parquet'), gTime,
+                        energy=gEnergy, temp=gTemp, cost=gCost)
+
+    with open(os.path.join(outDir, name + '.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run simulation scenarios '
+                                     'from a TOML/YAML scenario file.')
+    parser.add_argument('scenario_file')
+    parser.add_argument('--out', default='results',
+                        help='directory for result files (default: results)')
+    parser.add_argument('--cache', default=CACHE_DIR,
+                        help='directory for cached stages (default: %s)'%CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='recompute every stage')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='scenarios to run in parallel')
+    parser.add_argument('--only', nargs='+',
+                        help='names of scenarios to run (default: all)')
+    args = parser.parse_args(argv)
+
+    scenarios = LoadScenarios(args.scenario_file)
+    if(args.only):
+        unknown = [n for n in args.only if n not in scenarios]
+        if(unknown):
+            parser.error("unknown scenario(s) %s, choose from: %s"%(', '.join(unknown),
+                         ', '.join(scenarios)))
+        scenarios = {n: scenarios[n] for n in args.only}
+    cacheDir = None if args.no_cache else args.cache
+
+    names = list(scenarios)
+    if(args.jobs == 1 or len(names) == 1):
+        summaries = [RunScenario(n, scenarios[n], args.out, cacheDir) for n in names]
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            summaries = list(pool.map(RunScenario, names,
+                                      [scenarios[n] for n in names],
+                                      [args.out]*len(names), [cacheDir]*len(names)))
+
+    for s in summaries:
+        line = "%-20s total energy: %.1f kWh"%(s['scenario'],
+               s.get('total_energy', 0) + s.get('geyser_total_energy', 0))
+        if('total_cost' in s or 'geyser_total_cost' in s):
+            line += ", TOU cost: R %.2f"%(s.get('total_cost', 0) + s.get('geyser_total_cost', 0))
+        print(line)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
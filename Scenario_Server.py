@@ -0,0 +1,475 @@
+"""
+The ``Scenario_Server`` module is a long-running local service that loads the
+data files once and answers scenario queries (PV size, LED option, geyser
+policy, tariff) over an HTTP/JSON API. Intermediate results (per-panel PV
+profiles, LED-adjusted loads, geyser simulations, TOU periods) are kept in
+memory, so repeated or overlapping queries only redo the cheap array
+arithmetic. Requests are served on threads; the loaded arrays are read-only
+and shared between them. Everything runs offline on the local machine.
+
+Usage:
+    python Scenario_Server.py --load "LL loads.csv" --geyser geyser.csv --port 8765
+    python Scenario_Server.py --load "LL loads.csv" --weather tmy.csv
+
+With a weather file (see "Weather_Funcs.LoadWeather") PV comes from the
+measured irradiance ("Weather_Funcs.WeatherPV") instead of clear-sky; a query
+can still ask for clear-sky PV with "weather": false in its 'pv'.
+
+Endpoints:
+    GET  /health     server status and loaded datasets
+    GET  /cache      cache entries, hits and misses per stage
+    POST /scenario   one scenario query, answered with an energy (and cost) summary
+    POST /batch      list of scenario queries
+
+Example query (same keys as a scenario in "Run_Scenarios")::
+
+    {"pv": {"panels": 200, "tilt": 30, "azimuth": 0, "inverter_kw": 50},
+     "led": {"watts": {"double": 14, "single": 14}, "factor": 0.8},
+     "geyser": {"policy": "solar", "panels": 6},
+     "tariff": {"high": [0.60, 1.10, 3.50], "low": [0.55, 0.85, 1.20]}}
+
+    curl -d @query.json http://127.0.0.1:8765/scenario
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import myModels as models
+import Geyser_Funcs as gf
+import Tariff_Funcs as tf
+import Weather_Funcs as wf
+import Lighting_Funcs as lf
+import Intervention_Funcs as itv
+import Time_Funcs as tm
+import Run_Scenarios as rs
+from pvlib.location import Location
+
+GEYSER_POLICIES = ('thermostat', 'solar')
+PV_DEFAULTS = {'tilt': 40, 'azimuth': 180, 'solpos': 'spa'} # as "CalcSolPow"
+LED_DEFAULT = {'name': 'LED', 'watts': {'double': 14, 'single': 14}} # as "Change_To_LEDs"
+SCHEDULES = {'always': lf.ALWAYS_ON, 'office': lf.OFFICE_SCHEDULES}
+
+def _Key(value):
+    '''Canonical JSON of a query part, used as a cache key.'''
+    return json.dumps(value, sort_keys=True, default=str)
+
+def _ReadOnly(*arrays):
+    '''Mark shared arrays read-only so no request can change them.'''
+    for a in arrays:
+        if(isinstance(a, np.ndarray)):
+            a.setflags(write=False)
+    return arrays[0] if len(arrays) == 1 else arrays
+
+class Memo:
+    '''
+    Thread-safe in-memory cache of stage results with least-recently-used
+    eviction. Concurrent requests for the same missing key wait for one
+    computation instead of repeating it.
+
+    Args:
+        size (int):
+            Most entries kept (per cache, all stages together).
+    '''
+
+    def __init__(self, size=256):
+        self.size = size
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def get(self, stage, key, func, *args):
+        '''
+        Result of func(*args) for (stage, key), computed on first use.
+
+        Returns:
+            result:
+                Return value of func (shared, do not change it).
+            hit (bool):
+                True if the result came from the cache.
+        '''
+        full = (stage, key)
+        with self.lock:
+            counts = self.stats.setdefault(stage, {'hits': 0, 'misses': 0})
+            if(full in self.entries):
+                self.entries.move_to_end(full)
+                counts['hits'] += 1
+                return self.entries[full], True
+            event = self.pending.get(full)
+            owner = event is None
+            if(owner):
+                event = self.pending[full] = threading.Event()
+                counts['misses'] += 1
+
+        if(not owner):
+            event.wait()
+            with self.lock:
+                if(full in self.entries):
+                    counts['hits'] += 1
+                    return self.entries[full], True
+            return self.get(stage, key, func, *args) # owner failed, try again
+
+        try:
+            result = func(*args)
+            with self.lock:
+                self.entries[full] = result
+                while(len(self.entries) > self.size):
+                    self.entries.popitem(last=False)
+        finally:
+            with self.lock:
+                del self.pending[full]
+            event.set()
+        return result, False
+
+    def info(self):
+        '''Entries and hit/miss counts per stage.'''
+        with self.lock:
+            entries = {}
+            for stage, key in self.entries:
+                entries[stage] = entries.get(stage, 0) + 1
+            return {'size': self.size, 'entries': entries,
+                    'stats': {s: dict(c) for s, c in self.stats.items()}}
+
+class ScenarioService:
+    '''
+    Datasets and cached intermediate results for scenario queries.
+
+    Args:
+        load_file (string):
+            Building load profile (as "myModels.get_LL_data").
+        geyser_file (string):
+            Geyser water consumption (as "Geyser_Funcs.Runner").
+        site (dict):
+            pvlib Location arguments (default LaunchLab).
+        cache_size (int):
+            Most cached intermediate results.
+        weather_file (string):
+            Weather or TMY data for PV (as "Weather_Funcs.LoadWeather"). None
+            uses clear-sky PV.
+    '''
+
+    def __init__(self, load_file=None, geyser_file=None, site=None, cache_size=256,
+                 weather_file=None):
+        self.load_file = load_file
+        self.geyser_file = geyser_file
+        self.weather_file = weather_file
+        self.site = site
+        self.memo = Memo(cache_size)
+        self.started = time.time()
+
+        if(load_file is not None):
+            tStamp, energy = rs.LoadStage(load_file)
+            self.tStamp = _ReadOnly(tStamp)
+            self.t64 = _ReadOnly(tm.To_Datetime64(tStamp).reshape(tStamp.shape))
+            self.energy = _ReadOnly(np.asarray(energy, dtype=float))
+            self.periods, self.high = _ReadOnly(*tf.TOUPeriods(self.t64))
+        if(geyser_file is not None):
+            gTime, vol = gf.Runner(geyser_file)
+            self.gTime = _ReadOnly(gTime)
+            self.g64 = _ReadOnly(tm.To_Datetime64(gTime).reshape(gTime.shape))
+            self.gVol = _ReadOnly(np.asarray(vol, dtype=float))
+            self.gPeriods, self.gHigh = _ReadOnly(*tf.TOUPeriods(self.g64))
+        if(weather_file is not None):
+            self.weather, self.weatherReport = wf.LoadWeather(weather_file)
+            _ReadOnly(*self.weather.values())
+
+    def datasets(self):
+        '''Description of the loaded datasets.'''
+        info = {}
+        if(self.load_file is not None):
+            info['load'] = {'file': self.load_file, 'days': self.energy.shape[0],
+                            'slots': self.energy.shape[1],
+                            'start': str(self.t64[0, 0]), 'end': str(self.t64[-1, -1])}
+        if(self.geyser_file is not None):
+            info['geyser'] = {'file': self.geyser_file, 'days': self.gVol.shape[0],
+                              'slots': self.gVol.shape[1],
+                              'start': str(self.g64[0, 0]), 'end': str(self.g64[-1, -1])}
+        if(self.weather_file is not None):
+            times = self.weather['times']
+            info['weather'] = {'file': self.weather_file, 'rows': int(times.size),
+                               'start': str(times[0]), 'end': str(times[-1])}
+        return info
+
+    def warm(self, queries=()):
+        '''
+        Fill the caches: the default PV profile and LED option, the
+        thermostat geyser, and every query given (e.g. the scenarios of a
+        scenario file).
+        '''
+        base = [{'pv': {'panels': 1}, 'led': True}] if self.load_file else []
+        if(self.geyser_file is not None):
+            base.append({'geyser': {'policy': 'thermostat'}})
+        for query in base + list(queries):
+            self.query(query)
+
+    #--------------------Cached stages------------------#
+    def _Site(self, site):
+        site = site if site is not None else self.site
+        if(site is None):
+            return Location(-33.925146, 18.865785, 'Africa/Johannesburg', 136, 'LaunchLab')
+        return Location(**site)
+
+    def _PanelProfile(self, start, end, pv):
+        '''
+        Hourly energy of one panel (kWh) from startDay to endDay with the
+        "CalcSolPow" model (as "Run_Scenarios") for any orientation, from the
+        weather file if pv['weather'] names it.
+        '''
+        if(pv['weather'] is not None):
+            solarPow, tStamp, temp = wf.WeatherPV(start, end, self.weather, number_panels=1,
+                                                  site=self._Site(pv.get('site')),
+                                                  solpos=pv['solpos'], tilt=pv['tilt'],
+                                                  azimuth=pv['azimuth'])
+        else:
+            solarPow, dates, maxi = models.CalcSolPow(start, end, number_panels=1,
+                                                      site=self._Site(pv.get('site')),
+                                                      solpos=pv['solpos'], tilt=pv['tilt'],
+                                                      azimuth=pv['azimuth'])
+        return _ReadOnly(models.fix_solar(solarPow)/1000)
+
+    def _PV(self, tObj, pv, stage):
+        '''Hourly PV energy (kWh) of a system for the days of tObj.'''
+        shape = {k: pv[k] for k in ('tilt', 'azimuth', 'solpos', 'site') if k in pv}
+        for key, value in PV_DEFAULTS.items():
+            shape.setdefault(key, value)
+        shape['tilt'], shape['azimuth'] = float(shape['tilt']), float(shape['azimuth'])
+        # Part of the cache key, so weather and clear-sky profiles never mix
+        shape['weather'] = self.weather_file if pv.get('weather', True) else None
+        perPanel, hit = self.memo.get(stage, _Key(shape), self._PanelProfile,
+                                      tObj[0, 0], tObj[-1, -1], shape)
+        solar = perPanel*pv.get('panels', 150)
+        if(pv.get('inverter_kw') is not None):
+            solar = np.minimum(solar, pv['inverter_kw']) # hourly kWh = mean kW
+        return solar, hit
+
+    def _LED(self, led):
+        '''Building load after an LED option (see "Lighting_Funcs").'''
+        option = dict(LED_DEFAULT) if led is True else dict(led)
+        option.setdefault('watts', LED_DEFAULT['watts'])
+        schedules = SCHEDULES[option.pop('schedules', 'always')]
+        # True is "Change_To_LEDs", which keeps the unclipped fixed saving
+        names, energy, saving = lf.ApplyRetrofits(self.tStamp, self.energy, [option],
+                                                  lf.LAUNCHLAB_INVENTORY, schedules,
+                                                  clip=led is not True)
+        return _ReadOnly(energy[0])
+
+    def _Geyser(self, geyser):
+        '''Geyser grid energy per slot (kWh) and timestamps for a policy.'''
+        if(geyser['policy'] == 'thermostat'):
+            energy, temp = gf.Simulator(self.gVol)
+            return _ReadOnly(energy), self.g64, self.gPeriods, self.gHigh
+        # Solar geyser: 5 minute steps with its own panels (kW) as the supply
+        days = self.gVol.shape[0]
+        vol5 = self.gVol.reshape(days, -1, 5).sum(axis=-1)
+        t5 = self.gTime[:, ::5]
+        solar, hit = self._PV(self.gTime, {'panels': geyser['panels'],
+                                           'solpos': geyser['solpos'],
+                                           'weather': geyser['weather']}, 'geyser_pv')
+        excess = models.SolPow_hr_to_5min(solar)
+        mains, solarUsed, temp = gf.BiGeyser(vol5, t5, excess)
+        g64 = self.g64[:, ::5]
+        periods, high = tf.TOUPeriods(g64)
+        return _ReadOnly(mains, g64, periods, high)
+
+    #--------------------Queries------------------#
+    def _Cost(self, energy, periods, high, rates):
+        return energy*np.where(high, rates['high'][periods], rates['low'][periods])
+
+    def query(self, scen):
+        '''
+        Answer one scenario query.
+
+        Args:
+            scen (dict):
+                'pv' ({'panels', 'tilt', 'azimuth', 'inverter_kw', 'solpos',
+                'site', 'weather'} or None; 'weather' false gives clear-sky
+                PV when a weather file is loaded), 'led' (true, or a retrofit
+                option as in "Lighting_Funcs.RetrofitOptions" with optional
+                'schedules' 'always' or 'office'), 'geyser' (true, or
+                {'policy': 'thermostat' or 'solar', 'panels', 'weather'}) and
+                'tariff' (rates as in "Tariff_Funcs.SlotRates").
+
+        Returns:
+            summary (dict):
+                Monthly and total energy, with 'tariff' also monthly and total
+                TOU cost (the same keys as "Run_Scenarios.RunScenario"), the
+                stages answered from the cache ('cached') and the time taken
+                ('seconds').
+        '''
+        start = time.perf_counter()
+        unknown = set(scen) - {'name', 'pv', 'led', 'geyser', 'tariff', 'site'}
+        if(unknown):
+            raise ValueError("unknown query keys: %s"%sorted(unknown))
+        rates = scen.get('tariff')
+        if(rates is not None):
+            rates = tf.CheckRates(rates)
+        summary = {'scenario': scen.get('name')}
+        cached = []
+
+        pv = scen.get('pv')
+        led = scen.get('led')
+        if(pv or led):
+            if(self.load_file is None):
+                raise ValueError("no load file loaded for 'pv' or 'led'")
+        if(self.load_file is not None):
+            energy = self.energy
+            summary['base_energy'] = float(energy.sum())
+            if(led):
+                energy, hit = self.memo.get('led', _Key(led), self._LED, led)
+                cached += ['led'] if hit else []
+            solar = None
+            if(pv):
+                pv = dict(pv)
+                if('site' in scen):
+                    pv.setdefault('site', scen['site'])
+                solar, hit = self._PV(self.tStamp, pv, 'pv')
+                cached += ['pv'] if hit else []
+                energy, extras = itv.ApplyInterventions(energy, [itv.SolarOffset(solar)])
+                summary['solar_energy'] = float(solar.sum())
+                summary['excess_solar'] = float(extras['SolarOffset'].sum())
+            months, monthEnergy = tf.MonthTotals(self.t64, energy)
+            summary['months'] = months
+            summary['month_energy'] = monthEnergy.tolist()
+            summary['total_energy'] = float(energy.sum())
+            if(rates is not None):
+                months, monthCost = tf.MonthTotals(self.t64, self._Cost(energy, self.periods,
+                                                                        self.high, rates))
+                summary['month_cost'] = monthCost.tolist()
+                summary['total_cost'] = float(monthCost.sum())
+
+        geyser = scen.get('geyser')
+        if(geyser):
+            if(self.geyser_file is None):
+                raise ValueError("no geyser file loaded for 'geyser'")
+            geyser = {} if geyser is True else {k: v for k, v in geyser.items() if k != 'file'}
+            geyser.setdefault('policy', 'thermostat')
+            if(geyser['policy'] not in GEYSER_POLICIES):
+                raise ValueError("geyser policy must be one of %s"%(GEYSER_POLICIES,))
+            if(geyser['policy'] == 'solar'):
+                geyser.setdefault('panels', 6)
+                geyser.setdefault('solpos', 'spa')
+                geyser.setdefault('weather', True)
+            (gEnergy, g64, periods, high), hit = self.memo.get('geyser', _Key(geyser),
+                                                               self._Geyser, geyser)
+            cached += ['geyser'] if hit else []
+            months, monthEnergy = tf.MonthTotals(g64, gEnergy)
+            summary['geyser_months'] = months
+            summary['geyser_month_energy'] = monthEnergy.tolist()
+            summary['geyser_total_energy'] = float(gEnergy.sum())
+            if(rates is not None):
+                months, monthCost = tf.MonthTotals(g64, self._Cost(gEnergy, periods, high, rates))
+                summary['geyser_month_cost'] = monthCost.tolist()
+                summary['geyser_total_cost'] = float(monthCost.sum())
+
+        summary['cached'] = cached
+        summary['seconds'] = time.perf_counter() - start
+        return summary
+
+#--------------------HTTP API------------------#
+class ScenarioHandler(BaseHTTPRequestHandler):
+    '''
+    JSON request handler; the service is set on the server as "service".
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def _Send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _Body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        service = self.server.service
+        if(self.path == '/health'):
+            self._Send(200, {'status': 'ok', 'uptime': time.time() - service.started,
+                             'datasets': service.datasets()})
+        elif(self.path == '/cache'):
+            self._Send(200, service.memo.info())
+        else:
+            self._Send(404, {'error': 'unknown path %s'%self.path})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            body = self._Body()
+            if(self.path == '/scenario'):
+                self._Send(200, service.query(body))
+            elif(self.path == '/batch'):
+                if(not isinstance(body, list)):
+                    raise ValueError('/batch expects a list of queries')
+                self._Send(200, [service.query(q) for q in body])
+            else:
+                self._Send(404, {'error': 'unknown path %s'%self.path})
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self._Send(400, {'error': '%s: %s'%(type(e).__name__, e)})
+        except Exception as e:
+            self._Send(500, {'error': '%s: %s'%(type(e).__name__, e)})
+
+    def log_message(self, format, *args):
+        if(self.server.verbose):
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+def MakeServer(service, host='127.0.0.1', port=8765, verbose=False):
+    '''
+    HTTP server answering queries with a service (one thread per request).
+    Call serve_forever() on it, or use "Serve".
+    '''
+    server = ThreadingHTTPServer((host, port), ScenarioHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+def Serve(service, host='127.0.0.1', port=8765, verbose=False):
+    '''Serve queries until interrupted.'''
+    server = MakeServer(service, host, port, verbose)
+    print("Serving scenarios on http://%s:%d"%server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve scenario queries over '
+                                     'a local HTTP/JSON API.')
+    parser.add_argument('--load', help='building load profile CSV')
+    parser.add_argument('--geyser', help='geyser water consumption CSV')
+    parser.add_argument('--weather', help='weather/TMY CSV for PV (default clear-sky)')
+    parser.add_argument('--scenarios', help='TOML/YAML scenario file to warm the caches with')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on (default: 127.0.0.1, local only)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help='most cached intermediate results (default: 256)')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    service = ScenarioService(args.load, args.geyser, cache_size=args.cache_size,
+                              weather_file=args.weather)
+    queries = []
+    if(args.scenarios):
+        for name, scen in rs.LoadScenarios(args.scenarios).items():
+            scen = {k: v for k, v in scen.items() if k in ('pv', 'led', 'geyser', 'tariff')}
+            scen['name'] = name
+            queries.append(scen)
+    start = time.time()
+    service.warm(queries)
+    print("Caches warm in %.1f s"%(time.time() - start))
+    Serve(service, args.host, args.port, args.verbose)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,396 @@
+"""
+The ``Sensitivity_Funcs`` module contains a batched sensitivity analysis of
+annual and monthly cost to the model constants (geyser thermal resistance,
+tank volume and set point, panel count and tilt, LED wattages and tariff
+rates). One-at-a-time, Morris and Sobol (Saltelli) designs are evaluated as
+one batch of runs: the PV profile is computed once per distinct tilt, the
+LED and PV interventions and the TOU billing are array operations over a
+runs axis, and all distinct geyser settings are stepped together with the
+batched single-node model.
+
+Example:
+    model = CostModel(tStamp, energy, rates, gTime, gVol)
+    result = Sensitivity(model, 'morris', trajectories=20)
+    print(result['ranking']['total'])
+"""
+
+import numpy as np
+import pandas as pd
+from pvlib.location import Location
+import Calibrate_Funcs as cal
+import Lighting_Funcs as lf
+import PVSystem_Funcs as pvf
+import Solar_Funcs as sf
+import Tariff_Funcs as tf
+import Intervention_Funcs as itv
+import Time_Funcs as tm
+
+# Default (as hard-coded in "SetupGeyser", "Simulator", "CalcSolPow" and
+# "Change_To_LEDs") and range of every parameter. Rate parameters scale the
+# model's TOU rates of their period in both seasons.
+PARAMETERS = {
+    'R': (1/1.429756, 0.5, 0.9),
+    'tank_volume': (150, 100, 200),
+    'set_temp': (70, 60, 75),
+    'panels': (150, 50, 300),
+    'tilt': (40, 10, 60),
+    'led_double': (14, 9, 20),
+    'led_single': (14, 9, 20),
+    'off_peak_rate': (1.0, 0.8, 1.2),
+    'standard_rate': (1.0, 0.8, 1.2),
+    'peak_rate': (1.0, 0.8, 1.2),
+}
+
+RATE_NAMES = ('off_peak_rate', 'standard_rate', 'peak_rate')
+OUTPUTS = ('building', 'geyser', 'total')
+
+def _Bins(tStamp):
+    '''
+    Cost bin of every slot: month index*6 + 3*high season + TOU period.
+
+    Returns:
+        bins (array[slots]):
+            Bin per slot (flattened).
+        months (list):
+            Months as 'YYYY-MM'.
+    '''
+    times = tm.To_Datetime64(tStamp)
+    periods, high = tf.TOUPeriods(times)
+    month = times.astype('datetime64[M]')
+    months, monthIdx = np.unique(month, return_inverse=True)
+    return monthIdx*6 + 3*high + periods, [str(m) for m in months]
+
+def _BinCost(binEnergy, rates):
+    '''Cost per month from energy per bin (runs, months*6) and rates (runs, 6).'''
+    runs = binEnergy.shape[0]
+    return (binEnergy.reshape(runs, -1, 6)*rates[:, None, :]).sum(axis=-1)
+
+class CostModel:
+    '''
+    Annual and monthly cost as a batched function of the parameters.
+
+    Args:
+        tStamp (array[days,24]):
+            Timestamps of the building load (as "get_LL_data").
+        energy (array[days,24]):
+            Building load per hour (kWh).
+        rates (dict):
+            TOU rates of the tariff studied (see "Tariff_Funcs.SlotRates").
+        gTime (array[days,minutes]):
+            Timestamps of the geyser volumes (as "Runner"); None leaves the
+            geyser out.
+        gVol (array[days,minutes]):
+            Water drawn per minute (litres).
+        site (pvlib Location):
+            Location of the installation (default LaunchLab).
+        solpos (string):
+            Solar position backend (see "Solar_Funcs").
+        schedules (dict):
+            Lighting schedules (default all on, as "Change_To_LEDs").
+        t_amb, t_inlet (float):
+            Geyser ambient and inlet temperatures (as "SetupGeyser").
+        chunk (int):
+            Runs evaluated together on the building side (bounds memory).
+    '''
+
+    def __init__(self, tStamp, energy, rates, gTime=None, gVol=None, site=None, solpos='spa',
+                 schedules=None, t_amb=26, t_inlet=18, chunk=256):
+        rates = tf.CheckRates(rates)
+        self.baseRates = np.concatenate((rates['low'], rates['high']))
+        self.tStamp = np.asarray(tStamp)
+        self.energy = np.asarray(energy, dtype=float)
+        self.schedules = lf.ALWAYS_ON if schedules is None else schedules
+        self.t_amb = t_amb
+        self.t_inlet = t_inlet
+        self.chunk = chunk
+        if(site is None):
+            site = Location(-33.925146, 18.865785, 'Africa/Johannesburg', 136, 'LaunchLab')
+
+        # Solar position and clear sky once for every tilt (as "CalcSolPow")
+        days = self.energy.shape[0]
+        start = tm.To_Datetime64(self.tStamp[0, 0])[0]
+        times = pd.date_range(start=pd.Timestamp(start), periods=days*24, freq='60min')
+        self.sky = sf.ClearSky(times, site, solpos)
+
+        self.bins, self.months = _Bins(self.tStamp)
+        self.onehot = np.zeros((self.bins.size, 6*len(self.months)))
+        self.onehot[np.arange(self.bins.size), self.bins] = 1
+
+        self.gVol = None
+        if(gVol is not None):
+            self.gVol = np.asarray(gVol, dtype=float).reshape(1, 1, -1) # one continuous run
+            self.gBins, self.gMonths = _Bins(gTime)
+
+    def _PanelEnergy(self, tilts):
+        '''Hourly energy of one panel (kWh) per tilt (as "CalcSolPow").'''
+        poa = pvf.TiltedIrradiance(self.sky, tilts, np.full(len(tilts), 180))
+        perPanel = (poa/1000*330*1.3/1000).reshape(len(tilts), *self.energy.shape)
+        itv.TimeShift(2).apply(perPanel) # as "fix_solar"
+        return perPanel
+
+    def _Rates(self, X, names):
+        scale = np.stack([X[:, names.index(n)] for n in RATE_NAMES], axis=1)
+        return self.baseRates[None, :]*np.tile(scale, 2)
+
+    def _Building(self, P, names, rates):
+        '''Monthly building cost (runs, months) after LEDs and PV.'''
+        tilts, tiltIdx = np.unique(P[:, names.index('tilt')], return_inverse=True)
+        perPanel = self._PanelEnergy(tilts)
+        cost = np.empty((P.shape[0], len(self.months)))
+        for s in range(0, P.shape[0], self.chunk):
+            part = slice(s, s + self.chunk)
+            options = [{'watts': {'double': d, 'single': g}} for d, g in
+                       zip(P[part, names.index('led_double')], P[part, names.index('led_single')])]
+            o, energy, saving = lf.ApplyRetrofits(self.tStamp, self.energy, options,
+                                                  lf.LAUNCHLAB_INVENTORY, self.schedules)
+            solar = perPanel[tiltIdx[part]]*P[part, names.index('panels'), None, None]
+            net = np.maximum(energy - solar, 0)
+            cost[part] = _BinCost(net.reshape(net.shape[0], -1) @ self.onehot, rates[part])
+        return cost
+
+    def _Geyser(self, P, names, rates):
+        '''Monthly geyser cost (runs, months), one batched run per distinct setting.'''
+        settings = P[:, [names.index('R'), names.index('tank_volume'), names.index('set_temp')]]
+        unique, idx = np.unique(settings, axis=0, return_inverse=True)
+        params = np.stack((unique[:, 0], unique[:, 1], np.full(len(unique), self.t_amb)), axis=1)
+        binEnergy = cal.SimulateEnergy(params, self.gVol, 50, self.t_inlet, 60, 2,
+                                       unique[:, 2, None], self.gBins, 6*len(self.gMonths))
+        return _BinCost(binEnergy[:, 0][np.ravel(idx)], rates)
+
+    def evaluate(self, P, names):
+        '''
+        Cost for every run.
+
+        Args:
+            P (array[runs,params]):
+                Parameter values per run.
+            names (list):
+                Parameter of every column of P; parameters not given take
+                their PARAMETERS default.
+
+        Returns:
+            outputs (dict):
+                'building', 'geyser' and 'total' annual cost (array[runs]),
+                and monthly cost 'building_months' (array[runs,months]) and
+                'geyser_months'.
+        '''
+        P = np.atleast_2d(np.asarray(P, dtype=float))
+        full = np.array([PARAMETERS[n][0] for n in PARAMETERS], dtype=float)
+        full = np.repeat(full[None], P.shape[0], axis=0)
+        allNames = list(PARAMETERS)
+        for i, n in enumerate(names):
+            full[:, allNames.index(n)] = P[:, i]
+        rates = self._Rates(full, allNames)
+
+        out = {'building_months': self._Building(full, allNames, rates)}
+        out['building'] = out['building_months'].sum(axis=1)
+        if(self.gVol is not None):
+            out['geyser_months'] = self._Geyser(full, allNames, rates)
+            out['geyser'] = out['geyser_months'].sum(axis=1)
+        else:
+            out['geyser'] = np.zeros(P.shape[0])
+        out['total'] = out['building'] + out['geyser']
+        return out
+
+#--------------------Designs------------------#
+def _Ranges(names):
+    lo = np.array([PARAMETERS[n][1] for n in names], dtype=float)
+    hi = np.array([PARAMETERS[n][2] for n in names], dtype=float)
+    return lo, hi
+
+def OATDesign(names):
+    '''
+    One-at-a-time design: the defaults, then every parameter at its low and
+    its high value.
+
+    Returns:
+        P (array[1+2*params,params]):
+            Parameter values per run.
+    '''
+    base = np.array([PARAMETERS[n][0] for n in names], dtype=float)
+    lo, hi = _Ranges(names)
+    P = np.repeat(base[None], 1 + 2*len(names), axis=0)
+    k = np.arange(len(names))
+    P[1 + 2*k, k] = lo
+    P[2 + 2*k, k] = hi
+    return P
+
+def MorrisDesign(names, trajectories=10, levels=4, seed=0):
+    '''
+    Morris elementary effects design: trajectories of params+1 runs on a
+    grid of levels, changing one parameter (in random order) by delta at
+    each run.
+
+    Returns:
+        P (array[trajectories*(params+1),params]):
+            Parameter values per run.
+        U (array[trajectories*(params+1),params]):
+            The same on the unit scale.
+    '''
+    rng = np.random.default_rng(seed)
+    k = len(names)
+    delta = levels/(2*(levels - 1))
+    grid = np.arange(levels)/(levels - 1)
+    start = rng.choice(grid[grid <= 1 - delta + 1e-12], size=(trajectories, k))
+    order = np.argsort(rng.random((trajectories, k)), axis=1)
+    steps = np.zeros((trajectories, k + 1, k))
+    steps[np.arange(trajectories)[:, None], np.arange(1, k + 1)[None, :], order] = delta
+    U = (start[:, None, :] + np.cumsum(steps, axis=1)).reshape(-1, k)
+    lo, hi = _Ranges(names)
+    return lo + U*(hi - lo), U
+
+def SaltelliDesign(names, n=256, seed=0):
+    '''
+    Saltelli design for Sobol indices: base samples A and B and, for every
+    parameter i, A with column i taken from B.
+
+    Returns:
+        P (array[n*(params+2),params]):
+            Runs ordered A, B, AB_1, ..., AB_params.
+    '''
+    rng = np.random.default_rng(seed)
+    k = len(names)
+    A = rng.random((n, k))
+    B = rng.random((n, k))
+    AB = np.repeat(A[None], k, axis=0)
+    AB[np.arange(k), :, np.arange(k)] = B.T
+    U = np.concatenate((A, B, AB.reshape(-1, k)))
+    lo, hi = _Ranges(names)
+    return lo + U*(hi - lo)
+
+#--------------------Indices------------------#
+def OATIndices(P, Y, names):
+    '''
+    One-at-a-time effects.
+
+    Args:
+        Y (array[runs,...]):
+            Output per run of "OATDesign".
+
+    Returns:
+        indices (dict):
+            'effect' (array[params,...]) change in output from the low to the
+            high value, 'elasticity' relative change in output per relative
+            change in the parameter, around the defaults.
+    '''
+    k = len(names)
+    Y = np.asarray(Y, dtype=float)
+    y0, yLo, yHi = Y[0], Y[1::2][:k], Y[2::2][:k]
+    base = P[0]
+    lo, hi = _Ranges(names)
+    extra = (1,)*(Y.ndim - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        elasticity = ((yHi - yLo)/y0)/((hi - lo)/base).reshape((k,) + extra)
+    return {'effect': yHi - yLo, 'elasticity': elasticity}
+
+def MorrisIndices(U, Y, names, trajectories):
+    '''
+    Morris elementary effect statistics.
+
+    Returns:
+        indices (dict):
+            'mu_star' (array[params,...]) mean absolute elementary effect
+            (output change over the full parameter range), 'mu' mean and
+            'sigma' standard deviation of the elementary effects.
+    '''
+    k = len(names)
+    Y = np.asarray(Y, dtype=float)
+    U = U.reshape(trajectories, k + 1, k)
+    Y = Y.reshape((trajectories, k + 1) + Y.shape[1:])
+    dU = np.diff(U, axis=1) # one non-zero per step
+    changed = np.abs(dU).argmax(axis=2)
+    step = np.take_along_axis(dU, changed[..., None], axis=2)[..., 0]
+    dY = np.diff(Y, axis=1)
+    extra = (1,)*(Y.ndim - 2)
+    ee = dY/step.reshape(step.shape + extra)
+    effects = np.empty((trajectories, k) + Y.shape[2:])
+    effects[np.arange(trajectories)[:, None], changed] = ee
+    return {'mu_star': np.abs(effects).mean(axis=0), 'mu': effects.mean(axis=0),
+            'sigma': effects.std(axis=0, ddof=1) if trajectories > 1 else np.zeros(effects.shape[1:])}
+
+def SobolIndices(Y, names, n):
+    '''
+    First order (Saltelli 2010) and total (Jansen) Sobol indices.
+
+    Returns:
+        indices (dict):
+            'S1' and 'ST' (array[params,...]) share of the output variance
+            due to each parameter alone and including interactions.
+    '''
+    k = len(names)
+    Y = np.asarray(Y, dtype=float)
+    yA, yB = Y[:n], Y[n:2*n]
+    yAB = Y[2*n:].reshape((k, n) + Y.shape[1:])
+    var = np.concatenate((yA, yB)).var(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S1 = (yB*(yAB - yA)).mean(axis=1)/var
+        ST = 0.5*((yA - yAB)**2).mean(axis=1)/var
+    return {'S1': S1, 'ST': ST}
+
+def Sensitivity(model, method='oat', names=None, trajectories=10, levels=4, n=256, seed=0):
+    '''
+    Run a sensitivity analysis as one batch of runs.
+
+    Args:
+        model (CostModel):
+            Model to evaluate.
+        method (string):
+            'oat', 'morris' or 'sobol'.
+        names (list):
+            Parameters to vary (default all of PARAMETERS, or those the model
+            uses).
+        trajectories, levels (int):
+            Morris design size.
+        n (int):
+            Sobol base samples (runs are n*(params+2)).
+
+    Returns:
+        result (dict):
+            'names', 'P' (runs), 'outputs' (see "CostModel.evaluate"),
+            'indices' per output (annual outputs and the monthly arrays, with
+            a months axis after params), 'ranking' per annual output
+            (parameter names, most influential first) and 'months'.
+    '''
+    if(names is None):
+        names = [p for p in PARAMETERS
+                 if model.gVol is not None or p not in ('R', 'tank_volume', 'set_temp')]
+    names = list(names)
+    if(method == 'oat'):
+        P = OATDesign(names)
+    elif(method == 'morris'):
+        P, U = MorrisDesign(names, trajectories, levels, seed)
+    elif(method == 'sobol'):
+        P = SaltelliDesign(names, n, seed)
+    else:
+        raise ValueError("method must be 'oat', 'morris' or 'sobol', not '%s'"%method)
+
+    outputs = model.evaluate(P, names)
+    indices = {}
+    ranking = {}
+    for key, Y in outputs.items():
+        if(method == 'oat'):
+            indices[key] = OATIndices(P, Y, names)
+            score = np.abs(indices[key]['effect'])
+        elif(method == 'morris'):
+            indices[key] = MorrisIndices(U, Y, names, trajectories)
+            score = indices[key]['mu_star']
+        else:
+            indices[key] = SobolIndices(Y, names, n)
+            score = indices[key]['ST']
+        if(np.ndim(Y) == 1):
+            ranking[key] = [names[i] for i in np.argsort(-np.nan_to_num(score))]
+
+    months = {'building_months': model.months}
+    if(model.gVol is not None):
+        months['geyser_months'] = model.gMonths
+    return {'names': names, 'P': P, 'outputs': outputs, 'indices': indices,
+            'ranking': ranking, 'months': months}
+
+def RankTable(result, output='total'):
+    '''
+    Ranked sensitivities of one annual output as a DataFrame (parameters
+    as rows, most influential first).
+    '''
+    table = pd.DataFrame({k: v for k, v in result['indices'][output].items()},
+                         index=result['names'])
+    return table.loc[result['ranking'][output]]
@@ -0,0 +1,128 @@
+"""
+The ``Tariff_Funcs`` module contains vectorised time-of-use (TOU) tariff
+functions used to cost energy arrays of shape (days, slots) in one pass,
+with rates that can be changed per scenario.
+
+The bill of the notebook pipeline is the financial model in ``Cost_Funcs``
+("myModels.getFinModel"); use that for costs that must match it. The TOU
+periods here are the Eskom Megaflex periods (weekday peak 07-10 and 18-20,
+standard 06-07, 10-18 and 20-22, Saturday standard 07-12 and 18-20, high
+season June - August), which the municipal TOU tariff follows. There are no
+default rates: every cost needs the rates of the tariff being studied.
+"""
+
+import numpy as np
+import Time_Funcs as tm
+
+OFF_PEAK = 0
+STANDARD = 1
+PEAK = 2
+PERIOD_NAMES = ('off_peak', 'standard', 'peak')
+
+HIGH_SEASON = (6, 7, 8) # June - August
+
+# TOU period per hour of day (0 = off-peak, 1 = standard, 2 = peak)
+WEEKDAY_PERIODS = np.array([0]*6 + [1] + [2]*3 + [1]*8 + [2]*2 + [1]*2 + [0]*2)
+SATURDAY_PERIODS = np.array([0]*7 + [1]*5 + [0]*6 + [1]*2 + [0]*4)
+SUNDAY_PERIODS = np.zeros(24, dtype=int)
+
+def TOUPeriods(tStamp):
+    '''
+    Classify timestamps in to TOU periods.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps (object array of datetimes or datetime64).
+
+    Returns:
+        periods (array[days,slots]):
+            TOU period per timestamp (OFF_PEAK, STANDARD or PEAK).
+        high (array[days,slots]):
+            True where the timestamp falls in the high-demand season.
+    '''
+    shape = np.shape(tStamp)
+    times = tm.To_Datetime64(tStamp)
+    days = times.astype('datetime64[D]')
+    weekday = (days.astype(np.int64) + 3) % 7 # 1970-01-01 was a Thursday
+    hour = ((times - days).astype('timedelta64[h]')).astype(np.int64)
+    month = times.astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+    periods = np.where(weekday < 5, WEEKDAY_PERIODS[hour],
+                       np.where(weekday == 5, SATURDAY_PERIODS[hour],
+                                SUNDAY_PERIODS[hour]))
+    high = np.isin(month, HIGH_SEASON)
+    return periods.reshape(shape), high.reshape(shape)
+
+def CheckRates(rates):
+    '''
+    Check TOU rates and return them as {'high': array[3], 'low': array[3]}.
+    '''
+    if(rates is None):
+        raise ValueError("TOU rates are required: {'high': (off-peak, standard, peak), "
+                         "'low': (...)} in R/kWh")
+    checked = {}
+    for season in ('high', 'low'):
+        checked[season] = np.asarray(rates.get(season, ()), dtype=float)
+        if(checked[season].shape != (3,)):
+            raise ValueError("TOU rates need 'high' and 'low' rates for (off-peak, standard, peak)")
+    return checked
+
+def SlotRates(tStamp, rates):
+    '''
+    Get the energy rate (R/kWh) that applies to each timestamp.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps (object array of datetimes or datetime64).
+        rates (dict):
+            {'high': (off-peak, standard, peak), 'low': (...)} in R/kWh.
+
+    Returns:
+        slotRates (array[days,slots]):
+            Rate per timestamp in R/kWh.
+    '''
+    rates = CheckRates(rates)
+    periods, high = TOUPeriods(tStamp)
+    return np.where(high, rates['high'][periods], rates['low'][periods])
+
+def PeriodCost(tStamp, energy, rates):
+    '''
+    Cost of energy per period.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps for energy data.
+        energy (array[...,days,slots]):
+            Energy in kWh per slot. Leading axes (e.g. scenarios) broadcast.
+        rates (dict):
+            TOU rates as for "SlotRates".
+
+    Returns:
+        cost (array[...,days,slots]):
+            Cost in Rand per slot.
+    '''
+    return np.asarray(energy) * SlotRates(tStamp, rates)
+
+def MonthTotals(tStamp, data):
+    '''
+    Sum data per calendar month.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps for data (in time order).
+        data (array[...,days,slots]):
+            Values to total, e.g. output of "PeriodCost". Leading axes are kept.
+
+    Returns:
+        months (list):
+            Months as 'YYYY-MM'.
+        totals (array[...,months]):
+            Total per month.
+    '''
+    times = tm.To_Datetime64(tStamp)
+    data = np.asarray(data)
+    flat = data.reshape(data.shape[:data.ndim-np.ndim(tStamp)] + (times.size,))
+    monthIdx = times.astype('datetime64[M]')
+    starts = np.concatenate(([0], np.flatnonzero(monthIdx[1:] != monthIdx[:-1]) + 1))
+    months = [str(monthIdx[s]) for s in starts]
+    return months, np.add.reduceat(flat, starts, axis=-1)
@@ -0,0 +1,240 @@
+"""
+The ``Time_Funcs`` module contains a regular time index (start, step,
+length) used to look up dates and to align load, solar and geyser volume
+series by timestamp without scanning or copying the data.
+"""
+
+import datetime as dt
+import numpy as np
+
+def To_Datetime64(tStamp):
+    '''
+    Convert timestamps (nested lists or object arrays of datetimes, as
+    returned by "Runner", "To_Days_Hrs" and "To_Days_5Mins") to a flat
+    datetime64 array. Timezone-aware timestamps keep their local wall time.
+
+    Args:
+        tStamp (array[days,slots] or list):
+            Timestamps in any shape.
+
+    Returns:
+        times (array[n]):
+            Flattened timestamps as datetime64[s].
+    '''
+    tStamp = np.asarray(tStamp)
+    if(np.issubdtype(tStamp.dtype, np.datetime64)):
+        return tStamp.astype('datetime64[s]').ravel()
+    flat = tStamp.ravel()
+    # Naive datetimes convert in bulk; numpy would convert aware ones to UTC,
+    # so those keep their local wall time one by one below
+    if(all(getattr(d, 'tzinfo', None) is None for d in flat)):
+        try:
+            return flat.astype('datetime64[s]')
+        except (TypeError, ValueError):
+            pass
+    times = np.empty(flat.size, dtype='datetime64[s]')
+    for i in range(flat.size):
+        d = flat[i]
+        if(hasattr(d, 'to_pydatetime')): # pandas Timestamp
+            d = d.to_pydatetime()
+        times[i] = np.datetime64(d.replace(tzinfo=None), 's')
+    return times
+
+def To_Step(step):
+    '''
+    Convert a step in minutes, a timedelta or a timedelta64 to timedelta64[s].
+    '''
+    if(isinstance(step, (np.timedelta64, dt.timedelta))):
+        return np.timedelta64(step).astype('timedelta64[s]')
+    return np.timedelta64(int(round(step*60)), 's')
+
+class TimeIndex:
+    '''
+    Regular time axis described by its first timestamp, step and length.
+    Dates are converted to offsets (and back) arithmetically, so look-ups do
+    not depend on the length of the data.
+
+    Args:
+        start (datetime or datetime64):
+            First timestamp.
+        step (int, timedelta or timedelta64):
+            Interval between timestamps (int/float in minutes).
+        length (int):
+            Number of timestamps.
+    '''
+
+    def __init__(self, start, step, length):
+        if(isinstance(start, dt.datetime)):
+            start = start.replace(tzinfo=None)
+        self.start = np.datetime64(start, 's')
+        self.step = To_Step(step)
+        self.length = int(length)
+
+    @classmethod
+    def fromTimes(cls, tStamp):
+        '''
+        Create the index for an array of timestamps, e.g. the (days, slots)
+        timestamps from "get_LL_data" or "Runner" (taken in row order).
+        Raises ValueError if the timestamps are not regularly spaced.
+        '''
+        times = To_Datetime64(tStamp)
+        if(times.size < 2):
+            raise ValueError("Need at least two timestamps to find the step")
+        step = times[1] - times[0]
+        if((np.diff(times) != step).any()):
+            raise ValueError("Timestamps are not regularly spaced")
+        return cls(times[0], step, times.size)
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return 'TimeIndex(start=%s, step=%s, length=%d)'%(self.start, self.step, self.length)
+
+    @property
+    def end(self):
+        '''First timestamp after the index.'''
+        return self.start + self.length*self.step
+
+    def times(self):
+        '''All timestamps of the index (datetime64[s]).'''
+        return self.start + np.arange(self.length)*self.step
+
+    def dateAt(self, offset):
+        '''Timestamp at offset.'''
+        if(offset < 0):
+            offset += self.length
+        return self.start + offset*self.step
+
+    def offsets(self, dates, floor=False):
+        '''
+        Offsets of dates in the index.
+
+        Args:
+            dates (array of datetimes or datetime64):
+                Dates to look up.
+            floor (bool):
+                Round dates between timestamps down to the previous one
+                instead of raising KeyError.
+
+        Returns:
+            offsets (array):
+                Offset of every date (same shape as dates).
+        '''
+        shape = np.shape(dates)
+        delta = To_Datetime64(dates) - self.start
+        offsets = delta // self.step
+        if(not floor and (delta % self.step != np.timedelta64(0, 's')).any()):
+            raise KeyError("Date between timestamps of %r"%self)
+        if(((offsets < 0) | (offsets >= self.length)).any()):
+            raise KeyError("Date outside %r"%self)
+        return offsets.astype(np.int64).reshape(shape)
+
+    def offset(self, date, floor=False):
+        '''Offset of one date in the index (see "offsets").'''
+        return int(self.offsets([date], floor)[0])
+
+    def sliceOf(self, startDate, endDate):
+        '''
+        Slice selecting the timestamps from startDate up to but not including
+        endDate (either may be None for the start/end of the index).
+        '''
+        first = 0 if startDate is None else self.offset(startDate, floor=True)
+        if(endDate is None):
+            return slice(first, self.length)
+        endDate = To_Datetime64([endDate])[0]
+        last = int(-((self.start - endDate) // self.step)) # ceiling
+        return slice(first, min(max(last, first), self.length))
+
+    def join(self, other, how='inner'):
+        '''
+        Join with another index with the same step and phase.
+
+        Args:
+            other (TimeIndex):
+                Index to join with.
+            how (string):
+                'inner' for the common period, 'outer' for the combined period.
+
+        Returns:
+            joined (TimeIndex):
+                Index of the joined period.
+            selfSlice, otherSlice (slice):
+                For 'inner': the part of each index in the joined period.
+                For 'outer': where each index is placed in the joined period.
+        '''
+        if(self.step != other.step):
+            raise ValueError("Cannot join indices with steps %s and %s"%(self.step, other.step))
+        if((other.start - self.start) % self.step != np.timedelta64(0, 's')):
+            raise ValueError("Timestamps of %r and %r do not line up"%(self, other))
+
+        if(how == 'inner'):
+            start = max(self.start, other.start)
+            length = max(int((min(self.end, other.end) - start) // self.step), 0)
+        elif(how == 'outer'):
+            start = min(self.start, other.start)
+            length = int((max(self.end, other.end) - start) // self.step)
+        else:
+            raise ValueError("how must be 'inner' or 'outer', not '%s'"%how)
+        joined = TimeIndex(start, self.step, length)
+
+        slices = []
+        for idx in (self, other):
+            if(how == 'inner'):
+                first = int((start - idx.start) // idx.step)
+            else:
+                first = int((idx.start - start) // idx.step)
+            slices.append(slice(first, first + (length if how == 'inner' else idx.length)))
+        return joined, slices[0], slices[1]
+
+def AlignSeries(series, how='inner', slots=None, fill=np.nan):
+    '''
+    Align several series on their timestamps, e.g. hourly load, solar and
+    geyser volume arrays that start and end on different days.
+
+    For an inner join the returned arrays are views in to the inputs (no
+    data is copied); an outer join allocates new arrays padded with fill.
+
+    Args:
+        series (list of (TimeIndex, array)):
+            Each array has its time axis first, either flat (n, ...) or as
+            (days, slots, ...) with days*slots equal to the index length.
+        how (string):
+            'inner' or 'outer'.
+        slots (int):
+            Reshape the results to (days, slots, ...). Requires the joined
+            period to be whole days of slots.
+        fill (float):
+            Value for timestamps missing from a series ('outer' only).
+
+    Returns:
+        joined (TimeIndex):
+            Index of the aligned series.
+        aligned (list of arrays):
+            The aligned data, in the order of series.
+    '''
+    flat = []
+    for idx, data in series:
+        data = np.asarray(data)
+        if(data.shape[0] != len(idx)):
+            data = data.reshape((len(idx),) + data.shape[2:])
+        flat.append((idx, data))
+
+    joined = flat[0][0]
+    for idx, data in flat[1:]:
+        joined = joined.join(idx, how)[0]
+
+    aligned = []
+    for idx, data in flat:
+        if(how == 'inner'):
+            part = data[joined.join(idx, 'inner')[2]]
+        else:
+            part = np.full((len(joined),) + data.shape[1:], fill,
+                           dtype=np.result_type(data.dtype, np.min_scalar_type(fill)))
+            part[joined.join(idx, 'outer')[2]] = data
+        if(slots is not None):
+            if(len(joined) % slots):
+                raise ValueError("%d timestamps are not whole days of %d slots"%(len(joined), slots))
+            part = part.reshape((-1, slots) + part.shape[1:])
+        aligned.append(part)
+    return joined, aligned
@@ -0,0 +1,205 @@
+"""
+The ``Validate_Funcs`` module contains vectorised functions for loading
+metering CSV files on to a regular time grid. Rows are parsed in bulk, bad
+values, duplicates, out-of-order timestamps and gaps are flagged with masks
+and missing slots are filled, instead of dropping bad rows one at a time.
+"""
+
+import numpy as np
+import pandas as pd
+
+FILL_STRATEGIES = (None, 'zero', 'interpolate', 'previous_day')
+
+def LoadCSVGrid(Filename, time_col, value_cols, step_minutes,
+                time_format='%d/%m/%Y %H:%M', fill='interpolate'):
+    '''
+    Load a CSV file and place its values on a regular time grid.
+
+    Args:
+        Filename (string):
+            Input form 'Filename.csv'.
+        time_col (string):
+            Name of the timestamp column.
+        value_cols (list of strings):
+            Names of the numeric columns to load.
+        step_minutes (int):
+            Interval of the data in minutes. None infers it from the data.
+        time_format (string):
+            strptime format of the timestamps.
+        fill (string):
+            Gap filling strategy, one of FILL_STRATEGIES (see "FillGaps").
+
+    Returns:
+        gridTimes (array[slots]):
+            Regular timestamps (datetime64[s]) from first to last valid row.
+        gridValues (array[slots,columns]):
+            Values per slot, in the order of value_cols.
+        report (dict):
+            Data quality report (see "RegularGrid").
+    '''
+    value_cols = list(value_cols)
+    frame = pd.read_csv(Filename, usecols=[time_col] + value_cols, dtype=str)
+    times = pd.to_datetime(frame[time_col], format=time_format, errors='coerce').values
+    values = np.column_stack([pd.to_numeric(frame[c], errors='coerce').values
+                              for c in value_cols]).astype(float)
+    gridTimes, gridValues, report = RegularGrid(times, values, step_minutes, fill)
+    report['columns'] = value_cols
+    return gridTimes, gridValues, report
+
+def RegularGrid(times, values, step_minutes, fill='interpolate'):
+    '''
+    Place timestamped values on a regular grid, flagging data problems.
+
+    Rows with bad timestamps are dropped, out-of-order rows are put in their
+    correct slot and for duplicated slots the first row is kept. Slots with
+    no row or a NaN value are filled according to fill.
+
+    Args:
+        times (array[rows]):
+            Timestamps (datetime64, NaT for unparsable values).
+        values (array[rows,columns]):
+            Values per row (NaN for unparsable values).
+        step_minutes (int):
+            Interval of the grid in minutes. None uses the most common
+            interval between consecutive rows.
+        fill (string):
+            Gap filling strategy, one of FILL_STRATEGIES.
+
+    Returns:
+        gridTimes (array[slots]):
+            Regular timestamps (datetime64[s]).
+        gridValues (array[slots,columns]):
+            Values per slot.
+        report (dict):
+            'rows', 'bad_time', 'out_of_order', 'duplicates', 'off_grid' (row
+            counts), 'nan' (NaN values per column), 'missing' (slots with no
+            row), 'filled' (values actually filled per column), 'gaps' (array of
+            (start time, slots) for every run of slots with a missing or NaN
+            value), 'masks'
+            (dict of the row/slot masks used for the counts).
+    '''
+    times = np.asarray(times).astype('datetime64[s]')
+    values = np.asarray(values, dtype=float)
+    if(values.ndim == 1):
+        values = values[:, None]
+
+    badTime = np.isnat(times)
+    valid = np.flatnonzero(~badTime)
+    t = times[valid]
+    if(t.size == 0):
+        raise ValueError("no rows with a valid timestamp (%d rows)"%times.size)
+    if(step_minutes is None):
+        steps, counts = np.unique(np.diff(np.sort(t)), return_counts=True)
+        counts[steps <= np.timedelta64(0, 's')] = 0
+        if(not counts.any()):
+            raise ValueError("cannot infer the interval from %d distinct timestamp(s), "
+                             "give step_minutes"%np.unique(t).size)
+        step_minutes = float(steps[np.argmax(counts)] / np.timedelta64(1, 'm'))
+    step = np.timedelta64(int(round(step_minutes*60)), 's')
+    outOfOrder = np.zeros(times.size, dtype=bool)
+    outOfOrder[valid[1:]] = t[1:] < np.maximum.accumulate(t)[:-1]
+
+    # Snap every valid row to a slot of the grid
+    start = t.min()
+    offset = (t - start) / step
+    slot = np.rint(offset).astype(np.int64)
+    offGrid = np.zeros(times.size, dtype=bool)
+    offGrid[valid] = slot != offset
+
+    order = np.argsort(slot, kind='stable') # stable, so the first duplicate wins
+    slot = slot[order]
+    rows = valid[order]
+    first = np.ones(slot.size, dtype=bool)
+    first[1:] = slot[1:] != slot[:-1]
+    duplicate = np.zeros(times.size, dtype=bool)
+    duplicate[rows[~first]] = True
+
+    n = slot[-1] + 1
+    gridTimes = start + np.arange(n) * step
+    gridValues = np.full((n, values.shape[1]), np.nan)
+    gridValues[slot[first]] = values[rows[first]]
+    noRow = np.ones(n, dtype=bool)
+    noRow[slot[first]] = False
+
+    missing = np.isnan(gridValues)
+    gridValues = FillGaps(gridValues, missing, fill, int(round(24*60/step_minutes)))
+
+    # Runs of slots with any missing value, as (start, length)
+    anyMissing = np.concatenate(([False], missing.any(axis=1), [False]))
+    edges = np.flatnonzero(anyMissing[1:] != anyMissing[:-1])
+    gaps = np.empty(edges.size//2, dtype=[('start', 'datetime64[s]'), ('slots', np.int64)])
+    gaps['start'] = gridTimes[edges[0::2]]
+    gaps['slots'] = edges[1::2] - edges[0::2]
+
+    report = {
+        'rows': times.size,
+        'step_minutes': step_minutes,
+        'bad_time': int(badTime.sum()),
+        'out_of_order': int(outOfOrder.sum()),
+        'duplicates': int(duplicate.sum()),
+        'off_grid': int(offGrid.sum()),
+        'nan': np.isnan(values).sum(axis=0).tolist(),
+        'missing': int(noRow.sum()),
+        'filled': (missing & ~np.isnan(gridValues)).sum(axis=0).tolist(),
+        'gaps': gaps,
+        'masks': {'bad_time': badTime, 'out_of_order': outOfOrder,
+                  'duplicate': duplicate, 'off_grid': offGrid,
+                  'missing': missing},
+    }
+    return gridTimes, gridValues, report
+
+def FillGaps(values, missing, fill='interpolate', slots_per_day=288):
+    '''
+    Fill missing values on a regular grid.
+
+    Args:
+        values (array[slots,columns]):
+            Values on a regular grid.
+        missing (array[slots,columns]):
+            True where a value must be filled.
+        fill (string):
+            None: leave as NaN,
+            'zero': fill with 0,
+            'interpolate': linear interpolation between neighbouring values,
+            'previous_day': value of the same slot on the closest earlier day
+            with data (interpolation where there is no earlier day).
+        slots_per_day (int):
+            Grid slots per day, used for 'previous_day'.
+
+    Returns:
+        values (array[slots,columns]):
+            Filled copy of values.
+    '''
+    if(fill not in FILL_STRATEGIES):
+        raise ValueError("Unknown fill strategy '%s', use one of %s"%(fill, FILL_STRATEGIES))
+    values = np.array(values, dtype=float)
+    if(fill is None or not missing.any()):
+        return values
+
+    if(fill == 'zero'):
+        values[missing] = 0
+        return values
+
+    if(fill == 'previous_day'):
+        n = values.shape[0]
+        days = -(-n // slots_per_day)
+        pad = days*slots_per_day - n
+        byDay = np.concatenate((values, np.full((pad, values.shape[1]), np.nan)))
+        byDay = byDay.reshape(days, slots_per_day, -1)
+        good = np.concatenate((~missing, np.zeros((pad, values.shape[1]), bool)))
+        good = good.reshape(days, slots_per_day, -1)
+        # Index of the latest day with data for each (day, slot, column)
+        lastGood = np.where(good, np.arange(days)[:, None, None], -1)
+        lastGood = np.maximum.accumulate(lastGood, axis=0)
+        filled = np.take_along_axis(byDay, np.maximum(lastGood, 0), axis=0)
+        filled[lastGood < 0] = np.nan
+        values = filled.reshape(days*slots_per_day, -1)[:n]
+        missing = np.isnan(values)
+
+    # Linear interpolation, column by column
+    idx = np.arange(values.shape[0])
+    for c in range(values.shape[1]):
+        gap = missing[:, c]
+        if(gap.any() and not gap.all()):
+            values[gap, c] = np.interp(idx[gap], idx[~gap], values[~gap, c])
+    return values
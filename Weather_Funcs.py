@@ -0,0 +1,394 @@
+"""
+The ``Weather_Funcs`` module contains weather-driven PV generation: PV from
+a local TMY/weather CSV file (GHI, DNI, DHI, air temperature) instead of
+clear-sky irradiance, and stochastic cloud-cover ensembles that give
+(members, days, slots) generation arrays in one vectorised pass. Billing all
+members gives confidence intervals on PV savings.
+
+Example:
+    pv, tStamp = EnsemblePV(start, end, members=100)
+    interval = SavingsInterval(tStamp, load, pv/1000, rates)
+"""
+
+import datetime as dt
+import numpy as np
+import pandas as pd
+from pvlib.location import Location
+import Validate_Funcs as vf
+import Solar_Funcs as sf
+import Tariff_Funcs as tf
+import Intervention_Funcs as itv
+
+WEATHER_COLUMNS = ('ghi', 'dni', 'dhi', 'temp_air')
+
+# Indicative cloud model per calendar month (Jan-Dec) for the Western Cape:
+# mean and standard deviation of the daily clear-sky index, day to day
+# correlation and hour to hour variation within a day. Fit a site with
+# "FitCloudModel" where measured data is available.
+DEFAULT_CLOUD = {
+    'mean': np.array([0.88, 0.88, 0.84, 0.78, 0.70, 0.62, 0.62, 0.66, 0.74, 0.80, 0.84, 0.87]),
+    'std': np.array([0.12, 0.12, 0.15, 0.18, 0.22, 0.25, 0.25, 0.24, 0.20, 0.17, 0.14, 0.12]),
+    'lag1': 0.4,
+    'hourly_std': 0.15,
+}
+
+def LoadWeather(Filename, time_col='time', columns=WEATHER_COLUMNS, step_minutes=60,
+                time_format='%Y-%m-%d %H:%M', fill='interpolate'):
+    '''
+    Load a weather or TMY CSV file on to a regular grid.
+
+    Args:
+        Filename (string):
+            Input form 'Filename.csv'.
+        time_col (string):
+            Name of the timestamp column.
+        columns (tuple of strings):
+            Irradiance (W/m^2) and temperature (C) columns, named as in
+            WEATHER_COLUMNS.
+        step_minutes (int):
+            Interval of the data in minutes.
+        time_format (string):
+            strptime format of the timestamps (same time base as the PV
+            model times, see "Solar_Funcs").
+        fill (string):
+            Gap filling strategy (see "Validate_Funcs.FillGaps").
+
+    Returns:
+        weather (dict):
+            'times' (datetime64[s]) and an array per column.
+        report (dict):
+            Data quality report from "Validate_Funcs.LoadCSVGrid".
+    '''
+    times, values, report = vf.LoadCSVGrid(Filename, time_col, list(columns), step_minutes,
+                                           time_format, fill)
+    weather = {'times': times}
+    for i, c in enumerate(columns):
+        weather[c] = values[:, i]
+    return weather, report
+
+def _MinuteOfYear(times):
+    '''Minutes in to a non-leap year (29 February uses 28 February).'''
+    times = np.asarray(times).astype('datetime64[m]')
+    years = times.astype('datetime64[Y]')
+    offset = (times - years).astype(np.int64)
+    year = years.astype(np.int64) + 1970
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    return offset - 1440*(leap & (offset >= 59*1440))
+
+def MapToDays(weather, times):
+    '''
+    Map weather data on to other timestamps by day of year and time of day,
+    e.g. a typical meteorological year (TMY) on to the days of the load data.
+
+    Args:
+        weather (dict):
+            Output of "LoadWeather".
+        times (array):
+            Timestamps to map to (any shape).
+
+    Returns:
+        mapped (dict):
+            Each weather column at times (NaN where the weather data has no
+            value for that day and time).
+    '''
+    step = int((weather['times'][1] - weather['times'][0]) // np.timedelta64(1, 'm'))
+    rows = 365*24*60//step
+    source = _MinuteOfYear(weather['times'])//step
+    target = _MinuteOfYear(pd.DatetimeIndex(np.ravel(times)).values)//step % rows
+    mapped = {}
+    for c in weather:
+        if(c == 'times'):
+            continue
+        table = np.full(rows, np.nan)
+        table[source % rows] = weather[c]
+        mapped[c] = table[target].reshape(np.shape(times))
+    return mapped
+
+def ErbsFraction(ghi, zenith, dni_extra):
+    '''
+    Erbs diffuse fraction (DHI/GHI) for arrays of any (broadcastable) shape.
+
+    Returns:
+        fraction (array):
+            Diffuse fraction.
+        up (array):
+            True where the sun is more than ~3.7 degrees up (DNI is 0
+            otherwise).
+    '''
+    cosZen = np.cos(np.radians(zenith))
+    up = cosZen > 0.065
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kt = np.clip(np.where(up, ghi/(dni_extra*cosZen), 0), 0, 1)
+    fraction = np.where(kt <= 0.22, 1 - 0.09*kt,
+                        np.where(kt <= 0.8, 0.9511 - 0.1604*kt + 4.388*kt**2 - 16.638*kt**3 + 12.336*kt**4,
+                                 0.165))
+    return fraction, up
+
+def Erbs(ghi, zenith, dni_extra):
+    '''
+    Split GHI in to DNI and DHI with the Erbs diffuse fraction model.
+
+    Returns:
+        dni, dhi (array):
+            Direct normal and diffuse horizontal irradiance (W/m^2).
+    '''
+    fraction, up = ErbsFraction(ghi, zenith, dni_extra)
+    dhi = fraction*ghi
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dni = np.where(up, (ghi - dhi)/np.cos(np.radians(zenith)), 0)
+    return np.maximum(dni, 0), dhi
+
+def CloudySplit(index, clear, zenith, dni_extra):
+    '''
+    GHI, DNI and DHI under clouds from the clear-sky irradiance and a
+    clear-sky index. The diffuse fraction moves from the clear-sky value
+    (index 1) towards fully diffuse as the Erbs fraction does, so a cloudless
+    member gives the clear-sky irradiance exactly.
+
+    Args:
+        index (array[...,n]):
+            Clear-sky index.
+        clear (dict of array[n]):
+            Clear-sky 'ghi', 'dni' and 'dhi'.
+        zenith, dni_extra (array[n]):
+            Solar zenith (degrees) and extraterrestrial irradiance.
+
+    Returns:
+        ghi, dni, dhi (array[...,n]):
+            Irradiance (W/m^2).
+    '''
+    clearGhi = np.nan_to_num(np.asarray(clear['ghi'], dtype=float))
+    clearDni = np.nan_to_num(np.asarray(clear['dni'], dtype=float))
+    clearDhi = np.nan_to_num(np.asarray(clear['dhi'], dtype=float))
+    ghi = index*clearGhi
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fClear = np.where(clearGhi > 0, np.minimum(clearDhi/clearGhi, 1), 1)
+        fErbs0 = ErbsFraction(clearGhi, zenith, dni_extra)[0]
+        towards = np.clip(np.nan_to_num((ErbsFraction(ghi, zenith, dni_extra)[0] - fErbs0)/(1 - fErbs0)), 0, 1)
+    # Direct share of GHI falls from the clear-sky share to 0
+    direct = 1 - towards
+    dhi = ghi - index*(clearGhi - clearDhi)*direct
+    dni = index*clearDni*direct
+    return ghi, dni, dhi
+
+def FitCloudModel(times, ghi, clear_ghi):
+    '''
+    Fit the cloud model to measured irradiance.
+
+    Args:
+        times (array[days,slots]):
+            Timestamps of whole days.
+        ghi (array[days,slots]):
+            Measured GHI.
+        clear_ghi (array[days,slots]):
+            Clear-sky GHI at the same times ("ClearSky" 'clear').
+
+    Returns:
+        cloud (dict):
+            Cloud model as DEFAULT_CLOUD (months without data keep the
+            default values).
+    '''
+    ghi = np.asarray(ghi, dtype=float)
+    clear = np.asarray(clear_ghi, dtype=float)
+    daily = np.clip(np.nansum(ghi, axis=1)/np.maximum(clear.sum(axis=1), 1e-9), 0, 1.2)
+    months = pd.DatetimeIndex(np.asarray(times)[:, 0]).month.values - 1
+
+    cloud = {k: np.array(v, dtype=float) for k, v in DEFAULT_CLOUD.items()}
+    count = np.bincount(months, minlength=12)
+    have = count > 1
+    mean = np.bincount(months, weights=daily, minlength=12)/np.maximum(count, 1)
+    var = np.bincount(months, weights=(daily - mean[months])**2, minlength=12)/np.maximum(count - 1, 1)
+    cloud['mean'] = np.where(have, mean, cloud['mean'])
+    cloud['std'] = np.where(have, np.sqrt(var), cloud['std'])
+
+    anomaly = (daily - cloud['mean'][months])/np.maximum(cloud['std'][months], 1e-9)
+    if(anomaly.size > 2):
+        cloud['lag1'] = float(np.clip(np.corrcoef(anomaly[:-1], anomaly[1:])[0, 1], 0, 0.95))
+
+    # Hourly variation of the clear-sky index around the daily value (sun up)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hourly = ghi/clear/daily[:, None]
+    hourly = hourly[(clear > 50) & np.isfinite(hourly)]
+    if(hourly.size > 1):
+        cloud['hourly_std'] = float(np.std(hourly))
+    return cloud
+
+def CloudIndex(months, members, slots=24, cloud=None, seed=0):
+    '''
+    Stochastic clear-sky index: a daily value following a correlated
+    (AR(1)) truncated normal process per month, times an hour to hour
+    variation within the day.
+
+    Args:
+        months (array[days]):
+            Calendar month (1-12) of every day.
+        members (int):
+            Number of ensemble members.
+        slots (int):
+            Slots per day.
+        cloud (dict):
+            Cloud model (default DEFAULT_CLOUD, or from "FitCloudModel").
+        seed (int):
+            Random seed.
+
+    Returns:
+        index (array[members,days,slots]):
+            Clear-sky index (0 to 1.2).
+    '''
+    if(cloud is None):
+        cloud = DEFAULT_CLOUD
+    rng = np.random.default_rng(seed)
+    months = np.asarray(months) - 1
+    days = months.size
+    rho = cloud['lag1']
+
+    # Day to day correlated anomalies, one step per day across all members
+    noise = rng.standard_normal((days, members))
+    anomaly = np.empty((days, members))
+    anomaly[0] = noise[0]
+    for d in range(1, days):
+        anomaly[d] = rho*anomaly[d-1] + np.sqrt(1 - rho*rho)*noise[d]
+    daily = np.clip(np.asarray(cloud['mean'])[months, None] + np.asarray(cloud['std'])[months, None]*anomaly,
+                    0.05, 1.0).T
+
+    # Smooth hour to hour variation, stronger on partly cloudy days
+    hourly = rng.standard_normal((members, days, slots))
+    hourly = (hourly + np.roll(hourly, 1, axis=-1) + np.roll(hourly, -1, axis=-1))/np.sqrt(3)
+    partly = 4*daily*(1 - daily) # 0 for clear or overcast days, 1 at 0.5
+    return np.clip(daily[..., None]*(1 + cloud['hourly_std']*partly[..., None]*hourly), 0, 1.2)
+
+def _Times(startDay, endDay, tz):
+    dayAmount = (endDay-startDay).days
+    times = pd.date_range(start=startDay, periods=(dayAmount+1)*24, freq='60min')
+    solTimes = times if tz is None else times.tz_localize(tz)
+    return dayAmount+1, times, solTimes
+
+def _Site(site):
+    if(site is None):
+        site = Location(-33.925146, 18.865785, 'Africa/Johannesburg', 136, 'LaunchLab')
+    return site
+
+def WeatherPV(startDay, endDay, weather, number_panels=150, site=None, solpos='spa',
+              tilt=40, azimuth=180, tz=None):
+    '''
+    PV generation per hour from weather data mapped on to the days from
+    startDay to endDay (see "MapToDays"), with the panel model of
+    "CalcSolPow".
+
+    Args:
+        startDay, endDay (datetime):
+            First and last day.
+        weather (dict):
+            Output of "LoadWeather".
+        number_panels (int):
+            Number of panels installed.
+        site (pvlib Location):
+            Location of the installation (default LaunchLab).
+        solpos (string):
+            Solar position backend (see "Solar_Funcs").
+        tilt, azimuth (float):
+            Panel orientation in degrees.
+        tz (string):
+            Time zone of the timestamps for the solar position (None takes
+            them as UTC, as "CalcSolPow" does).
+
+    Returns:
+        solarPow (array[days,24]):
+            Energy per hour (Wh).
+        tStamp (array[days,24]):
+            Timestamps (datetime64[s]).
+        temp_air (array[days,24]):
+            Air temperature (C), NaN if not in the weather data.
+    '''
+    days, times, solTimes = _Times(startDay, endDay, tz)
+    mapped = MapToDays(weather, times.values)
+    irrad = pd.DataFrame({c: np.nan_to_num(mapped[c]) for c in ('ghi', 'dni', 'dhi')}, index=solTimes)
+    poa = sf.PlaneOfArray(sf.ClearSky(solTimes, _Site(site), solpos, irrad=irrad), tilt, azimuth)
+    solarPow = (np.nan_to_num(poa)/1000)*330*number_panels*1.3
+    temp = mapped.get('temp_air', np.full(times.size, np.nan))
+    tStamp = times.values.astype('datetime64[s]').reshape(days, 24)
+    return solarPow.reshape(days, 24), tStamp, np.asarray(temp).reshape(days, 24)
+
+def EnsemblePV(startDay, endDay, members=100, number_panels=150, site=None, cloud=None,
+               solpos='spa', tilt=40, azimuth=180, tz=None, seed=0):
+    '''
+    Stochastic PV generation ensemble. Solar position, clear-sky irradiance
+    and the transposition factors are computed once; every member's GHI is
+    the clear-sky GHI times a stochastic clear-sky index ("CloudIndex"),
+    split in to DNI and DHI ("CloudySplit") and transposed with numpy.
+
+    Args:
+        startDay, endDay (datetime):
+            First and last day.
+        members (int):
+            Number of ensemble members.
+        number_panels (int):
+            Number of panels installed.
+        site (pvlib Location):
+            Location of the installation (default LaunchLab).
+        cloud (dict):
+            Cloud model (default DEFAULT_CLOUD).
+        solpos (string):
+            Solar position backend (see "Solar_Funcs").
+        tilt, azimuth (float):
+            Panel orientation in degrees (azimuth 180 as in "CalcSolPow"
+            faces south; 0 faces north, towards the sun at LaunchLab).
+        tz (string):
+            Time zone of the timestamps for the solar position (see
+            "WeatherPV").
+        seed (int):
+            Random seed.
+
+    Returns:
+        solarPow (array[members,days,24]):
+            Energy per hour (Wh).
+        tStamp (array[days,24]):
+            Timestamps (datetime64[s]).
+    '''
+    days, times, solTimes = _Times(startDay, endDay, tz)
+    sky = sf.ClearSky(solTimes, _Site(site), solpos)
+    fDni, fDhi, fGhi = sf.POAFactors(sky, tilt, azimuth)
+
+    shape = (days, 24)
+    months = times.month.values[::24]
+    index = CloudIndex(months, members, 24, cloud, seed)
+    clear = {c: sky['clear'][c].values.reshape(shape) for c in ('ghi', 'dni', 'dhi')}
+    ghi, dni, dhi = CloudySplit(index, clear, sky['solpos']['zenith'].values.reshape(shape),
+                                np.asarray(sky['dni_extra']).reshape(shape))
+    poa = fDni.reshape(shape)*dni + fDhi.reshape(shape)*dhi + fGhi.reshape(shape)*ghi
+    solarPow = (poa/1000)*330*number_panels*1.3
+    return solarPow, times.values.astype('datetime64[s]').reshape(shape)
+
+def SavingsInterval(tStamp, load, solar, rates, quantiles=(0.05, 0.5, 0.95)):
+    '''
+    TOU energy cost savings of PV for every ensemble member, with quantiles.
+
+    Args:
+        tStamp (array[days,slots]):
+            Timestamps of the load.
+        load (array[days,slots]):
+            Energy consumption per slot (kWh).
+        solar (array[members,days,slots]):
+            PV energy per slot (kWh), e.g. "EnsemblePV" output/1000.
+        rates (dict):
+            TOU rates (see "Tariff_Funcs.SlotRates").
+        quantiles (tuple):
+            Quantiles of the savings to return.
+
+    Returns:
+        interval (dict):
+            'savings' (array[members]) total saving per member, 'quantiles'
+            (array[quantiles]) of the total, 'months', 'monthly'
+            (array[members,months]) and 'monthly_quantiles'
+            (array[quantiles,months]).
+    '''
+    load = np.asarray(load, dtype=float)
+    solar = np.asarray(solar, dtype=float)
+    energy = np.broadcast_to(load, solar.shape)
+    grid, extras = itv.ApplyInterventions(energy, [itv.SolarOffset(solar)])
+    saved = tf.PeriodCost(tStamp, load - grid, rates)
+    months, monthly = tf.MonthTotals(tStamp, saved)
+    savings = monthly.sum(axis=-1)
+    return {'savings': savings, 'quantiles': np.quantile(savings, quantiles),
+            'months': months, 'monthly': monthly,
+            'monthly_quantiles': np.quantile(monthly, quantiles, axis=0)}
@@ -1,5 +1,6 @@
 import math
 import datetime
+import numpy as np
 
 class ewhModel:
 
@@ -36,9 +37,11 @@ class ewhModel:
 
 
 
-    def __thermalDecay__(self, time, t_inital, t_ambient, volume, thermal_resistance):
-        #print("Decay")
-        return t_ambient + (t_inital - t_ambient)*math.exp((-1.0 * time)/(self.c*self.rho*(0.001*volume)*thermal_resistance))
+    def decayFactor(self, time):
+        # exp(-t/(c*rho*V*R)) for an array of step lengths (seconds) at once.
+        # Independent of the ambient temperature, so a simulation with fixed R
+        # and volume computes it once and passes it to every step.
+        return np.exp((-1.0 * np.asarray(time, dtype=float))/(self.c*self.rho*(0.001*self.TANK_VOLUME)*self.R))
     # -------------------------------------------------------------------------------------------
 
 
@@ -57,17 +60,21 @@ class ewhModel_one(ewhModel):
         self.t_inside = self.t_inside_rst
 
     # ------------------------ Sim methods ---------------------------------------------
-    def stepTime(self, time_sec, added_power_kw):
+    def stepTime(self, time_sec, added_power_kw, decay=None):
         #Increase due to power added
         element_energy_added = (added_power_kw*1000)*time_sec  #Convert to Watt and integrate
         self.t_inside += self.__deltaTemperature__(element_energy_added, self.TANK_VOLUME)
 
-        #Decrease due to thermal losses
-        self.t_inside = self.__thermalDecay__(time_sec, self.t_inside, self.t_amb, self.TANK_VOLUME, self.R);
+        #Decrease due to thermal losses (decay = decayFactor(time_sec), if known)
+        if(decay is None):
+            decay = self.decayFactor(time_sec)
+        self.t_inside = self.t_amb + (self.t_inside - self.t_amb)*decay
 
-    def stepTimeDecay(self, time_sec):
+    def stepTimeDecay(self, time_sec, decay=None):
         #Decrease due to thermal losses
-        self.t_inside = self.__thermalDecay__(time_sec, self.t_inside, self.t_amb, self.TANK_VOLUME, self.R);
+        if(decay is None):
+            decay = self.decayFactor(time_sec)
+        self.t_inside = self.t_amb + (self.t_inside - self.t_amb)*decay
 
     def stepVolume(self, volume_litres):
         self.t_inside = ((self.TANK_VOLUME - volume_litres)/self.TANK_VOLUME) * (self.t_inside - self.t_inlet) + self.t_inlet
@@ -84,4 +91,35 @@ class ewhModel_one(ewhModel):
 
     def setAmbTemp(self, temp_degC):
         self.t_amb = temp_degC
+
+    def setConditions(self, t_amb=None, t_inlet=None):
+        # Per-step ambient and inlet temperatures (None keeps the current value)
+        if(t_amb is not None):
+            self.t_amb = t_amb
+        if(t_inlet is not None):
+            self.t_inlet = t_inlet
     #------------------------------------------------------------------------------------
+
+
+
+class ewhModel_batch(ewhModel_one):
+    # One-node model for many tanks at once. Parameters and temperatures may be
+    # arrays (e.g. one per tank and day), all broadcast together, and every
+    # step updates all tanks with the ewhModel_one equations.
+
+    def __init__(self, thermal_resistance, tank_volume, t_initial):
+        self.R = np.asarray(thermal_resistance, dtype=float)
+        self.TANK_LENGTH = 1
+        self.TANK_VOLUME = np.asarray(tank_volume, dtype=float)
+        self.TANK_RADIUS = np.sqrt((self.TANK_VOLUME/1000)/(math.pi*self.TANK_LENGTH))
+        self.TANK_AREA = 2*math.pi*self.TANK_RADIUS*self.TANK_LENGTH + 2*math.pi*self.TANK_RADIUS*self.TANK_RADIUS
+
+        shape = np.broadcast_shapes(self.R.shape, self.TANK_VOLUME.shape, np.shape(t_initial))
+        self.t_inside_rst = np.broadcast_to(np.asarray(t_initial, dtype=float), shape).copy()
+        self.t_inside = self.t_inside_rst.copy()
+        self.GeyserOn = np.zeros(shape, dtype=bool)
+        self.model_type = 'batch'
+
+    def reset(self):
+        self.t_inside = self.t_inside_rst.copy()
+        self.GeyserOn = np.zeros(self.t_inside.shape, dtype=bool)
@@ -12,6 +12,11 @@ from dateutil import tz
 import csv
 import Cost_Funcs as cf
 import Geyser_Funcs as gf
+import Validate_Funcs as vf
+import Time_Funcs as tm
+import Intervention_Funcs as itv
+import Solar_Funcs as sf
+import Lighting_Funcs as lf
 import matplotlib.pyplot as plt
 import pandas as pd
 import pvlib
@@ -19,7 +24,7 @@ from pvlib.location import Location
 
 # PR = 4%(low rad.) + 0.41*temp.(temp loss) + 2% (dust) + 2.5% (inverter) + 6% (cables)
 
-def CalcSolPow(startDay, endDay):
+def CalcSolPow(startDay, endDay, number_panels=150, site=None, solpos='spa', tilt=40, azimuth=180):
     """
     Determine power from solar radiation per day from one date to another
 
@@ -31,6 +36,20 @@ def CalcSolPow(startDay, endDay):
     endDay : datetime object
         End date for calculation of solar irradiation
 
+    number_panels : int
+        Number of panels installed (default 150)
+
+    site : pvlib Location
+        Location of the installation (default LaunchLab, Stellenbosch)
+
+    solpos : string
+        Solar position backend: 'spa' (default), 'approx' or 'table'
+        (see "Solar_Funcs" for accuracy)
+
+    tilt, azimuth : float
+        Panel tilt and azimuth in degrees (pvlib convention, default 40 and
+        180 as before)
+
     Returns
     -------
     solarPow : numpy array, shape: (#days between start and end day,
@@ -51,35 +70,19 @@ def CalcSolPow(startDay, endDay):
     """
     #-----[Canadian Solar CS6U-330P] & ------
     PANEL_AREA = 1.960 * 0.992 # m^2
-    NUMBER_OF_PANELS = 150 # 300
+    NUMBER_OF_PANELS = number_panels # 150 (300)
     ROOF_AREA = 1995 # m^2
 
-
-    dates = []
-    maxi = []
     dayAmount = (endDay-startDay).days
-    solarPow = np.zeros((dayAmount+1,24))
-
-    for i in range(dayAmount+1):
-        stellies = Location(-33.925146, 18.865785, 'Africa/Johannesburg', 136, 'LaunchLab')
-        times = pd.date_range(start=startDay+dt.timedelta(days=i),
-                            end=startDay+dt.timedelta(days=i, hours=23, minutes=59),
-                            freq='60min')
-        ephem_data = pvlib.solarposition.spa_python(times, stellies.latitude, stellies.longitude)
-        dni_extra = pvlib.irradiance.extraradiation (times)
-        irrad_data = stellies.get_clearsky(times)
-        AM = pvlib.atmosphere.relativeairmass(ephem_data['apparent_zenith'])
-        total = pvlib.irradiance.total_irrad(40, 180,
-                ephem_data['apparent_zenith'], ephem_data['azimuth'],
-                dni=irrad_data['dni'], ghi=irrad_data['ghi'],
-                dhi=irrad_data['dhi'], airmass=AM,
-                surface_type='urban', model='isotropic',
-                dni_extra=dni_extra)
-        poa = total['poa_global'].values
-        Ans=(poa/1000)*330*NUMBER_OF_PANELS*1.3 # in Whrs
-        solarPow[i,:] = Ans
-        dates.append(times)
-        maxi.append(max(Ans))
+    if(site is None):
+        site = Location(-33.925146, 18.865785, 'Africa/Johannesburg', 136, 'LaunchLab')
+
+    # All hours of all days in one pass
+    times = pd.date_range(start=startDay, periods=(dayAmount+1)*24, freq='60min')
+    poa = sf.PlaneOfArray(sf.ClearSky(times, site, solpos), tilt, azimuth)
+    solarPow = ((poa/1000)*330*NUMBER_OF_PANELS*1.3).reshape(dayAmount+1, 24) # in Whrs
+    dates = [times[i*24:(i+1)*24] for i in range(dayAmount+1)]
+    maxi = list(solarPow.max(axis=1))
     return solarPow, dates, maxi
 
 def FiveMinSolarRunner(normal_data, sol):
@@ -99,35 +102,23 @@ def FiveMinSolarRunner(normal_data, sol):
         excess (array[days,5min_intervals]):
             Excess solar energy remaining after supplying loads.
     """
-    sol_test = []
-    excess = []
-
-    sol_test_c = []
-    excess_c = []
-    normal_data = normal_data*12
-    for i in range(normal_data.shape[0]):
-        for j in range(normal_data.shape[1]):
-            if(sol[i,j] > normal_data[i,j]):
-                excess_c.append(sol[i,j]-normal_data[i,j])
-                sol_test_c.append(0)
-            else:
-                sol_test_c.append(normal_data[i,j] - sol[i,j])
-                excess_c.append(0)
-
-        excess.append(excess_c)
-        sol_test.append(sol_test_c)
-        excess_c = []
-        sol_test_c = []
+    sol_test = np.array(normal_data, dtype=float)*12
+    excess = itv.SolarOffset(sol).apply(sol_test)
 
-    excess = np.array(excess)/12
-    sol_test = np.array(sol_test)/12
+    excess = excess/12
+    sol_test = sol_test/12
 
     return sol_test, excess
 
-def get_5min_LL_data():
+def get_5min_LL_data(Filename="LL loads.csv"):
     '''
     Get Launch Lab energy consumption data in 5min intervals.
 
+    Parameters
+    ----------
+    Filename : string
+        Load profile file of the form 'Filename.csv' (default "LL loads.csv").
+
     Returns
     -------
     tstamp : list
@@ -139,7 +130,7 @@ def get_5min_LL_data():
     '''
 
 
-    with open("LL loads.csv", newline='') as csvfile:
+    with open(Filename, newline='') as csvfile:
             reader = csv.DictReader(csvfile)
             tstamp = [] # list for timestamps
             tcollect = []
@@ -179,10 +170,15 @@ def get_5min_LL_data():
 
     return tstamp, power, peaks
 
-def get_LL_data():
+def get_LL_data(Filename="LL loads.csv"):
     '''
     Get Launch Lab energy consumption data in hour intervals.
 
+    Parameters
+    ----------
+    Filename : string
+        Load profile file of the form 'Filename.csv' (default "LL loads.csv").
+
     Returns
     -------
     tstamp : list
@@ -193,7 +189,7 @@ def get_LL_data():
         Peak value in period.
     '''
 
-    with open("LL loads.csv", newline='') as csvfile:
+    with open(Filename, newline='') as csvfile:
             reader = csv.DictReader(csvfile)
             tstamp = [] # list for timestamps
             tcollect = []
@@ -261,30 +257,30 @@ def LL_with_PV(time_LL, power_LL, peaks_LL):
     #Get without PV data
     f_nopv, p, t = LL_without_PV(time_LL, power_LL, peaks_LL)
 
-    # Calculate solar supply (starting from first full day in LL data)
-    start = time_LL[1][0]
+    # Calculate solar supply over the same days as the LL data
+    start = time_LL[0][0]
     end = time_LL[-1][-1]
     solarPow, time_Solar, maxi = CalcSolPow(start, end)
     solarPow = fix_solar(solarPow)
 
-    # Turn in to array (starting from first complete day)
+    # Turn in to array and line up load and solar on their timestamps
     power_LL = np.array(power_LL) # turn in to array
+    joined, (power_LL, solarPow) = tm.AlignSeries(
+        [(tm.TimeIndex.fromTimes(time_LL), power_LL),
+         (tm.TimeIndex.fromTimes(time_Solar), solarPow)], slots=24)
+    time_Solar = joined.times().reshape(-1, 24).tolist()
 
     #Calculate power values when solar supply is subtracted
     solarPow = solarPow/1000 # divide by 1000 to get in kWh
-    newPower = np.zeros_like(solarPow)
+    newPower, extras = itv.ApplyInterventions(power_LL, [itv.SolarOffset(solarPow)])
 
     f_total = cf.finModel()
     f_pv = cf.finModel()
 
     for i in range(len(newPower)): #loop through days
         for j in range(len(newPower[0])): # loop through hours
-            day = time_Solar[i][j].to_pydatetime()
+            day = time_Solar[i][j]
             sol_month_total += solarPow[i,j]
-            if(solarPow[i,j] > power_LL[i,j]):
-                newPower[i,j] = 0
-            else:
-                newPower[i,j] = power_LL[i,j] - solarPow[i,j]
             f_total.RateCollectionPV(day, newPower[i,j])
             f_pv.RateCollectionPV(day, solarPow[i,j])
 
@@ -297,7 +293,7 @@ def LL_with_PV(time_LL, power_LL, peaks_LL):
 
     return f_total, newPower, sol_totals           # f_total, f_pv, f_nopv, newPower, time_LL
 
-def Change_To_LEDs(time, energy):
+def Change_To_LEDs(time, energy, schedules=None):
     """
     Calculates the change in energy in using LED lights instead of normal lights
 
@@ -306,6 +302,12 @@ def Change_To_LEDs(time, energy):
             Timestamps for energy data in days, hours.
         energy (array[days,hours]):
             Original energy values in days, hours.
+        schedules (dict):
+            Occupancy schedule per zone (see "Lighting_Funcs"), e.g.
+            lf.OFFICE_SCHEDULES. None keeps the original model: all lights
+            on all the time and the fixed saving subtracted from every hour,
+            even where this leaves a negative load. With schedules the load
+            is set to zero where the saving is more than the load.
 
     Returns:
         time (array[days,hours]):
@@ -313,27 +315,20 @@ def Change_To_LEDs(time, energy):
         new_energy (array[days,hours]):
             Energy after lights are changed in days, hours.
     """
-    STD_DOUBLE_PWR = 43 # W
-    STD_SINGLE_PWR = 60 # W
     LED_DOUBLE_PWR = 14 # W
     LED_SINGLE_PWR = 14 # W
-    NUMBER_OF_DOUBLES = 60
-    NUMBER_OF_SINGLES = 68
-
-    stdPower = (NUMBER_OF_DOUBLES*STD_DOUBLE_PWR + NUMBER_OF_SINGLES*STD_SINGLE_PWR)/1000 # divide by 1000 to get in kWhrs
-    LEDLightPower = (NUMBER_OF_DOUBLES*LED_DOUBLE_PWR + NUMBER_OF_SINGLES*LED_SINGLE_PWR)/1000 # divide by 1000 to get in kWhrs
-
-    new_energy = np.zeros_like(energy)
 
-    # Add LED lights
-    for i in range(new_energy.shape[0]): # loop through days
-        for j in range(new_energy.shape[1]): # loop through hours
-            # Add approx power used by LED lights
-            new_energy[i,j] = energy[i,j] - stdPower + LEDLightPower
+    options = [{'name': 'LED', 'watts': {'double': LED_DOUBLE_PWR, 'single': LED_SINGLE_PWR}}]
+    if(schedules is None):
+        names, new_energy, saving = lf.ApplyRetrofits(time, energy, options, lf.LAUNCHLAB_INVENTORY,
+                                                      lf.ALWAYS_ON, clip=False)
+    else:
+        names, new_energy, saving = lf.ApplyRetrofits(time, energy, options,
+                                                      lf.LAUNCHLAB_INVENTORY, schedules)
 
-    return time, new_energy
+    return time, new_energy[0]
 
-def getFinModel(tStamp, energy):
+def getFinModel(tStamp, energy, fModel=None):
     """
     Get financial model from energy in form array[days, hours].
 
@@ -342,6 +337,9 @@ def getFinModel(tStamp, energy):
             Timestamps for energy data in days, hours.
         energy (array[days,hours]):
             Energy values used to calculate cost in days, hours.
+        fModel (class instance):
+            Financial model to continue adding to (e.g. from a previous
+            month of data). A new model is created if None.
 
     Returns:
         fModel (class instance):
@@ -350,7 +348,8 @@ def getFinModel(tStamp, energy):
 
     """
 
-    fModel = cf.finModel()
+    if(fModel is None):
+        fModel = cf.finModel()
 
     for i in range(energy.shape[0]): # loop through days
         for j in range(energy.shape[1]): # loop through hours
@@ -378,42 +377,43 @@ def latestDate(date1, date2):
     else:
         return date2[-1]
 
-def GetCSVData(Filename):
-    with open(Filename, newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        tstamp = [] # list for timestamps
-        tcollect = []
-        energy = []
-        peaks = []
-        ecollect = []
-        peak=0
-
-        for row in reader:
-            try:
-                if(float(row['kVA']) > peak):
-                    peak = float(row['kVA'])
+def GetCSVData(Filename, fill='interpolate', step_minutes=None):
+    """
+    Get energy (kWh) and demand (kVA) data per day from a metering CSV file.
 
-                # Every Day, store list of times (in hour)
-                day = dt.datetime.strptime(row['Date/Time'], '%d/%m/%Y %H:%M')
-                if(day.time() == dt.time(hour=00,minute=00)):
-                    tcollect.append(day)
-                    ecollect.append(float(row['kWh']))
-                    tstamp.append(tcollect)
-                    energy.append(ecollect)
-                    peaks.append(peak)
-                    tcollect = []
-                    ecollect = []
-                    peak=0
+    Rows are parsed and validated in bulk by "Validate_Funcs.LoadCSVGrid" and
+    placed on a regular time grid, so bad or missing rows no longer shift the
+    days. Each day ends with its midnight reading.
 
-                # End of every Hour, add entry to list and reset accumulator for power
-                else:
-                    tcollect.append(day)      #
-                    ecollect.append(float(row['kWh'])) # fill lists and get in kWhrs
+    Args:
+        Filename (string):
+            Input form 'Filename.csv' with 'Date/Time', 'kWh' and 'kVA' columns.
+        fill (string):
+            Gap filling strategy ('zero', 'interpolate', 'previous_day' or
+            None to leave gaps as NaN).
+        step_minutes (int):
+            Interval of the data in minutes. None infers it from the data.
+
+    Returns:
+        tstamp (list):
+            Timestamps per day.
+        energy (list):
+            Energy consumption per day.
+        peaks (list):
+            Peak kVA per day.
+    """
+    times, values, report = vf.LoadCSVGrid(Filename, 'Date/Time', ['kWh', 'kVA'],
+                                           step_minutes, fill=fill)
+    bounds = np.flatnonzero(times == times.astype('datetime64[D]')) + 1
+    if(bounds.size == 0):
+        return [], [], []
 
-            except:
-                pass
+    tstamp = [d.tolist() for d in np.split(times, bounds)[:-1]]
+    energy = [d.tolist() for d in np.split(values[:,0], bounds)[:-1]]
+    starts = np.concatenate(([0], bounds[:-1]))
+    peaks = np.maximum(np.fmax.reduceat(values[:bounds[-1],1], starts), 0).tolist()
 
-        return tstamp, energy, peaks
+    return tstamp, energy, peaks
 
 def datetime_from_utc_to_local(utc_datetime):
     now_timestamp = time.time()
@@ -421,23 +421,13 @@ def datetime_from_utc_to_local(utc_datetime):
     return utc_datetime + offset
 
 def fix_solar(solar_power):
-    soz = np.array(solar_power)
-    shifted = np.zeros_like(soz)
-    for i in range(soz.shape[0]):
-        for j in range(soz.shape[1]):
-            if(j<(soz.shape[1]-2)):
-                shifted[i,j+2] = soz[i,j]
+    shifted = np.array(solar_power)
+    itv.TimeShift(2).apply(shifted)
     return shifted
 
 def SolPow_hr_to_5min(solar_power):
-    sol_mins = np.zeros((solar_power.shape[0], 24*12))
-
-    for i in range(solar_power.shape[0]): # days
-        for j in range(solar_power.shape[1]): # hours
-            curr_val = solar_power[i,j] # kWh value
-            for k in range(12): # mins
-                min_i = j*12+k
-                sol_mins[i,min_i] =  curr_val # Fill with averaged values per 5 min
+    # Fill with averaged values per 5 min
+    sol_mins = itv.Resample(np.asarray(solar_power, dtype=float), 24*12, how='repeat')
     return sol_mins
 
 def To_Days_Hrs(tStamp, data):
@@ -639,7 +629,7 @@ def Month_Avg(tStamp, data):
 
     return time, data_new
 
-def PVPow(startDay, endDay):
+def PVPow(startDay, endDay, solpos='spa'):
     """
     Determine power from solar radiation per day from one date to another
 
@@ -651,6 +641,10 @@ def PVPow(startDay, endDay):
     endDay : datetime object
         End date for calculation of solar irradiation
 
+    solpos : string
+        Solar position backend: 'spa' (default), 'approx' or 'table'
+        (see "Solar_Funcs" for accuracy)
+
     Returns
     -------
     solarPow : numpy array, shape: (#days between start and end day,
@@ -672,29 +666,15 @@ def PVPow(startDay, endDay):
     PERFORMANCE_RATIO = 0.75 # default value for losses (PR calc below)
     MAX_OUTPUT_POWER = 330 # max rated power at 1000W/m^2
 
-    dates = []
-    maxi = []
     dayAmount = (endDay-startDay).days
-    solarPow = np.zeros((dayAmount+1,24))
-
-    for i in range(dayAmount+1):
-        stellies = Location(-33.925146, 18.865785, 'UTC', 136, 'LaunchLab')
-        times = pd.date_range(start=startDay+dt.timedelta(days=i),
-                            end=startDay+dt.timedelta(days=i, hours=23, minutes=59),
-                            freq='60min')
-        ephem_data = pvlib.solarposition.spa_python(times, stellies.latitude, stellies.longitude)
-        irrad_data = stellies.get_clearsky(times)
-        AM = pvlib.atmosphere.relativeairmass(ephem_data['apparent_zenith'])
-        total = pvlib.irradiance.total_irrad(40, 180,
-                ephem_data['apparent_zenith'], ephem_data['azimuth'],
-                dni=irrad_data['dni'], ghi=irrad_data['ghi'],
-                dhi=irrad_data['dhi'], airmass=AM,
-                surface_type='urban')
-        poa = total['poa_global'].values
-        Ans=(poa/1000)*330*number_panels
-        solarPow[i,:] = Ans
-        maxi.append(max(Ans/number_panels))
-        dates.append(times)
+    stellies = Location(-33.925146, 18.865785, 'UTC', 136, 'LaunchLab')
+
+    # All hours of all days in one pass
+    times = pd.date_range(start=startDay, periods=(dayAmount+1)*24, freq='60min')
+    poa = sf.PlaneOfArray(sf.ClearSky(times, stellies, solpos), 40, 180)
+    solarPow = ((poa/1000)*330*number_panels).reshape(dayAmount+1, 24)
+    maxi = list(solarPow.max(axis=1)/number_panels)
+    dates = [times[i*24:(i+1)*24] for i in range(dayAmount+1)]
     return solarPow, dates, maxi
 
 def Run_With_PV(time_LL, power_LL, peaks_LL):
@@ -704,29 +684,29 @@ def Run_With_PV(time_LL, power_LL, peaks_LL):
     #Get without PV data
     f_nopv, p, t = LL_without_PV(time_LL, power_LL, peaks_LL)
 
-    # Calculate solar supply (starting from first full day in LL data)
-    start = time_LL[1][0]
+    # Calculate solar supply over the same days as the LL data
+    start = time_LL[0][0]
     end = time_LL[-1][-1]
     solarPow, time_Solar, maxi = PVPow(start, end)
 
-    # Turn in to array (starting from first complete day)
+    # Turn in to array and line up load and solar on their timestamps
     power_LL = np.array(power_LL) # turn in to array
+    joined, (power_LL, solarPow) = tm.AlignSeries(
+        [(tm.TimeIndex.fromTimes(time_LL), power_LL),
+         (tm.TimeIndex.fromTimes(time_Solar), solarPow)], slots=24)
+    time_Solar = joined.times().reshape(-1, 24).tolist()
 
     #Calculate power values when solar supply is subtracted
     solarPow = solarPow/1000 # divide by 1000 to get in kWh
-    newPower = np.zeros_like(solarPow)
+    newPower, extras = itv.ApplyInterventions(power_LL, [itv.SolarOffset(solarPow)])
 
     f_total = cf.finModel()
     f_pv = cf.finModel()
 
     for i in range(len(newPower)): #loop through days
         for j in range(len(newPower[0])): # loop through hours
-            day = time_Solar[i][j].to_pydatetime()
+            day = time_Solar[i][j]
             sol_month_total += solarPow[i,j]
-            if(solarPow[i,j] > power_LL[i,j]):
-                newPower[i,j] = 0
-            else:
-                newPower[i,j] = power_LL[i,j] - solarPow[i,j]
             f_total.RateCollectionPV(day, newPower[i,j])
             f_pv.RateCollectionPV(day, solarPow[i,j])
 
@@ -0,0 +1,59 @@
+"""
+Checks of the battery dispatch in ``Battery_Funcs``: energy balance of the
+grid, solar and battery flows and the state of charge limits.
+"""
+
+import numpy as np
+import Battery_Funcs as bf
+
+def _Week():
+    tStamp = (np.datetime64('2019-01-07') + np.arange(7*24)*np.timedelta64(1, 'h')).reshape(7, 24)
+    hour = np.arange(24)
+    rng = np.random.default_rng(0)
+    load = 20 + 15*((hour >= 7) & (hour < 19)) + rng.random((2, 7, 24))*5
+    solar = np.clip(60*np.sin((hour - 6)/12*np.pi), 0, None)*np.ones((7, 1))
+    return tStamp, load, solar
+
+def _Run(**battery):
+    tStamp, load, solar = _Week()
+    capacity = np.array([[0.0], [50.0], [200.0]]) # sizes against 2 buildings
+    results = bf.Dispatch(load, solar, tStamp, capacity, 25, 25, efficiency=0.9,
+                          soc_min=0.1, soc_start=0.5, traces=True, **battery)
+    return tStamp, load, solar, capacity, results
+
+def test_energy_balance():
+    tStamp, load, solar, capacity, results = _Run(grid_charge_periods=(0,))
+    eta = np.sqrt(0.9)
+    deficit = np.maximum(load - solar, 0).sum(axis=(-2, -1))
+    excess = np.maximum(solar - load, 0).sum(axis=(-2, -1))
+    grid = results['grid'].sum(axis=(-2, -1))
+    assert results['grid'].shape == (3, 2, 7, 24)
+    assert np.allclose(grid, deficit - results['discharged'] + results['grid_charged'])
+    assert np.allclose(results['grid_by_period'].sum(axis=-1), grid)
+    # Stored energy: solar charged and grid charged in, battery supply out
+    charged = excess - results['spilled']
+    stored = (charged + results['grid_charged'])*eta - results['discharged']/eta
+    soc = results['soc']
+    assert np.allclose(soc[..., -1, -1] - 0.5*capacity, stored)
+    # No battery: grid is the deficit and all excess solar is spilled
+    assert np.allclose(results['discharged'][0], 0)
+    assert np.allclose(results['spilled'][0], excess)
+
+def test_state_of_charge_limits():
+    tStamp, load, solar, capacity, results = _Run(grid_charge_periods=(0,), grid_charge_target=0.9)
+    soc = results['soc']
+    cap = capacity[..., None, None]
+    assert (soc >= 0.1*cap - 1e-9).all()
+    assert (soc <= cap + 1e-9).all()
+    assert (results['grid'] >= -1e-9).all()
+    # Charge and discharge rates stay within 25 kW (1 hour slots)
+    change = np.diff(soc.reshape(3, 2, -1), axis=-1)
+    assert (np.abs(change) <= 2*25 + 1e-9).all()
+
+def test_cost_only_with_rates():
+    tStamp, load, solar, capacity, results = _Run()
+    assert 'cost' not in results
+    rates = {'high': [0.6, 1.1, 3.5], 'low': [0.55, 0.85, 1.2]}
+    priced = bf.Dispatch(load, solar, tStamp, capacity, 25, 25, rates=rates)
+    assert priced['cost'].shape == (3, 2)
+    assert (priced['cost'][2] <= priced['cost'][0] + 1e-9).all()
@@ -0,0 +1,35 @@
+"""
+Checks of the batched geyser calibration in ``Calibrate_Funcs``: known
+thermal resistance, volume and ambient temperature are recovered from
+synthetic outlet temperatures.
+"""
+
+import numpy as np
+import Calibrate_Funcs as cal
+
+def _Synthetic(tanks=8, days=3, steps=1440, noise=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    true = np.stack([rng.uniform(0.4, 1.2, tanks), rng.uniform(100, 200, tanks),
+                     rng.uniform(15, 30, tanks)], axis=1)
+    volume = np.where(rng.random((tanks, days, steps)) < 0.01, rng.uniform(1, 10, (tanks, days, steps)), 0)
+    power = np.where(rng.random((tanks, days, steps)) < 0.1, 3.0, 0)
+    t_start = rng.uniform(50, 65, (tanks, days))
+    temp = cal.SimulateTemps(true, volume, t_start, power)
+    temp[..., 1:] += rng.normal(0, noise, temp[..., 1:].shape)
+    return true, volume, power, temp
+
+def test_recovers_known_parameters():
+    true, volume, power, temp = _Synthetic()
+    results = cal.Calibrate(volume, temp, power)
+    assert results['converged'].all()
+    assert np.allclose(results['params'], true, rtol=1e-3)
+    assert (results['rmse'] < 1e-3).all()
+
+def test_noise_and_missing_values():
+    true, volume, power, temp = _Synthetic(noise=0.05)
+    temp[0, 0, 100:200] = np.nan
+    temp[1, 1, 0] = np.nan # day left out
+    results = cal.Calibrate(volume, temp, power)
+    assert np.all(np.abs(results['params']/true - 1) < 0.05)
+    assert np.all(results['rmse'] < 0.1)
+    assert np.allclose(results['R'], results['params'][:, 0])
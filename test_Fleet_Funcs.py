@@ -0,0 +1,37 @@
+"""
+Checks of the geyser fleet simulator in ``Fleet_Funcs``: a single tank
+matches "Geyser_Funcs.Simulator", and curtailment sheds load during the
+event.
+"""
+
+import numpy as np
+import pytest
+import Fleet_Funcs as ff
+
+def _Volumes(days=2, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.where(rng.random((days, 1440)) < 0.02, rng.uniform(1, 15, (days, 1440)), 0)
+
+def test_single_tank_matches_simulator():
+    gf = pytest.importorskip('Geyser_Funcs')
+    vol = _Volumes(1)
+    fleet = ff.MakeFleet(1, volumes=(150,), volume_p=(1,), set_temps=(70,), set_p=(1,),
+                         R_spread=0, use_spread=0)
+    fleet['use'][:] = 1.0
+    result = ff.FleetDR(fleet, ff.DrawLibrary(vol, 1), '2019-03-13', 1, step_min=1, baseline=False)
+    energy, temp = gf.Simulator(vol, gf.SetupGeyser(startTemp=70))
+    assert np.isclose(result['energy'][0], energy.sum())
+    assert np.allclose(result['load'][0]/60, energy.ravel())
+
+def test_curtail_sheds_load():
+    fleet = ff.MakeFleet(200)
+    events = [{'start': '2019-06-01T17:00', 'end': '2019-06-01T19:00', 'type': 'curtail'}]
+    result = ff.FleetDR(fleet, ff.SyntheticDraws(20), '2019-06-01', 1, events)
+    load = result['load']
+    during = slice(17*12, 19*12)
+    assert (load[1, during] == 0).all()
+    assert load[0, during].sum() > 0
+    event = result['events'][0]
+    assert event['tanks'] == 200
+    assert np.isclose(event['shed_kwh'], load[0, during].sum()*5/60)
+    assert event['rebound_peak_kw'] >= event['baseline_peak_kw']
@@ -0,0 +1,50 @@
+"""
+Checks of the lighting retrofit model in ``Lighting_Funcs``.
+"""
+
+import numpy as np
+import pytest
+import Lighting_Funcs as lf
+
+LED = [{'name': 'LED', 'watts': {'double': 14, 'single': 14}}]
+# Fixed saving of the original "Change_To_LEDs" (kWh per hour)
+OLD_SAVING = (60*43 + 68*60 - (60*14 + 68*14))/1000
+
+def _Hours(days=3):
+    return (np.datetime64('2019-07-01') + np.arange(days*24)*np.timedelta64(1, 'h')).reshape(days, 24)
+
+def test_always_on_unclipped_is_fixed_saving():
+    tStamp = _Hours()
+    energy = np.linspace(0, 20, tStamp.size).reshape(tStamp.shape)
+    names, newEnergy, saving = lf.ApplyRetrofits(tStamp, energy, LED, lf.LAUNCHLAB_INVENTORY,
+                                                 lf.ALWAYS_ON, clip=False)
+    assert names == ['LED']
+    assert np.allclose(newEnergy[0], energy - OLD_SAVING)
+    assert (newEnergy[0] < 0).any()
+
+def test_clip_sets_load_to_zero():
+    tStamp = _Hours()
+    energy = np.linspace(0, 20, tStamp.size).reshape(tStamp.shape)
+    names, newEnergy, saving = lf.ApplyRetrofits(tStamp, energy, LED, lf.LAUNCHLAB_INVENTORY,
+                                                 lf.ALWAYS_ON)
+    assert np.allclose(newEnergy[0], np.maximum(energy - OLD_SAVING, 0))
+    assert np.allclose(newEnergy + saving, energy)
+
+def test_schedule_saves_nothing_when_lights_off():
+    tStamp = _Hours(7)
+    energy = np.full(tStamp.shape, 10.0)
+    names, newEnergy, saving = lf.ApplyRetrofits(tStamp, energy, LED, lf.LAUNCHLAB_INVENTORY,
+                                                 {'main': np.array([[0.0]*7 + [1.0]*11 + [0.0]*6, [0.0]*24])})
+    dayType, hour = lf.DayTypes(tStamp)
+    on = (dayType == lf.WEEKDAY) & (hour >= 7) & (hour < 18)
+    assert np.allclose(saving[0][on], OLD_SAVING)
+    assert (saving[0][~on] == 0).all()
+
+def test_change_to_leds_keeps_old_default():
+    models = pytest.importorskip('myModels')
+    tStamp = _Hours()
+    energy = np.linspace(0, 20, tStamp.size).reshape(tStamp.shape)
+    t, newEnergy = models.Change_To_LEDs(tStamp, energy)
+    assert np.allclose(newEnergy, energy - OLD_SAVING)
+    t, newEnergy = models.Change_To_LEDs(tStamp, energy, lf.ALWAYS_ON)
+    assert (newEnergy >= 0).all()
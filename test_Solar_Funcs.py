@@ -0,0 +1,41 @@
+"""
+Checks of the cheap solar position backends of ``Solar_Funcs`` against SPA,
+over a year of hourly LaunchLab times, at the bounds given in the module
+notes.
+"""
+
+import pandas as pd
+import pytest
+from pvlib.location import Location
+import Solar_Funcs as sf
+
+LATITUDE = -33.925146
+LONGITUDE = 18.865785
+
+# Largest apparent zenith and azimuth differences from SPA (degrees)
+BOUNDS = {'approx': (0.02, 0.06), 'table': (0.35, 0.5)}
+
+def _Year(year):
+    return pd.date_range('%d-01-01'%year, '%d-12-31 23:00'%year, freq='h',
+                         tz='Africa/Johannesburg')
+
+@pytest.mark.parametrize('year', [2019, 2024])
+@pytest.mark.parametrize('method', ['approx', 'table'])
+def test_position_against_spa(method, year):
+    check = sf.CompareSolarPosition(_Year(year), LATITUDE, LONGITUDE, method)
+    zenith, azimuth = BOUNDS[method]
+    assert check['zenith'] <= zenith
+    assert check['azimuth'] <= azimuth
+
+def test_approx_is_faster_than_spa():
+    check = sf.CompareSolarPosition(_Year(2019), LATITUDE, LONGITUDE, 'approx')
+    assert check['seconds'] < check['spa_seconds']
+
+def test_clear_sky_plane_of_array():
+    site = Location(LATITUDE, LONGITUDE, 'Africa/Johannesburg', 136, 'LaunchLab')
+    times = _Year(2019)
+    poa = {method: sf.PlaneOfArray(sf.ClearSky(times, site, method), 40, 180)
+           for method in sf.SOLPOS_METHODS}
+    assert poa['spa'].max() > 0
+    for method in ('approx', 'table'):
+        assert abs(poa[method].sum()/poa['spa'].sum() - 1) < 0.001
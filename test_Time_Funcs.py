@@ -0,0 +1,30 @@
+"""
+Checks of the timestamp conversion in ``Time_Funcs``.
+"""
+
+import datetime as dt
+import warnings
+import numpy as np
+import pandas as pd
+from dateutil import tz
+import Time_Funcs as tm
+
+SAST = tz.gettz('Africa/Johannesburg')
+
+def test_aware_keeps_wall_time():
+    aware = [dt.datetime(2020, 1, 1, 12, tzinfo=SAST), pd.Timestamp('2020-01-01 13:00', tz=SAST)]
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        times = tm.To_Datetime64(np.array(aware, dtype=object))
+    assert times.tolist() == [dt.datetime(2020, 1, 1, 12), dt.datetime(2020, 1, 1, 13)]
+
+def test_mixed_aware_and_naive():
+    mixed = np.array([[dt.datetime(2020, 1, 1, 0), dt.datetime(2020, 1, 1, 1, tzinfo=SAST)]], dtype=object)
+    assert tm.To_Datetime64(mixed).tolist() == [dt.datetime(2020, 1, 1, 0), dt.datetime(2020, 1, 1, 1)]
+
+def test_naive_bulk_and_datetime64():
+    naive = np.array([[dt.datetime(2020, 6, 1, h) for h in range(24)]])
+    times = tm.To_Datetime64(naive)
+    assert times.dtype == np.dtype('datetime64[s]')
+    assert (times == np.datetime64('2020-06-01') + np.arange(24)*np.timedelta64(1, 'h')).all()
+    assert (tm.To_Datetime64(times.reshape(1, 24)) == times).all()
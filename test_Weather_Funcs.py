@@ -0,0 +1,45 @@
+"""
+Checks of the weather-driven PV in ``Weather_Funcs``: a cloudless ensemble
+member and clear-sky weather data give the clear-sky plane of array
+generation.
+"""
+
+import datetime as dt
+import numpy as np
+import pandas as pd
+import Solar_Funcs as sf
+import Weather_Funcs as wf
+
+CLOUDLESS = {'mean': np.ones(12), 'std': np.zeros(12), 'lag1': 0.0, 'hourly_std': 0.0}
+START, END = dt.datetime(2019, 1, 1), dt.datetime(2019, 1, 14)
+
+def _ClearSkyPV(panels=10, tilt=40, azimuth=180):
+    times = pd.date_range(start=START, periods=14*24, freq='60min')
+    sky = sf.ClearSky(times, wf._Site(None), 'spa')
+    poa = sf.PlaneOfArray(sky, tilt, azimuth)
+    return (np.nan_to_num(poa)/1000*330*panels*1.3).reshape(14, 24), sky
+
+def test_cloudless_member_is_clear_sky():
+    clear, sky = _ClearSkyPV()
+    solarPow, tStamp = wf.EnsemblePV(START, END, members=3, number_panels=10, cloud=CLOUDLESS)
+    assert solarPow.shape == (3, 14, 24)
+    assert tStamp[0, 0] == np.datetime64('2019-01-01T00:00')
+    assert clear.max() > 0
+    assert np.allclose(solarPow, clear[None], rtol=1e-9, atol=1e-6)
+
+def test_cloudy_members_below_clear_sky():
+    clear, sky = _ClearSkyPV()
+    solarPow, tStamp = wf.EnsemblePV(START, END, members=50, number_panels=10)
+    daily = solarPow.sum(axis=-1)
+    assert (daily <= 1.2*clear.sum(axis=-1) + 1e-6).all()
+    assert daily.mean() < clear.sum(axis=-1).mean()
+
+def test_clear_sky_weather_file():
+    clear, sky = _ClearSkyPV()
+    irrad = sky['irrad']
+    weather = {'times': sky['times'].values.astype('datetime64[s]')}
+    for c in ('ghi', 'dni', 'dhi'):
+        weather[c] = np.nan_to_num(np.asarray(irrad[c], dtype=float))
+    solarPow, tStamp, temp = wf.WeatherPV(START, END, weather, number_panels=10)
+    assert np.allclose(solarPow, clear, rtol=1e-9, atol=1e-6)
+    assert np.isnan(temp).all()